@@ -0,0 +1,173 @@
+"""
+ASGI entry point: the API served from an event loop
+
+/api/execute-with-intent, /api/execute and the payment routes are async
+handlers here, so a request waiting on the LLM or Stripe holds no worker
+thread: LLM calls await the router (httpx), while Stripe and the blocking
+steps around the calls (SQLite caches, policy evaluation, the trace store)
+run in the default thread pool. The question/plan logic itself is the
+same generator flows server.py runs synchronously. Every other route is the
+Flask app from server.py mounted through WsgiToAsgi, so behaviour and
+responses are shared with the sync server, which remains the default
+(python server.py).
+
+Run a single process: the trace store, questionnaire sessions, single-flight
+maps and checkout cache in server.py are per process, and the trace store
+refuses a second process on the same directory. Concurrency comes from the
+event loop and its thread pool.
+    python asgi.py
+    uvicorn asgi:app --app-dir api --port 5001
+"""
+import asyncio
+import os
+
+from asgiref.wsgi import WsgiToAsgi
+from starlette.applications import Starlette
+from starlette.concurrency import iterate_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, RedirectResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import server
+from payment_pages import payment_cancel_page, payment_success_page
+from server import (
+    CHECKOUT_CACHE, LLM, logger,
+    advance, checkout_url, known_execution, ndjson_stream, payable_trace, payment_trace_for_request,
+    plan_flow, question_flow, questions_response, stream_intent_execution
+)
+
+
+async def run_flow_async(flow):
+    """
+    Drive a server.py question/plan flow: LLM calls are awaited on the loop,
+    every step in between (caches, policy, trace store) runs in a worker thread
+    """
+    done, step = await asyncio.to_thread(advance, flow)
+    while not done:
+        timeout_policy, messages, options = step
+        try:
+            with timeout_policy.measure() as timeout:
+                text = await LLM.acomplete(messages, timeout=timeout, **options)
+        except Exception as e:
+            done, step = await asyncio.to_thread(advance, flow, None, e)
+        else:
+            done, step = await asyncio.to_thread(advance, flow, text)
+    return step
+
+
+async def execute_with_intent(request):
+    """
+    Execute request using intent engine - generates questions first
+    """
+    try:
+        data = await request.json()
+        user_input = data.get('text', '')
+        user_responses = data.get('responses', None)
+
+        logger.info(f"Intent-based execution request (async): {user_input}")
+
+        if not user_responses:
+            questions = await run_flow_async(question_flow(user_input))
+            return JSONResponse(questions_response(questions))
+
+        logger.info("User responses received, generating travel plan...")
+
+        # The streaming generator is synchronous; drive it from the thread pool
+        if data.get('stream'):
+            events = stream_intent_execution(user_input, user_responses)
+            return StreamingResponse(iterate_in_threadpool(ndjson_stream(events)), media_type='application/x-ndjson')
+
+        trace = await run_flow_async(plan_flow(user_input, user_responses))
+
+        logger.info(f"Intent-based execution completed")
+        return JSONResponse(trace)
+
+    except Exception as e:
+        logger.error(f"Error in intent execution: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def execute_request(request):
+    """
+    Main API endpoint for processing execution requests from frontend
+    """
+    try:
+        data = await request.json()
+        user_input = data.get('text', '')
+
+        logger.info(f"Received execution request (async): {user_input}")
+
+        # Records the trace in the trace store (disk): off the event loop
+        trace = await asyncio.to_thread(payment_trace_for_request, user_input)
+
+        logger.info(f"Execution result: {trace['stages'][-1]['payload']['status']}")
+
+        return JSONResponse(trace)
+
+    except Exception as e:
+        logger.error(f"Error processing request: {str(e)}")
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+
+async def payment_gateway(request):
+    """
+    Create Stripe Checkout Session and redirect to Stripe
+    """
+    execution_id = request.path_params['execution_id']
+    try:
+        # Reading the stored trace is a disk read; keep it off the event loop
+        trace, error, status = await asyncio.to_thread(payable_trace, execution_id)
+        if trace is None:
+            return JSONResponse({'error': 'Payment gateway error', 'details': error}, status_code=status)
+
+        # Repeat visits are answered from the cache's in-memory copy; creating a
+        # session (Stripe SDK + SQLite write) runs in a worker thread
+        cached = CHECKOUT_CACHE.get(execution_id)
+        url = cached[1] if cached else await asyncio.to_thread(checkout_url, execution_id, trace)
+
+        return RedirectResponse(url, status_code=303)
+
+    except Exception as e:
+        logger.error(f"Stripe checkout error: {str(e)}")
+        return JSONResponse({'error': 'Payment gateway error', 'details': str(e)}, status_code=500)
+
+
+def payload_response(request, payload):
+    status, headers, body = payload.response(request.headers.get('accept-encoding'), request.headers.get('if-none-match'))
+    return Response(body, status_code=status, headers=headers)
+
+
+async def payment_success(request):
+    execution_id = request.query_params.get('execution_id')
+    page = payment_success_page(request.query_params.get('session_id'), execution_id, known_execution(execution_id))
+    return payload_response(request, page)
+
+
+async def payment_cancel(request):
+    execution_id = request.query_params.get('execution_id')
+    return payload_response(request, payment_cancel_page(execution_id, known_execution(execution_id)))
+
+
+async def close_llm_clients():
+    for provider in LLM.providers:
+        await provider.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/execute-with-intent', execute_with_intent, methods=['POST']),
+        Route('/api/execute', execute_request, methods=['POST']),
+        # Literal payment paths must come before the /payment/{execution_id} pattern
+        Route('/payment/success', payment_success, methods=['GET']),
+        Route('/payment/cancel', payment_cancel, methods=['GET']),
+        Route('/payment/{execution_id}', payment_gateway, methods=['GET']),
+        Mount('/', app=WsgiToAsgi(server.app)),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    on_shutdown=[close_llm_clients],
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.getenv('PORT', 5001)))
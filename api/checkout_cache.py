@@ -0,0 +1,122 @@
+"""
+Idempotent Stripe Checkout Sessions per execution
+
+GET /payment/<execution_id> used to create a new Checkout Session on every
+hit, so a refresh, the back button or a double-click left duplicate sessions
+behind and paid a blocking Stripe round trip each time. Now the first call
+creates the session and later calls redirect to the stored URL until shortly
+before the session expires.
+
+Creation is idempotent on three levels:
+  - sessions are kept in a local SQLite file (with an in-memory copy), so
+    repeat visits never reach Stripe;
+  - concurrent first visits share one create call (single flight);
+  - the create call carries an idempotency key derived from execution_id, so
+    a retry after a crash between Stripe's response and our write gets the
+    same session back.
+
+Key and expiry both come from the TTL window the call falls in: the key
+names the window and the session is asked to live until the end of the
+next one. A retry within a window therefore sends Stripe identical
+parameters (Stripe rejects a reused key with different ones) and never gets
+back a session with less than `ttl` to live; a new window means a new key
+and a fresh session. Each session lives between `ttl` and 2 * `ttl`, so
+`ttl` must stay above Stripe's 30-minute minimum and at most 12 hours.
+"""
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+class CheckoutSessionCache:
+    """
+    execution_id -> (session id, URL, expiry), persisted to SQLite. Thread-safe.
+    """
+
+    def __init__(self, path, ttl=3600, margin=60):
+        self.path = path
+        self.ttl = ttl          # window length; sessions live ttl to 2 * ttl (Stripe: 30 minutes to 24 hours)
+        self.margin = margin    # stop handing out a session this long before it expires
+        self._lock = threading.Lock()
+        self._sessions = {}     # execution_id -> (session id, url, expires_at)
+        self._flights = SingleFlight()
+        self._hits = 0
+        self._created = 0
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS checkout_sessions ('
+            'execution_id TEXT PRIMARY KEY, session_id TEXT NOT NULL, url TEXT NOT NULL, expires_at REAL NOT NULL)'
+        )
+        self._db.execute('DELETE FROM checkout_sessions WHERE expires_at < ?', (time.time(),))
+        self._db.commit()
+        for execution_id, session_id, url, expires_at in self._db.execute('SELECT * FROM checkout_sessions'):
+            self._sessions[execution_id] = (session_id, url, expires_at)
+
+    def window(self, now=None):
+        """The TTL window `now` falls in"""
+        return int((now or time.time()) // self.ttl)
+
+    def idempotency_key(self, execution_id, now=None):
+        """Stripe idempotency key for execution_id's session in the current TTL window"""
+        return 'checkout-' + hashlib.sha256(f'{execution_id}:{self.window(now)}'.encode('utf-8')).hexdigest()[:32]
+
+    def expires_at(self, now=None):
+        """Expiry for a session created in the current TTL window: the end of the next window"""
+        return (self.window(now) + 2) * self.ttl
+
+    def get(self, execution_id):
+        """The live (session id, url) for execution_id, or None"""
+        with self._lock:
+            entry = self._sessions.get(execution_id)
+            if entry is None or entry[2] - self.margin <= time.time():
+                return None
+            self._hits += 1
+            return entry[:2]
+
+    def get_or_create(self, execution_id, create):
+        """
+        (session id, url) for execution_id, calling
+        create(idempotency_key, expires_at) -> Stripe session only when there
+        is no live one.
+        """
+        cached = self.get(execution_id)
+        if cached is not None:
+            return cached
+        return self._flights.do(execution_id, lambda: self.get(execution_id) or self._create(execution_id, create))
+
+    def _create(self, execution_id, create):
+        now = time.time()
+        session = create(self.idempotency_key(execution_id, now), self.expires_at(now))
+        expires_at = float(session.expires_at)
+        with self._lock:
+            self._created += 1
+            self._sessions[execution_id] = (session.id, session.url, expires_at)
+            self._db.execute('DELETE FROM checkout_sessions WHERE expires_at < ?', (now,))
+            self._db.execute(
+                'INSERT OR REPLACE INTO checkout_sessions (execution_id, session_id, url, expires_at) VALUES (?, ?, ?, ?)',
+                (execution_id, session.id, session.url, expires_at)
+            )
+            self._db.commit()
+            for stale in [eid for eid, entry in self._sessions.items() if entry[2] < now]:
+                del self._sessions[stale]
+        logger.info(f"Checkout session {session.id} created for {execution_id}")
+        return session.id, session.url
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'created': self._created,
+                'entries': len(self._sessions),
+                'coalesced': self._flights.stats()['coalesced'],
+                'ttl': self.ttl,
+            }
@@ -0,0 +1,67 @@
+"""
+Offline stand-in for the Stripe SDK's Checkout API
+
+Set STRIPE_FAKE=1 to run the payment flow without network access or a Stripe
+account: Session.create honours idempotency keys the way Stripe does (same
+key and parameters, same session; same key with different parameters,
+IdempotencyError) and returns a session whose URL goes straight to the
+success page, as if the customer had paid.
+"""
+import copy
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+
+class IdempotencyError(Exception):
+    """Like stripe.error.IdempotencyError: a key was reused with different parameters"""
+
+
+class FakeCheckoutSessions:
+    def __init__(self, latency=0.0):
+        self.latency = latency   # simulated round trip, in seconds
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._by_key = {}       # idempotency key -> (params, session)
+        self._by_id = {}
+
+    def create(self, idempotency_key=None, **params):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            if idempotency_key in self._by_key:
+                first_params, session = self._by_key[idempotency_key]
+                if params != first_params:
+                    raise IdempotencyError(
+                        f'Keys for idempotent requests can only be used with the same parameters '
+                        f'they were first used with ({idempotency_key})'
+                    )
+                return session
+
+            session_id = f'cs_test_{uuid.uuid4().hex}'
+            session = SimpleNamespace(
+                id=session_id,
+                object='checkout.session',
+                url=params['success_url'].replace('{CHECKOUT_SESSION_ID}', session_id),
+                expires_at=params.get('expires_at') or int(time.time()) + 24 * 3600,
+                mode=params.get('mode'),
+                metadata=params.get('metadata', {}),
+                amount_total=sum(item['price_data']['unit_amount'] * item.get('quantity', 1) for item in params.get('line_items', [])),
+                currency=(params.get('line_items') or [{}])[0].get('price_data', {}).get('currency'),
+                payment_status='unpaid',
+            )
+            self._by_id[session_id] = session
+            if idempotency_key:
+                self._by_key[idempotency_key] = (copy.deepcopy(params), session)
+            return session
+
+    def retrieve(self, session_id):
+        return self._by_id[session_id]
+
+
+class FakeStripe:
+    """Drop-in for the `stripe` module as far as checkout.Session is concerned"""
+
+    def __init__(self, latency=0.0):
+        self.checkout = SimpleNamespace(Session=FakeCheckoutSessions(latency))
@@ -0,0 +1,132 @@
+"""
+Normalized intent record
+
+Intent token payloads carry free-text values ("2000 INR", "june 15 2026",
+"2 adults"). NormalizedIntent parses every field the policy rules need
+exactly once per token, so validation reads plain numbers and datetimes
+instead of re-running regexes and fuzzy date parsing for each rule.
+"""
+import re
+
+from date_resolver import parse_date
+from policy_compiler import facts_from_payload
+
+_DIGITS_RE = re.compile(r'\d+')
+
+# Currency markers in free-text amounts, most specific first ('A$' before '$')
+_CURRENCY_SYMBOLS = [
+    ('₹', 'inr'), ('us$', 'usd'), ('a$', 'aud'), ('c$', 'cad'), ('s$', 'sgd'),
+    ('$', 'usd'), ('€', 'eur'), ('£', 'gbp'), ('¥', 'jpy'),
+]
+_CURRENCY_WORDS_RE = re.compile(
+    r'\b(inr|rs|rupees?|usd|dollars?|eur|euros?|gbp|pounds?|jpy|yen|aud|cad|sgd|aed|dirhams?|chf|thb|baht)\b'
+)
+_CURRENCY_WORDS = {
+    'rs': 'inr', 'rupee': 'inr', 'rupees': 'inr', 'dollar': 'usd', 'dollars': 'usd',
+    'euro': 'eur', 'euros': 'eur', 'pound': 'gbp', 'pounds': 'gbp', 'yen': 'jpy',
+    'dirham': 'aed', 'dirhams': 'aed', 'baht': 'thb',
+}
+_PER_STAY_RE = re.compile(r'\b(total|in total|overall|for the (whole |entire )?stay|all nights)\b')
+
+
+def _parse_amount(text):
+    """First run of digits after stripping thousands separators ('₹4,350' -> 4350.0)"""
+    match = _DIGITS_RE.search(text.replace(',', ''))
+    return float(match.group()) if match else 0
+
+
+def parse_currency(text):
+    """ISO code (lowercase) of the currency a free-text amount names, or None if it names none"""
+    lowered = str(text).lower()
+    for symbol, code in _CURRENCY_SYMBOLS:
+        if symbol in lowered:
+            return code
+    match = _CURRENCY_WORDS_RE.search(lowered)
+    if match:
+        word = match.group(1)
+        return _CURRENCY_WORDS.get(word, word)
+    return None
+
+
+def _parse_count(text, default):
+    match = _DIGITS_RE.search(text)
+    return int(match.group()) if match else default
+
+
+class NormalizedIntent:
+    """
+    One intent token payload with its dates, amounts and counts parsed and
+    its location fields lowercased. Raw budget/price strings are kept for
+    failure messages.
+    """
+
+    __slots__ = (
+        'payload', 'action', 'origin', 'destination', 'location', 'description',
+        'budget_str', 'price_str', 'budget', 'price', 'travelers', 'guests',
+        'date_str', 'booking_date', 'check_in', 'check_out', 'confidence',
+    )
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.action = payload.get('action', 'UNKNOWN')
+
+        self.origin = str(payload.get('origin') or '').lower()
+        self.destination = str(payload.get('destination') or '').lower()
+        self.location = str(payload.get('location') or '').lower()
+        self.description = str(payload.get('description') or '').lower()
+
+        self.budget_str = str(payload.get('budget', '0'))
+        self.price_str = str(payload.get('price', '0'))
+        self.budget = _parse_amount(self.budget_str)
+        self.price = _parse_amount(self.price_str)
+
+        self.travelers = _parse_count(str(payload.get('travelers', '1')), 1)
+        # Hotels check 'guests' first, then fall back to 'travelers'
+        self.guests = _parse_count(str(payload.get('guests', payload.get('travelers', '0'))), 0)
+
+        self.date_str = payload.get('date', '') or payload.get('departure_date', '') or payload.get('check_in', '')
+        self.booking_date = parse_date(self.date_str)
+
+        check_in_str = payload.get('check_in', '')
+        check_out_str = payload.get('check_out', '')
+        self.check_in = parse_date(check_in_str)
+        self.check_out = parse_date(check_out_str) if check_in_str else None
+
+        self.confidence = payload.get('confidence', 0.0)
+
+    @classmethod
+    def from_token(cls, token):
+        return cls(token['payload'])
+
+    def days_until(self, today):
+        """Days from `today` until the booking date (None if there is no parseable date)"""
+        if self.booking_date is None:
+            return None
+        return (self.booking_date.date() - today).days
+
+    @property
+    def budget_currency(self):
+        """Currency the budget names (None if it names none; the rules read that as INR)"""
+        return parse_currency(self.budget_str)
+
+    @property
+    def budget_per_night(self):
+        """
+        Hotel budget per night. The questionnaire asks for it per night, so it
+        is taken as is unless it says it covers the whole stay.
+        """
+        if _PER_STAY_RE.search(self.budget_str.lower()):
+            nights = self.stay_nights
+            return self.budget / nights if nights else None
+        return self.budget
+
+    @property
+    def stay_nights(self):
+        """Nights between check-in and check-out (None unless both parsed)"""
+        if self.check_in is None or self.check_out is None:
+            return None
+        return (self.check_out - self.check_in).days
+
+    def policy_facts(self, today):
+        """Facts for the compiled YAML policy, reusing the already-parsed booking date"""
+        return facts_from_payload(self.payload, today, lambda _: self.days_until(today))
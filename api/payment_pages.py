@@ -0,0 +1,158 @@
+"""
+Payment success and cancel pages
+
+Stripe sends customers here in bursts right after checkout, so the pages
+are made about as cheap as static files:
+  - the Jinja templates (templates/payment_*.html) are compiled once at
+    import, and each rendered page is cached with its compressed forms, so
+    a refresh costs a dict lookup. Only pages for executions the trace store
+    knows (and, on success, a Stripe-shaped session id) are cached: anything
+    else is rendered per request and compressed only in the encoding that
+    request negotiates, so random query strings can neither buy a full
+    precompression each nor push real pages out of the cache;
+  - the CSS is one static file, fingerprinted into its URL and served from
+    memory with a year-long immutable Cache-Control, so browsers fetch it
+    once;
+  - bodies are sent brotli- or gzip-encoded per Accept-Encoding, and a
+    request whose If-None-Match matches the ETag gets a bodiless 304.
+"""
+import gzip
+import hashlib
+import os
+import re
+from functools import lru_cache
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TEMPLATES = Environment(
+    loader=FileSystemLoader(os.path.join(BASE_DIR, 'templates')),
+    autoescape=select_autoescape(['html']),
+    auto_reload=False
+)
+
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+# Checkout Session ids as Stripe (and fake_stripe) issue them
+STRIPE_SESSION_ID = re.compile(r'cs_(test|live)_[A-Za-z0-9]{1,200}')
+
+STATIC_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Pages carry per-payment ids: keep them out of shared caches, revalidate by ETag
+PAGE_CACHE_CONTROL = 'private, no-cache'
+
+
+def negotiate(accept_encoding, available):
+    """The best of br/gzip that the client accepts and we have, else 'identity'"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    for encoding in ('br', 'gzip'):
+        if encoding in available and accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
+
+
+class Payload:
+    """
+    A response body with an ETag per encoding, compressed up front (eager) or
+    on first use in each encoding (for one-off bodies that are not cached)
+    """
+
+    __slots__ = ('content_type', 'cache_control', 'digest', 'effort', 'encodings')
+
+    def __init__(self, body, content_type, cache_control, effort='fast', eager=True):
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(body).hexdigest()[:20]
+        self.effort = effort
+        self.encodings = {'identity': body}
+        if eager:
+            for encoding in ENCODINGS:
+                self.encoded(encoding)
+
+    def encoded(self, encoding):
+        body = self.encodings.get(encoding)
+        if body is None:
+            identity = self.encodings['identity']
+            if encoding == 'br':
+                body = brotli.compress(identity, quality=11 if self.effort == 'max' else 5)
+            else:
+                body = gzip.compress(identity, compresslevel=9 if self.effort == 'max' else 6, mtime=0)
+            self.encodings[encoding] = body
+        return body
+
+    def response(self, accept_encoding=None, if_none_match=None):
+        """(status, headers, body) for a request with these header values"""
+        encoding = negotiate(accept_encoding, ENCODINGS)
+        etag = f'"{self.digest}"' if encoding == 'identity' else f'"{self.digest}-{encoding}"'
+        headers = {
+            'Content-Type': self.content_type,
+            'Cache-Control': self.cache_control,
+            'ETag': etag,
+            'Vary': 'Accept-Encoding'
+        }
+        if if_none_match and (if_none_match.strip() == '*' or etag in if_none_match):
+            return 304, headers, b''
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return 200, headers, self.encoded(encoding)
+
+
+with open(os.path.join(BASE_DIR, 'static', 'payment.css'), 'rb') as stylesheet:
+    STYLESHEET = Payload(stylesheet.read(), 'text/css; charset=utf-8', STATIC_CACHE_CONTROL, effort='max')
+STYLESHEET_URL = f'/payment/static/payment.css?v={STYLESHEET.digest[:12]}'
+
+SUCCESS_TEMPLATE = TEMPLATES.get_template('payment_success.html')
+CANCEL_TEMPLATE = TEMPLATES.get_template('payment_cancel.html')
+
+
+def _success_page(session_id, execution_id, eager):
+    html = SUCCESS_TEMPLATE.render(stylesheet_url=STYLESHEET_URL, session_id=session_id, execution_id=execution_id)
+    return Payload(html.encode('utf-8'), 'text/html; charset=utf-8', PAGE_CACHE_CONTROL, eager=eager)
+
+
+def _cancel_page(execution_id, eager):
+    html = CANCEL_TEMPLATE.render(stylesheet_url=STYLESHEET_URL, execution_id=execution_id)
+    return Payload(html.encode('utf-8'), 'text/html; charset=utf-8', PAGE_CACHE_CONTROL, eager=eager)
+
+
+@lru_cache(maxsize=4096)
+def _cached_success_page(session_id, execution_id):
+    return _success_page(session_id, execution_id, eager=True)
+
+
+@lru_cache(maxsize=4096)
+def _cached_cancel_page(execution_id):
+    return _cancel_page(execution_id, eager=True)
+
+
+def payment_success_page(session_id, execution_id, known_execution=False):
+    """
+    Payment success page - shown after successful Stripe payment.
+    `known_execution`: execution_id is in the trace store (the page may be cached)
+    """
+    if known_execution and session_id and STRIPE_SESSION_ID.fullmatch(session_id):
+        return _cached_success_page(session_id, execution_id)
+    return _success_page(session_id, execution_id, eager=False)
+
+
+def payment_cancel_page(execution_id, known_execution=False):
+    """
+    Payment cancelled page
+    """
+    if known_execution:
+        return _cached_cancel_page(execution_id)
+    return _cancel_page(execution_id, eager=False)
@@ -0,0 +1,141 @@
+"""
+Content-addressed cache of raw plan completions
+
+The second phase of execute-with-intent sends a deterministic prompt (request
+type, prompt template, user input, questionnaire answers) to the LLM. Retries,
+page refreshes and colleagues booking the same route repeat those inputs, so
+the raw completion is stored under a hash of them. Parsing, intent-token
+generation and policy evaluation are replayed on every request, so a cached
+plan is still judged against the live policy.
+
+Responses are kept in a local SQLite file; an in-memory index tracks recency
+and total size, and the least recently used plans are evicted once the cache
+exceeds its byte budget. Hits only update the in-memory order; their
+last_used values reach SQLite in batches (as in QuestionCache), so a hit
+costs no write.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Hits between batched writes of last_used to SQLite
+RECENCY_FLUSH_EVERY = 64
+
+
+def canonical_key(parts):
+    """SHA-256 of the canonical JSON encoding of parts (sorted keys, no whitespace)"""
+    encoded = json.dumps(parts, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class PlanCache:
+    """
+    Size-bounded LRU of raw LLM responses, persisted to SQLite. Thread-safe.
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # key -> size in bytes, least recently used first
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._touched = {}  # key -> last_used not yet written to SQLite
+        self._unflushed_hits = 0
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS plans ('
+            'key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, '
+            'created_at REAL NOT NULL, last_used REAL NOT NULL)'
+        )
+        self._db.commit()
+
+        with self._lock:
+            for key, size in self._db.execute('SELECT key, size FROM plans ORDER BY last_used'):
+                self._index[key] = size
+                self._bytes += size
+            self._evict()
+            self._db.commit()
+        logger.info(f"Plan cache loaded {len(self._index)} entries ({self._bytes} bytes) from {self.path}")
+
+    def get(self, key):
+        """The cached raw response for key, or None"""
+        with self._lock:
+            if key not in self._index:
+                self._misses += 1
+                return None
+            row = self._db.execute('SELECT response FROM plans WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                # Removed behind our back; forget it
+                self._bytes -= self._index.pop(key)
+                self._touched.pop(key, None)
+                self._misses += 1
+                return None
+
+            self._index.move_to_end(key)
+            self._touched[key] = time.time()
+            self._unflushed_hits += 1
+            if self._unflushed_hits >= RECENCY_FLUSH_EVERY:
+                self._flush_recency()
+                self._db.commit()
+            self._hits += 1
+            return row[0]
+
+    def put(self, key, response):
+        size = len(response.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._bytes -= self._index.pop(key, 0)
+            self._touched.pop(key, None)
+            self._index[key] = size
+            self._bytes += size
+            self._db.execute(
+                'INSERT OR REPLACE INTO plans (key, response, size, created_at, last_used) VALUES (?, ?, ?, ?, ?)',
+                (key, response, size, now, now)
+            )
+            self._evict()
+            self._flush_recency()
+            self._db.commit()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes:
+            key, size = self._index.popitem(last=False)
+            self._bytes -= size
+            self._touched.pop(key, None)
+            self._db.execute('DELETE FROM plans WHERE key = ?', (key,))
+            self._evictions += 1
+
+    def _flush_recency(self):
+        """Write pending last_used values (caller holds the lock and commits)"""
+        if self._touched:
+            self._db.executemany(
+                'UPDATE plans SET last_used = ? WHERE key = ?',
+                [(last_used, key) for key, last_used in self._touched.items()]
+            )
+            self._touched.clear()
+        self._unflushed_hits = 0
+
+    def stats(self):
+        lookups = self._hits + self._misses
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0,
+            'evictions': self._evictions,
+            'entries': len(self._index),
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+        }
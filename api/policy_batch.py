@@ -0,0 +1,233 @@
+"""
+Columnar batch evaluation of the compiled travel policy
+
+Turns thousands of intent-token payloads into NumPy columns (numeric fields
+as float arrays, categorical fields as integer codes) and evaluates each
+tool's anyOf/allOf tree as vectorized boolean masks.
+"""
+import numpy as np
+
+from policy_compiler import (
+    PolicyCompileError,
+    days_until,
+    facts_from_payload,
+    to_key,
+    to_number,
+    tool_for_action,
+)
+
+NUMERIC_CONDITIONS = {
+    'LESS_THAN': np.less,
+    'LESS_THAN_OR_EQUAL': np.less_equal,
+    'GREATER_THAN': np.greater,
+    'GREATER_THAN_OR_EQUAL': np.greater_equal,
+}
+
+
+class ColumnarBatch:
+    """
+    Policy facts for a batch of payloads, materialized lazily as columns.
+    Missing numeric values are NaN (every comparison fails) and missing
+    categorical values get code -1.
+    """
+
+    def __init__(self, payloads, today=None):
+        self.size = len(payloads)
+
+        # Audits repeat the same handful of dates; parse each distinct string once
+        parsed_days = {}
+
+        def resolve_days(date_str):
+            if date_str not in parsed_days:
+                parsed_days[date_str] = days_until(date_str, today)
+            return parsed_days[date_str]
+
+        self.facts = [facts_from_payload(p, today, resolve_days) for p in payloads]
+        self.tools = np.array([tool_for_action(p.get('action', 'UNKNOWN')) for p in payloads], dtype=object)
+        self._numeric = {}
+        self._codes = {}
+        self._vocab = {}
+
+    def numeric(self, field):
+        column = self._numeric.get(field)
+        if column is None:
+            column = np.fromiter(
+                (np.nan if (n := to_number(f.get(field))) is None else n for f in self.facts),
+                dtype=np.float64,
+                count=self.size,
+            )
+            self._numeric[field] = column
+        return column
+
+    def codes(self, field):
+        column = self._codes.get(field)
+        if column is None:
+            vocab = {}
+            column = np.fromiter(
+                (-1 if (k := to_key(f.get(field))) is None else vocab.setdefault(k, len(vocab)) for f in self.facts),
+                dtype=np.int32,
+                count=self.size,
+            )
+            self._codes[field] = column
+            self._vocab[field] = vocab
+        return column
+
+    def codes_of(self, field, values):
+        """Codes for expected values; values absent from the batch are dropped"""
+        self.codes(field)
+        vocab = self._vocab[field]
+        return [vocab[k] for k in (to_key(v) for v in values) if k in vocab]
+
+
+def _as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def _is_numeric_literal(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def compile_node_vectorized(node):
+    """Vectorized counterpart of policy_compiler.compile_node: predicate(batch) -> bool mask"""
+    if not isinstance(node, dict):
+        raise PolicyCompileError(f'Rule node must be a mapping, got {type(node).__name__}')
+
+    parts = []
+
+    if 'field' in node:
+        parts.append(_vector_leaf(node['field'], node.get('condition'), node.get('value')))
+
+    if 'allOf' in node:
+        children = tuple(compile_node_vectorized(child) for child in node['allOf'] or [])
+
+        def all_of(batch):
+            mask = np.ones(batch.size, dtype=bool)
+            for child in children:
+                mask &= child(batch)
+            return mask
+        parts.append(all_of)
+
+    if 'anyOf' in node:
+        children = tuple(compile_node_vectorized(child) for child in node['anyOf'] or [])
+
+        def any_of(batch):
+            mask = np.zeros(batch.size, dtype=bool)
+            for child in children:
+                mask |= child(batch)
+            return mask
+        parts.append(any_of)
+
+    if not parts:
+        return _vector_always
+
+    def combined(batch):
+        mask = np.ones(batch.size, dtype=bool)
+        for part in parts:
+            mask &= part(batch)
+        return mask
+    return combined
+
+
+def _vector_always(batch):
+    return np.ones(batch.size, dtype=bool)
+
+
+def _vector_leaf(field, condition, value):
+    if condition in NUMERIC_CONDITIONS:
+        limit = to_number(value)
+        if limit is None:
+            raise PolicyCompileError(f'Numeric condition needs a number, got {value!r}')
+        compare = NUMERIC_CONDITIONS[condition]
+
+        def numeric_leaf(batch):
+            return compare(batch.numeric(field), limit)
+        return numeric_leaf
+
+    if condition in ('EQUALS', 'NOT_EQUALS') and _is_numeric_literal(value):
+        expected = float(value)
+        negate = condition == 'NOT_EQUALS'
+
+        def numeric_equals(batch):
+            column = batch.numeric(field)
+            mask = column == expected
+            return (~mask & ~np.isnan(column)) if negate else mask
+        return numeric_equals
+
+    if condition in ('IN_SET', 'EQUALS', 'NOT_IN_SET', 'NOT_EQUALS'):
+        values = _as_list(value)
+        negate = condition in ('NOT_IN_SET', 'NOT_EQUALS')
+
+        def categorical_leaf(batch):
+            codes = batch.codes(field)
+            mask = np.isin(codes, batch.codes_of(field, values))
+            return (~mask & (codes >= 0)) if negate else mask
+        return categorical_leaf
+
+    raise PolicyCompileError(f"Unknown condition '{condition}' on field '{field}'")
+
+
+class BatchPolicyEvaluator:
+    """
+    Vectorized evaluator built from a CompiledPolicySet. Each policy's
+    top-level anyOf branches are compiled separately so the first branch
+    that matched can be reported per token, like CompiledPolicy.evaluate.
+    """
+
+    def __init__(self, compiled_policy):
+        self.compiled_policy = compiled_policy
+        self.version = compiled_policy.version
+        self.policies = {}
+
+        for tool, policy in compiled_policy.policies.items():
+            source = policy.source
+            guard_node = {k: v for k, v in source.items() if k in ('allOf', 'field', 'condition', 'value')}
+            guard = compile_node_vectorized(guard_node) if guard_node else None
+
+            branches = [
+                (f'{tool}.anyOf[{i}]', compile_node_vectorized(branch))
+                for i, branch in enumerate(source.get('anyOf') or [])
+            ]
+            if not branches:
+                branches = [(f'{tool}.allOf' if guard else tool, _vector_always)]
+
+            self.policies[tool] = (policy, guard, branches)
+
+    def evaluate(self, payloads, today=None):
+        """
+        Returns one {'tool', 'decision', 'rule'} dict per payload, in order.
+        Tokens whose tool has no policy get decision None.
+        """
+        batch = ColumnarBatch(payloads, today)
+        decisions = np.full(batch.size, None, dtype=object)
+        rules = np.full(batch.size, None, dtype=object)
+
+        for tool, (policy, guard, branches) in self.policies.items():
+            selected = batch.tools == tool
+            if not selected.any():
+                continue
+
+            guard_mask = guard(batch) if guard is not None else None
+            fired = np.full(batch.size, -1, dtype=np.int32)
+            for i, (_, predicate) in enumerate(branches):
+                mask = predicate(batch)
+                if guard_mask is not None:
+                    mask &= guard_mask
+                fired[(fired < 0) & mask] = i
+
+            # Trailing None so fired == -1 (no scenario matched) maps to no rule
+            labels = np.array([label for label, _ in branches] + [None], dtype=object)
+            matched = selected & (fired >= 0)
+            decisions[matched] = policy.action
+            decisions[selected & (fired < 0)] = policy.on_violation
+            rules[selected] = labels[fired[selected]]
+
+        destination_blacklist = self.compiled_policy.blacklists.get('destinations')
+        if destination_blacklist:
+            blocked = np.isin(batch.codes('destination'), batch.codes_of('destination', list(destination_blacklist)))
+            decisions[blocked] = 'BLOCK_AND_LOG'
+            rules[blocked] = 'blacklists.destinations'
+
+        return [
+            {'tool': tool, 'decision': decision, 'rule': rule}
+            for tool, decision, rule in zip(batch.tools.tolist(), decisions.tolist(), rules.tolist())
+        ]
@@ -0,0 +1,312 @@
+"""
+Policy compiler for manager/policy_travel.yaml
+
+Turns every tool's anyOf/allOf condition tree into precompiled predicates
+once at load time and indexes them by `tool`, so evaluating an intent token
+is a dict lookup plus a handful of closure calls instead of walking the YAML.
+"""
+import re
+from datetime import datetime
+
+from date_resolver import parse_date
+
+_NUMBER_RE = re.compile(r'-?\d+(?:\.\d+)?')
+
+# Intent token actions -> tool names used in the policy file
+ACTION_TOOLS = {
+    'BOOK_FLIGHT': 'book_flight',
+    'BOOK_TRAIN': 'book_train',
+    'BOOK_HOTEL': 'book_hotel',
+    'BOOK_RESTAURANT': 'book_restaurant',
+    'BOOK_ATTRACTION': 'book_attraction',
+    'BOOK_TRANSPORT': 'book_transport',
+    'MAKE_PAYMENT': 'execute_payment',
+}
+
+
+class PolicyCompileError(ValueError):
+    """Raised when the policy file contains a rule we cannot compile."""
+
+
+def to_number(value):
+    """Coerce ints, floats and strings like '₹4,350' to float (None if impossible)"""
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER_RE.search(str(value).replace(',', ''))
+    return float(match.group()) if match else None
+
+
+def to_key(value):
+    """Normalize a categorical value for case-insensitive comparison"""
+    if value is None:
+        return None
+    return str(value).strip().casefold()
+
+
+# ===== Condition builders: expected value -> test(actual) =====
+
+def _in_set(expected):
+    allowed = frozenset(to_key(v) for v in (expected if isinstance(expected, list) else [expected]))
+
+    def test(actual):
+        return actual is not None and to_key(actual) in allowed
+    return test
+
+
+def _not_in_set(expected):
+    in_set = _in_set(expected)
+
+    def test(actual):
+        return actual is not None and not in_set(actual)
+    return test
+
+
+def _equals(expected):
+    number = to_number(expected) if isinstance(expected, (int, float)) else None
+    if number is not None:
+        def test(actual):
+            return to_number(actual) == number
+        return test
+
+    key = to_key(expected)
+
+    def test(actual):
+        return actual is not None and to_key(actual) == key
+    return test
+
+
+def _not_equals(expected):
+    equals = _equals(expected)
+
+    def test(actual):
+        return actual is not None and not equals(actual)
+    return test
+
+
+def _numeric(compare):
+    def build(expected):
+        limit = to_number(expected)
+        if limit is None:
+            raise PolicyCompileError(f'Numeric condition needs a number, got {expected!r}')
+
+        def test(actual):
+            number = to_number(actual)
+            return number is not None and compare(number, limit)
+        return test
+    return build
+
+
+CONDITIONS = {
+    'IN_SET': _in_set,
+    'NOT_IN_SET': _not_in_set,
+    'EQUALS': _equals,
+    'NOT_EQUALS': _not_equals,
+    'LESS_THAN': _numeric(lambda a, b: a < b),
+    'LESS_THAN_OR_EQUAL': _numeric(lambda a, b: a <= b),
+    'GREATER_THAN': _numeric(lambda a, b: a > b),
+    'GREATER_THAN_OR_EQUAL': _numeric(lambda a, b: a >= b),
+}
+
+
+def _always(facts):
+    return True
+
+
+def compile_node(node):
+    """
+    Compile one node of a rule tree into a predicate(facts) -> bool.
+    A node is either a leaf {field, condition, value} or a group with
+    anyOf and/or allOf children.
+    """
+    if not isinstance(node, dict):
+        raise PolicyCompileError(f'Rule node must be a mapping, got {type(node).__name__}')
+
+    parts = []
+
+    if 'field' in node:
+        condition = node.get('condition')
+        builder = CONDITIONS.get(condition)
+        if builder is None:
+            raise PolicyCompileError(f"Unknown condition '{condition}' on field '{node['field']}'")
+        field = node['field']
+        test = builder(node.get('value'))
+
+        def leaf(facts):
+            return test(facts.get(field))
+        parts.append(leaf)
+
+    if 'allOf' in node:
+        children = tuple(compile_node(child) for child in node['allOf'] or [])
+
+        def all_of(facts):
+            for child in children:
+                if not child(facts):
+                    return False
+            return True
+        parts.append(all_of)
+
+    if 'anyOf' in node:
+        children = tuple(compile_node(child) for child in node['anyOf'] or [])
+
+        def any_of(facts):
+            for child in children:
+                if child(facts):
+                    return True
+            return False
+        parts.append(any_of)
+
+    if not parts:
+        return _always
+    if len(parts) == 1:
+        return parts[0]
+
+    parts = tuple(parts)
+
+    def combined(facts):
+        for part in parts:
+            if not part(facts):
+                return False
+        return True
+    return combined
+
+
+class CompiledPolicy:
+    """
+    One tool's policy with its top-level scenarios compiled to predicates.
+    Each top-level anyOf branch is kept separately so callers can report
+    which scenario allowed the request.
+    """
+
+    __slots__ = ('tool', 'action', 'on_violation', 'branches', 'source')
+
+    def __init__(self, policy):
+        self.tool = policy['tool']
+        self.action = policy.get('action', 'ALLOW')
+        self.on_violation = policy.get('on_violation', 'BLOCK')
+        self.source = policy
+
+        branches = []
+        for i, branch in enumerate(policy.get('anyOf') or []):
+            branches.append((f'{self.tool}.anyOf[{i}]', compile_node(branch)))
+
+        # Conditions outside anyOf (e.g. a top-level allOf) must hold for every branch
+        rest = {k: v for k, v in policy.items() if k in ('allOf', 'field', 'condition', 'value')}
+        if rest:
+            guard = compile_node(rest)
+            if branches:
+                branches = [(label, _both(guard, predicate)) for label, predicate in branches]
+            else:
+                branches = [(f'{self.tool}.allOf', guard)]
+        elif not branches:
+            branches = [(self.tool, _always)]
+
+        self.branches = tuple(branches)
+
+    def evaluate(self, facts):
+        """
+        Returns (decision, fired_rule). decision is `action` when a scenario
+        matched, otherwise `on_violation` with fired_rule None.
+        """
+        for label, predicate in self.branches:
+            if predicate(facts):
+                return self.action, label
+        return self.on_violation, None
+
+
+def _both(first, second):
+    def predicate(facts):
+        return first(facts) and second(facts)
+    return predicate
+
+
+class CompiledPolicySet:
+    """All compiled policies from one policy document, indexed by tool."""
+
+    def __init__(self, policy_doc):
+        policy_doc = policy_doc or {}
+        self.version = str(policy_doc.get('version', 'unversioned'))
+        self.policies = {}
+        for policy in policy_doc.get('policies') or []:
+            if 'tool' not in policy:
+                raise PolicyCompileError('Every policy needs a tool name')
+            self.policies[policy['tool']] = CompiledPolicy(policy)
+
+        self.blacklists = {
+            name: frozenset(to_key(v) for v in values or [])
+            for name, values in (policy_doc.get('blacklists') or {}).items()
+        }
+
+    def get(self, tool):
+        return self.policies.get(tool)
+
+    def evaluate(self, tool, facts):
+        """Evaluate facts against a tool's policy. Returns (None, None) when no policy applies."""
+        policy = self.policies.get(tool)
+        if policy is None:
+            return None, None
+        return policy.evaluate(facts)
+
+    def is_blacklisted(self, list_name, *values):
+        blacklist = self.blacklists.get(list_name)
+        if not blacklist:
+            return False
+        return any(to_key(v) in blacklist for v in values if v)
+
+
+def compile_policy(policy_doc):
+    """Compile a loaded policy YAML document"""
+    return CompiledPolicySet(policy_doc)
+
+
+def tool_for_action(action):
+    return ACTION_TOOLS.get(action, str(action).lower())
+
+
+def departure_date_string(payload):
+    """The raw date string a token is evaluated against (departure or check-in)"""
+    return payload.get('date') or payload.get('departure_date') or payload.get('check_in')
+
+
+def days_until(date_str, today=None):
+    """Days from today until a fuzzily parsed date (None if unparseable)"""
+    today = today or datetime.now().date()
+    parsed = parse_date(date_str, today)
+    return (parsed.date() - today).days if parsed is not None else None
+
+
+def facts_from_payload(payload, today=None, resolve_days=None):
+    """
+    Derive the fields referenced by the policy file from an intent token payload.
+    Flights without an explicit class are treated as ECONOMY. `resolve_days`
+    lets batch callers share date parsing across tokens with the same date.
+    """
+    action = payload.get('action')
+
+    facts = {
+        'destination': payload.get('destination') or payload.get('location'),
+        'origin': payload.get('origin'),
+        'location': payload.get('location'),
+        'price': to_number(payload.get('price')),
+        'amount': to_number(payload.get('amount', payload.get('price'))),
+        'travelers': to_number(payload.get('travelers')),
+        'recipient_type': payload.get('recipient_type'),
+        'merchant': payload.get('merchant'),
+    }
+
+    flight_class = payload.get('class') or payload.get('flight_class')
+    if flight_class:
+        facts['class'] = re.sub(r'[\s-]+', '_', str(flight_class).strip()).upper()
+    elif action == 'BOOK_FLIGHT':
+        facts['class'] = 'ECONOMY'
+
+    date_str = departure_date_string(payload)
+    facts['days_until_departure'] = None
+    if date_str:
+        if resolve_days is not None:
+            facts['days_until_departure'] = resolve_days(date_str)
+        else:
+            facts['days_until_departure'] = days_until(date_str, today)
+
+    return facts
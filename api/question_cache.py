@@ -0,0 +1,195 @@
+"""
+Question-set cache for the first round of execute-with-intent
+
+Most first-round requests are variations of "book a flight from X to Y" or
+"hotel in Z", which the LLM answers with the same handful of question sets.
+Requests are keyed on their detected request type plus the remaining entity
+words (stop-words stripped), with the words after "from"/"to" kept as origin
+and destination, so "Book me a flight from Mumbai to Delhi" and "flight
+mumbai to delhi please" share one entry but "flight from Delhi to Mumbai"
+does not.
+
+Entries live in an in-memory LRU backed by a local SQLite file, so the cache
+survives restarts. Entries expire after a TTL. Recency from hits is written
+to SQLite in batches rather than on every hit.
+"""
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+STOP_WORDS = frozenset("""
+    a an the i im m me my we our us you your to from for of in on at by with and or
+    please pls want wanna would like need looking look find get book booking reserve
+    make plan help can could will should some any this that next trip travel go going
+    flight flights fly flying airplane plane airline hotel hotels accommodation stay
+    room rooms train trains rail restaurant dinner lunch ticket tickets
+""".split())
+
+
+DIRECTION_WORDS = frozenset(('from', 'to'))
+
+# Hits between batched writes of last_used to SQLite
+RECENCY_FLUSH_EVERY = 64
+
+
+def normalize_request(request_type, text):
+    """
+    Cache key: request type, the other entity words in order, then the
+    origin ("from ...") and destination ("to ...") words. In "mumbai to delhi"
+    the unmarked words before the destination are the origin.
+    """
+    segments = [[None, []]]  # [direction, words]; a direction sticks to the next entity words
+    pending = None
+    for word in _WORD_RE.findall(text.lower()):
+        if word in DIRECTION_WORDS:
+            pending = word
+        elif word not in STOP_WORDS:
+            if pending is not None:
+                segments.append([pending, []])
+                pending = None
+            segments[-1][1].append(word)
+
+    segments = [segment for segment in segments if segment[1]]
+    if not any(direction == 'from' for direction, _ in segments):
+        for i, (direction, _) in enumerate(segments):
+            if direction == 'to' and i > 0 and segments[i - 1][0] is None:
+                segments[i - 1][0] = 'from'
+                break
+
+    words = {None: [], 'from': [], 'to': []}
+    for direction, segment_words in segments:
+        words[direction].extend(segment_words)
+    key = ' '.join(words[None])
+    for direction in ('from', 'to'):
+        if words[direction]:
+            key += f" {direction}:{' '.join(words[direction])}"
+    return f"{request_type}:{key.strip()}"
+
+
+class QuestionCache:
+    """
+    TTL + LRU cache of generated question lists, persisted to SQLite.
+    Thread-safe; all reads are served from memory.
+    """
+
+    def __init__(self, path, ttl=86400, maxsize=1000):
+        self.path = path
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (questions, created_at), least recently used first
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evictions = 0
+        self._touched = {}  # key -> last_used not yet written to SQLite
+        self._unflushed_hits = 0
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        # WAL without per-commit fsync keeps writes cheap
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS question_sets ('
+            'key TEXT PRIMARY KEY, questions TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)'
+        )
+        self._db.commit()
+        self._load()
+
+    def _load(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            self._db.execute('DELETE FROM question_sets WHERE created_at < ?', (cutoff,))
+            rows = self._db.execute(
+                'SELECT key, questions, created_at FROM question_sets ORDER BY last_used DESC LIMIT ?',
+                (self.maxsize,)
+            ).fetchall()
+            for key, questions, created_at in reversed(rows):
+                self._entries[key] = (json.loads(questions), created_at)
+            # Drop anything beyond maxsize that the LIMIT skipped
+            self._db.execute(
+                'DELETE FROM question_sets WHERE key NOT IN '
+                '(SELECT key FROM question_sets ORDER BY last_used DESC LIMIT ?)',
+                (self.maxsize,)
+            )
+            self._db.commit()
+        logger.info(f"Question cache loaded {len(rows)} entries from {self.path}")
+
+    def get(self, key):
+        """Cached questions for key (a fresh copy), or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+
+            questions, created_at = entry
+            if now - created_at > self.ttl:
+                del self._entries[key]
+                self._touched.pop(key, None)
+                self._db.execute('DELETE FROM question_sets WHERE key = ?', (key,))
+                self._db.commit()
+                self._expired += 1
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._touched[key] = now
+            self._unflushed_hits += 1
+            if self._unflushed_hits >= RECENCY_FLUSH_EVERY:
+                self._flush_recency()
+                self._db.commit()
+            self._hits += 1
+
+        # Callers decorate questions with UI metadata; never hand out the cached dicts
+        return [dict(q) for q in questions]
+
+    def put(self, key, questions):
+        now = time.time()
+        questions = [dict(q) for q in questions]
+        with self._lock:
+            self._entries[key] = (questions, now)
+            self._entries.move_to_end(key)
+            self._db.execute(
+                'INSERT OR REPLACE INTO question_sets (key, questions, created_at, last_used) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(questions), now, now)
+            )
+            while len(self._entries) > self.maxsize:
+                evicted, _ = self._entries.popitem(last=False)
+                self._touched.pop(evicted, None)
+                self._db.execute('DELETE FROM question_sets WHERE key = ?', (evicted,))
+                self._evictions += 1
+            self._flush_recency()
+            self._db.commit()
+
+    def _flush_recency(self):
+        """Write pending last_used values (caller holds the lock and commits)"""
+        if self._touched:
+            self._db.executemany(
+                'UPDATE question_sets SET last_used = ? WHERE key = ?',
+                [(last_used, key) for key, last_used in self._touched.items()]
+            )
+            self._touched.clear()
+        self._unflushed_hits = 0
+
+    def stats(self):
+        lookups = self._hits + self._misses
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0,
+            'expired': self._expired,
+            'evictions': self._evictions,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+        }
@@ -0,0 +1,234 @@
+"""
+Server-side questionnaire sessions
+
+Instead of the client resending the original text with every answer, a
+session holds the conversation: the request, its questions, the answers so
+far and, once planned, the trace with its intent tokens. Each session is a
+small state machine:
+
+    asking --(last answer)--> ready --(plan)--> planning --> planned
+
+A plan request claims the session (ready -> planning) before calling the
+LLM, so concurrent requests for the same session generate one plan; a failed
+generation hands it back (planning -> ready).
+
+Sessions live in a bounded in-memory LRU written through to a local SQLite
+file. Sessions pushed out of memory are reloaded from SQLite on their next
+request; sessions idle for longer than the TTL expire in both.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStateError(ValueError):
+    """The operation is not allowed in the session's current state"""
+
+
+class QuestionnaireSession:
+    ASKING, READY, PLANNING, PLANNED = 'asking', 'ready', 'planning', 'planned'
+    # A claim older than this is taken to be from a crashed request and can be retaken
+    PLANNING_TIMEOUT = 300
+
+    __slots__ = ('session_id', 'user_input', 'questions', 'answers', 'state', 'trace', 'updated_at')
+
+    def __init__(self, session_id, user_input, questions, answers=None, state=None, trace=None, updated_at=None):
+        self.session_id = session_id
+        self.user_input = user_input
+        self.questions = questions
+        self.answers = answers or []
+        self.state = state or (self.ASKING if len(self.answers) < len(questions) else self.READY)
+        self.trace = trace
+        self.updated_at = updated_at or time.time()
+
+    @property
+    def current_question(self):
+        if self.state != self.ASKING:
+            return None
+        return self.questions[len(self.answers)]
+
+    def answer(self, answer, question_id=None):
+        """Record the answer to the current question; the last answer makes the session ready"""
+        question = self.current_question
+        if question is None:
+            raise SessionStateError(f'Session is {self.state}; there is no question to answer')
+        if question_id is not None and question_id != question.get('id'):
+            raise SessionStateError(f"Expected an answer to {question.get('id')}, got {question_id}")
+
+        self.answers.append({
+            'id': question.get('id'),
+            'question': question.get('question'),
+            'field': question.get('field'),
+            'step': question.get('step'),
+            'answer': answer
+        })
+        if len(self.answers) == len(self.questions):
+            self.state = self.READY
+
+    def start_planning(self, now=None):
+        """
+        Claim a ready session for plan generation. Returns the answers to plan
+        from, or None if the session is already planned.
+        """
+        if self.state == self.PLANNED:
+            return None
+        if self.state == self.ASKING:
+            raise SessionStateError(f'{len(self.questions) - len(self.answers)} question(s) still unanswered')
+        if self.state == self.PLANNING and (now or time.time()) - self.updated_at < self.PLANNING_TIMEOUT:
+            raise SessionStateError('Session is already being planned')
+        self.state = self.PLANNING
+        return list(self.answers)
+
+    def abandon_planning(self):
+        """Hand a claimed session back after a failed plan generation"""
+        if self.state == self.PLANNING:
+            self.state = self.READY
+
+    def complete(self, trace):
+        """Store the plan's trace (the session must be ready, planning or already planned)"""
+        if self.state == self.ASKING:
+            raise SessionStateError(f'{len(self.questions) - len(self.answers)} question(s) still unanswered')
+        self.trace = trace
+        self.state = self.PLANNED
+
+    def view(self):
+        """What the client needs for its next step"""
+        return {
+            'session_id': self.session_id,
+            'state': self.state,
+            'question': self.current_question,
+            'answered': len(self.answers),
+            'total': len(self.questions)
+        }
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+class SessionStore:
+    """
+    TTL + LRU store of questionnaire sessions, persisted to SQLite.
+    Thread-safe; callers change a session through update().
+    """
+
+    def __init__(self, path, ttl=3600, maxsize=10000):
+        self.path = path
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # session_id -> QuestionnaireSession, least recently used first
+        self._created = 0
+        self._reloaded = 0
+        self._expired = 0
+        self._evictions = 0
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            'session_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)'
+        )
+        self._db.execute('DELETE FROM sessions WHERE updated_at < ?', (time.time() - self.ttl,))
+        self._db.commit()
+
+    def create(self, user_input, questions):
+        session = QuestionnaireSession(uuid.uuid4().hex, user_input, questions)
+        with self._lock:
+            self._purge_expired(session.updated_at)
+            self._created += 1
+            self._store(session)
+        return session
+
+    def get(self, session_id):
+        """The live session, or None if it is unknown or expired"""
+        with self._lock:
+            return self._get(session_id, time.time())
+
+    def update(self, session_id, change):
+        """
+        Apply change(session) and persist the session. Returns (session, result);
+        session is None if it is unknown or expired.
+        """
+        now = time.time()
+        with self._lock:
+            session = self._get(session_id, now)
+            if session is None:
+                return None, None
+            result = change(session)
+            session.updated_at = now
+            self._store(session)
+        return session, result
+
+    def _get(self, session_id, now):
+        session = self._sessions.get(session_id)
+        if session is None:
+            row = self._db.execute('SELECT data FROM sessions WHERE session_id = ?', (session_id,)).fetchone()
+            if row is None:
+                return None
+            session = QuestionnaireSession.from_dict(json.loads(row[0]))
+            self._reloaded += 1
+            self._remember(session)
+
+        if now - session.updated_at > self.ttl:
+            del self._sessions[session_id]
+            self._db.execute('DELETE FROM sessions WHERE session_id = ?', (session_id,))
+            self._db.commit()
+            self._expired += 1
+            return None
+
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _store(self, session):
+        self._remember(session)
+        self._db.execute(
+            'INSERT OR REPLACE INTO sessions (session_id, data, updated_at) VALUES (?, ?, ?)',
+            (session.session_id, json.dumps(session.to_dict()), session.updated_at)
+        )
+        self._db.commit()
+
+    def _remember(self, session):
+        self._sessions[session.session_id] = session
+        self._sessions.move_to_end(session.session_id)
+        while len(self._sessions) > self.maxsize:
+            # Only leaves memory; SQLite still has it
+            self._sessions.popitem(last=False)
+            self._evictions += 1
+
+    def _purge_expired(self, now):
+        """Drop expired sessions: the LRU end of memory, and every stale row on disk"""
+        cutoff = now - self.ttl
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.updated_at >= cutoff:
+                break
+            del self._sessions[session_id]
+            self._expired += 1
+        self._db.execute('DELETE FROM sessions WHERE updated_at < ?', (cutoff,))
+
+    def stats(self):
+        with self._lock:
+            states = {}
+            for session in self._sessions.values():
+                states[session.state] = states.get(session.state, 0) + 1
+        return {
+            'active': len(self._sessions),
+            'states': states,
+            'created': self._created,
+            'reloaded': self._reloaded,
+            'expired': self._expired,
+            'evictions': self._evictions,
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+        }
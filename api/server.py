@@ -1,6 +1,5 @@
-from flask import Flask, request, jsonify, redirect
+from flask import Flask, request, jsonify, redirect, Response, stream_with_context
 from flask_cors import CORS
-import yaml
 import logging
 import hmac
 import hashlib
@@ -8,14 +7,37 @@ import os
 import sys
 import json
 import re
-import requests
+import atexit
+import uuid
 import stripe
 from datetime import datetime
-from dateutil import parser as date_parser
 
 # Add parent directory to path to import intent_engine
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
-from intent_engine import IntentEngine, get_travel_plan_with_intents, prioritize_missing_fields, parse_step_wise_plan
+from intent_engine import IntentEngine, KeywordClassifier, StreamingPlanParser, get_travel_plan_with_intents, prioritize_missing_fields, parse_step_wise_plan
+from policy_compiler import facts_from_payload, tool_for_action
+from intent_record import NormalizedIntent, parse_currency
+from date_resolver import DATE_RESOLVER
+from policy_manager import PolicyManager
+from llm_provider import provider_stats
+from llm_router import router_from_env
+from resilience import AdaptiveTimeout
+from question_cache import QuestionCache, normalize_request
+from plan_cache import PlanCache, canonical_key
+from questionnaire_session import SessionStateError, SessionStore
+from trace_store import TraceStore
+from trace_codec import default_codec, make_codec
+from checkout_cache import CheckoutSessionCache
+from fake_stripe import FakeStripe
+from payment_pages import STYLESHEET, payment_cancel_page, payment_success_page
+
+# Request-type vocabulary for user input, in priority order
+REQUEST_CLASSIFIER = KeywordClassifier({
+    'BOOK_FLIGHT': ['flight', 'fly', 'airplane', 'plane', 'airline'],
+    'BOOK_HOTEL': ['hotel', 'accommodation', 'stay', 'room'],
+    'BOOK_TRAIN': ['train', 'rail'],
+    'BOOK_RESTAURANT': ['restaurant', 'dinner', 'lunch'],
+})
 
 app = Flask(__name__)
 CORS(app)
@@ -23,18 +45,60 @@ CORS(app)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Stripe
+# Initialize Stripe (STRIPE_FAKE=1 swaps in an offline stand-in; see fake_stripe.py)
 stripe.api_key = os.getenv('STRIPE_SECRET_KEY')
-if not stripe.api_key:
+STRIPE = FakeStripe() if os.getenv('STRIPE_FAKE') else stripe
+if not stripe.api_key and STRIPE is stripe:
     logger.warning('STRIPE_SECRET_KEY not found in environment variables')
 
-# Load policy configuration
-def load_policy():
-    policy_path = os.path.join(os.path.dirname(__file__), '..', 'manager', 'policy_travel.yaml')
-    with open(policy_path, 'r') as f:
-        return yaml.safe_load(f)
+# One Checkout Session per execution, reused until it expires (see checkout_cache.py)
+CHECKOUT_CACHE = CheckoutSessionCache(
+    os.getenv('CHECKOUT_CACHE_PATH', os.path.join(os.path.dirname(__file__), 'checkout_sessions.db')),
+    ttl=int(os.getenv('CHECKOUT_SESSION_TTL', 3600))
+)
+
+# Load policy configuration (watched and hot-reloaded; see policy_manager.py)
+POLICY_PATH = os.path.join(os.path.dirname(__file__), '..', 'manager', 'policy_travel.yaml')
+POLICY_MANAGER = PolicyManager(POLICY_PATH, poll_interval=float(os.getenv('POLICY_RELOAD_INTERVAL', 2.0)))
+POLICY_MANAGER.start()
+
+# First-round question sets, keyed on the normalized request (see question_cache.py)
+QUESTION_CACHE = QuestionCache(
+    os.getenv('QUESTION_CACHE_PATH', os.path.join(os.path.dirname(__file__), 'question_cache.db')),
+    ttl=float(os.getenv('QUESTION_CACHE_TTL', 86400)),
+    maxsize=int(os.getenv('QUESTION_CACHE_SIZE', 1000))
+)
+
+# Raw plan completions, keyed on the prompt inputs (see plan_cache.py)
+PLAN_CACHE = PlanCache(
+    os.getenv('PLAN_CACHE_PATH', os.path.join(os.path.dirname(__file__), 'plan_cache.db')),
+    max_bytes=int(float(os.getenv('PLAN_CACHE_MAX_MB', 64)) * 1024 * 1024)
+)
+
+# Every returned trace, by execution_id, for payment/confirmation/audit (see trace_store.py)
+TRACE_STORE_DIR = os.getenv('TRACE_STORE_DIR', os.path.join(os.path.dirname(__file__), 'traces'))
+TRACE_STORE = TraceStore(
+    TRACE_STORE_DIR,
+    segment_bytes=int(float(os.getenv('TRACE_SEGMENT_MB', 64)) * 1024 * 1024),
+    flush_interval=float(os.getenv('TRACE_FSYNC_INTERVAL', 0.05)),
+    # Compact msgpack+zstd records with the store's trained dictionary (see trace_codec.py)
+    codec=make_codec(os.environ['TRACE_CODEC'], TRACE_STORE_DIR) if os.getenv('TRACE_CODEC') else default_codec(TRACE_STORE_DIR)
+)
+atexit.register(TRACE_STORE.close)
+
+def record_trace(trace):
+    """
+    Append a trace to the trace store and return it
+    """
+    TRACE_STORE.append(trace['execution_id'], trace)
+    return trace
 
-POLICY = load_policy()
+# Server-side questionnaire conversations (see questionnaire_session.py)
+SESSION_STORE = SessionStore(
+    os.getenv('SESSION_STORE_PATH', os.path.join(os.path.dirname(__file__), 'sessions.db')),
+    ttl=float(os.getenv('SESSION_TTL', 3600)),
+    maxsize=int(os.getenv('SESSION_MAX', 10000))
+)
 
 def generate_armor_token(message: str, secret: str) -> str:
     """Generate HMAC token for intent verification"""
@@ -44,62 +108,56 @@ def generate_armor_token(message: str, secret: str) -> str:
         hashlib.sha256
     ).hexdigest()
 
-def evaluate_payment_policy(amount: float, merchant: str) -> dict:
+# Utility billers treated as verified merchants by the payment policy
+VERIFIED_MERCHANTS = ('ELECTRICITY_BOARD', 'WATER_UTILITY', 'TELECOM_PROVIDER')
+
+def evaluate_payment_policy(amount: float, merchant: str, policy=None) -> dict:
     """
-    Evaluate payment against policy rules
-    Returns: {passed: bool, checks: [list of check results]}
+    Evaluate payment against the compiled execute_payment policy
+    Returns: {passed: bool, checks: [list of check results], decision: str, rule: str, policy_version: str}
     """
-    checks = []
-    all_passed = True
+    policy = policy or POLICY_MANAGER.current()
     
     # Extract payment policy rules
-    payment_policy = None
-    for policy in POLICY.get('policies', []):
-        if policy.get('tool') == 'execute_payment':
-            payment_policy = policy
-            break
+    payment_policy = policy.compiled.get('execute_payment')
     
     if not payment_policy:
         return {
             'passed': False,
-            'checks': [{'rule': 'POLICY_NOT_FOUND', 'result': 'FAIL'}]
+            'checks': [{'rule': 'POLICY_NOT_FOUND', 'result': 'FAIL'}],
+            'policy_version': policy.version
         }
     
-    # Check 1: Merchant allowlist (simplified - checking if verified)
-    merchant_check = {
-        'rule': 'MERCHANT_ALLOWLIST',
-        'result': 'PASS'
-    }
-    
-    # Assume ELECTRICITY_BOARD is a verified merchant
-    verified_merchants = ['ELECTRICITY_BOARD', 'WATER_UTILITY', 'TELECOM_PROVIDER']
-    is_verified = merchant in verified_merchants
-    
-    if is_verified:
-        max_amount = 50000  # Verified merchant limit
-        merchant_check['result'] = 'PASS'
-    else:
-        max_amount = 5000  # Unverified vendor limit
-        merchant_check['result'] = 'PASS'
-    
-    checks.append(merchant_check)
-    
-    # Check 2: Transaction amount limit
-    amount_check = {
-        'rule': 'MAX_TRANSACTION_AMOUNT',
-        'result': 'PASS' if amount <= 5000 else 'FAIL',
-        'expected': '≤ 5000',
-        'actual': amount
-    }
-    
-    if amount > 5000:
-        all_passed = False
+    recipient_type = 'VERIFIED_MERCHANT' if merchant in VERIFIED_MERCHANTS else 'UNVERIFIED'
+    facts = facts_from_payload({
+        'action': 'PAY_BILL',
+        'amount': amount,
+        'merchant': merchant,
+        'recipient_type': recipient_type
+    })
+    decision, fired_rule = payment_policy.evaluate(facts)
+    passed = decision == 'ALLOW'
     
-    checks.append(amount_check)
+    checks = [
+        {
+            'rule': 'MERCHANT_ALLOWLIST',
+            'result': 'PASS',
+            'actual': recipient_type
+        },
+        {
+            'rule': 'MAX_TRANSACTION_AMOUNT',
+            'result': 'PASS' if passed else 'FAIL',
+            'actual': amount,
+            'reason': f'Allowed by {fired_rule}' if passed else f'No execute_payment scenario allows ₹{amount} to a {recipient_type} recipient ({decision})'
+        }
+    ]
     
     return {
-        'passed': all_passed,
-        'checks': checks
+        'passed': passed,
+        'checks': checks,
+        'decision': decision,
+        'rule': fired_rule,
+        'policy_version': policy.version
     }
 
 def build_execution_trace(user_input: str, amount: float, merchant: str, policy_result: dict) -> dict:
@@ -170,11 +228,37 @@ def build_execution_trace(user_input: str, amount: float, merchant: str, policy_
         'payload': outcome_payload
     })
     
-    return {
+    return record_trace({
         'stages': stages,
         'timestamp': datetime.utcnow().isoformat() + 'Z',
-        'execution_id': f'exec_{datetime.utcnow().timestamp()}'
-    }
+        'execution_id': f'exec_{uuid.uuid4().hex}',
+        'policy_version': policy_result.get('policy_version')
+    })
+
+def payment_trace_for_request(user_input):
+    """
+    Evaluate a bill-payment request against policy and build its trace
+    """
+    # Parse the request to extract intent
+    # For demo, we'll use simple keyword matching
+    # In production, this would use LLM for intent extraction
+    
+    amount = 6200  # Default from user request
+    merchant = 'ELECTRICITY_BOARD'
+    
+    # Try to extract amount from user input
+    if 'electricity' in user_input.lower():
+        merchant = 'ELECTRICITY_BOARD'
+    elif 'water' in user_input.lower():
+        merchant = 'WATER_UTILITY'
+    elif 'telecom' in user_input.lower() or 'phone' in user_input.lower():
+        merchant = 'TELECOM_PROVIDER'
+    
+    # Evaluate against policy
+    policy_result = evaluate_payment_policy(amount, merchant, POLICY_MANAGER.current())
+    
+    # Build execution trace
+    return build_execution_trace(user_input, amount, merchant, policy_result)
 
 @app.route('/api/execute', methods=['POST'])
 def execute_request():
@@ -187,26 +271,7 @@ def execute_request():
         
         logger.info(f"Received execution request: {user_input}")
         
-        # Parse the request to extract intent
-        # For demo, we'll use simple keyword matching
-        # In production, this would use LLM for intent extraction
-        
-        amount = 6200  # Default from user request
-        merchant = 'ELECTRICITY_BOARD'
-        
-        # Try to extract amount from user input
-        if 'electricity' in user_input.lower():
-            merchant = 'ELECTRICITY_BOARD'
-        elif 'water' in user_input.lower():
-            merchant = 'WATER_UTILITY'
-        elif 'telecom' in user_input.lower() or 'phone' in user_input.lower():
-            merchant = 'TELECOM_PROVIDER'
-        
-        # Evaluate against policy
-        policy_result = evaluate_payment_policy(amount, merchant)
-        
-        # Build execution trace
-        trace = build_execution_trace(user_input, amount, merchant, policy_result)
+        trace = payment_trace_for_request(user_input)
         
         logger.info(f"Execution result: {trace['stages'][-1]['payload']['status']}")
         
@@ -221,68 +286,596 @@ def get_policy():
     """
     Get current policy configuration
     """
-    return jsonify(POLICY)
+    return jsonify(POLICY_MANAGER.current().document)
+
+@app.route('/api/policy/reload', methods=['POST'])
+def reload_policy():
+    """
+    Re-read the policy file now instead of waiting for the watcher
+    """
+    reloaded = POLICY_MANAGER.reload(force=True)
+    return jsonify({
+        'reloaded': reloaded,
+        'policy': POLICY_MANAGER.current().info(),
+        'error': POLICY_MANAGER.last_error
+    }), 200 if POLICY_MANAGER.last_error is None else 422
+
+@app.route('/api/policy/evaluate-batch', methods=['POST'])
+def evaluate_policy_batch():
+    """
+    Evaluate many intent-token payloads against the compiled policy in one
+    vectorized pass. Accepts {"tokens": [...]} with either full intent tokens
+    or their bare payloads; returns one decision per token, in order.
+    """
+    try:
+        data = request.json or {}
+        tokens = data.get('tokens')
+        if not isinstance(tokens, list):
+            return jsonify({'error': "'tokens' must be a list of intent tokens or payloads"}), 400
+        
+        payloads = [t.get('payload', t) if isinstance(t, dict) else t for t in tokens]
+        invalid = [i for i, payload in enumerate(payloads) if not isinstance(payload, dict)]
+        if invalid:
+            return jsonify({'error': f'Tokens at indexes {invalid} are not objects or have a non-object payload'}), 400
+        policy = POLICY_MANAGER.current()
+        results = policy.batch.evaluate(payloads)
+        
+        summary = {}
+        for i, result in enumerate(results):
+            result['index'] = i
+            result['action'] = payloads[i].get('action')
+            key = result['decision'] or 'NO_POLICY'
+            summary[key] = summary.get(key, 0) + 1
+        
+        logger.info(f"Batch policy evaluation: {len(results)} tokens, {summary}")
+        
+        return jsonify({
+            'policy_version': policy.version,
+            'count': len(results),
+            'summary': summary,
+            'decisions': results
+        })
+    
+    except Exception as e:
+        logger.error(f"Batch policy evaluation failed: {str(e)}")
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/api/health', methods=['GET'])
 def health():
     """
     Health check endpoint
     """
-    return jsonify({'status': 'healthy', 'service': 'armouriq-api'})
+    return jsonify({
+        'status': 'healthy',
+        'service': 'armouriq-api',
+        'policy_version': POLICY_MANAGER.current().version
+    })
 
-@app.route('/api/execute-with-intent', methods=['POST'])
-def execute_with_intent():
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
     """
-    Execute request using intent engine - generates questions first
+    In-process cache and hot-path counters
     """
-    try:
-        data = request.json
-        user_input = data.get('text', '')
-        user_responses = data.get('responses', None)
-        
-        logger.info(f"Intent-based execution request: {user_input}")
-        
-        # Check if we need to ask questions first
-        if not user_responses:
-            # Detect request type for context-aware fallback questions
-            user_input_lower = user_input.lower()
-            is_flight = any(word in user_input_lower for word in ['flight', 'fly', 'plane', 'airline'])
-            is_hotel = any(word in user_input_lower for word in ['hotel', 'stay', 'accommodation', 'room'])
+    return jsonify({
+        'policy': POLICY_MANAGER.current().info(),
+        'date_cache': DATE_RESOLVER.stats(),
+        'llm': provider_stats(),
+        'llm_router': LLM.stats(),
+        'llm_timeouts': {'questions': QUESTION_TIMEOUT.stats(), 'plan': PLAN_TIMEOUT.stats()},
+        'question_cache': QUESTION_CACHE.stats(),
+        'plan_cache': PLAN_CACHE.stats(),
+        'sessions': SESSION_STORE.stats(),
+        'trace_store': TRACE_STORE.stats(),
+        'checkout_sessions': CHECKOUT_CACHE.stats()
+    })
+
+# Routes LLM calls to the fastest healthy provider over shared pooled clients
+# (see llm_router.py / llm_provider.py). Defaults to OpenAI only.
+LLM = router_from_env()
+
+# Timeouts follow observed latency (1.5x p99), capped at the old fixed values
+QUESTION_TIMEOUT = AdaptiveTimeout(ceiling=10, floor=2)
+PLAN_TIMEOUT = AdaptiveTimeout(ceiling=30, floor=5)
+
+# Replaces the <Reasoning>/<Plan> markdown layout when the plan is requested as JSON
+STRUCTURED_PLAN_FORMAT = (
+    "Respond with JSON matching the given schema:\n"
+    "- reasoning: what you researched and why you recommend this option\n"
+    "- steps: the booking steps in order; fill every field of each step you can "
+    "(price as an amount with currency, website as the booking site) and use null only when unknown\n\n"
+)
+
+def build_plan_prompt(user_input, user_responses, is_flight, structured=False):
+    """
+    Build the plan-generation prompt (flight or hotel) including questionnaire answers.
+    With `structured` the answer layout is the JSON schema instead of markdown.
+    """
+    if is_flight:
+        overhead_prompt = (
+            "You are an intelligent flight booking agent researching real-world options.\n"
+            "IMPORTANT: You are providing ESTIMATES based on typical market prices. You do not have real-time pricing data.\n\n"
             
-            # Context-aware fallback questions
-            if is_flight:
-                questions = [
-                    {'id': 'q1', 'question': 'Where are you departing from (origin city)?', 'field': 'origin', 'step': 1},
-                    {'id': 'q2', 'question': 'Where are you flying to (destination city)?', 'field': 'destination', 'step': 2},
-                    {'id': 'q3', 'question': 'What is your departure date?', 'field': 'departure_date', 'step': 3},
-                    {'id': 'q4', 'question': 'How many passengers?', 'field': 'travelers', 'step': 4},
-                    {'id': 'q5', 'question': 'What is your budget per person?', 'field': 'budget', 'step': 5}
-                ]
-            elif is_hotel:
-                questions = [
-                    {'id': 'q1', 'question': 'Which city or area do you want to stay in?', 'field': 'location', 'step': 1},
-                    {'id': 'q2', 'question': 'What is your check-in date?', 'field': 'check_in', 'step': 2},
-                    {'id': 'q3', 'question': 'What is your check-out date?', 'field': 'check_out', 'step': 3},
-                    {'id': 'q4', 'question': 'How many guests?', 'field': 'travelers', 'step': 4},
-                    {'id': 'q5', 'question': 'What is your budget per night?', 'field': 'budget', 'step': 5}
-                ]
-            else:
-                # Generic travel planning
-                questions = [
-                    {'id': 'q1', 'question': 'Where do you want to travel?', 'field': 'destination', 'step': 1},
-                    {'id': 'q2', 'question': 'What are your travel dates?', 'field': 'dates', 'step': 2},
-                    {'id': 'q3', 'question': 'What is your total budget?', 'field': 'budget', 'step': 3},
-                    {'id': 'q4', 'question': 'How many people are traveling?', 'field': 'travelers', 'step': 4},
-                    {'id': 'q5', 'question': 'Any specific preferences?', 'field': 'preferences', 'step': 5}
-                ]
+            "Your job is to:\n"
+            "1. Use your knowledge of airlines that operate on the requested route\n"
+            "2. Provide a REALISTIC price estimate for the route\n"
+            "3. Recommend a specific flight option with typical departure times\n"
+            "4. Be honest about the estimate nature\n\n"
             
-            # Try to generate AI questions (with short timeout and fallback)
-            try:
-                api_key = os.getenv('GOOGLE_API_KEY')
-                logger.info(f"Attempting AI question generation (API key present: {bool(api_key)})")
-                if api_key:
-                    # Create context-aware prompt based on user request
-                    question_prompt = f"""You are a friendly travel assistant. The user asked: "{user_input}"
+            "CRITICAL PRICING GUIDELINES:\n"
+            "- Domestic Indian flights (< 2 hours): ₹3,000 - ₹8,000\n"
+            "- Domestic Indian flights (2-4 hours): ₹4,000 - ₹12,000\n"
+            "- Short international flights (India to nearby): $80 - $300\n"
+            "- International long-haul: $400+\n"
+            "- If user's budget is unrealistic, RECOMMEND a realistic price and explain why\n\n"
+        )
+        format_prompt = (
+            "Structure your response as:\n"
+            "<Reasoning>\n"
+            "Explain what airlines operate this route and provide a realistic price estimate based on typical market rates.\n"
+            "</Reasoning>\n\n"
+            
+            "<Plan>\n"
+            "**Recommended Flight:**\n\n"
+            "**Airline:** [Actual airline name]\n"
+            "**Route:** [Origin to Destination]\n"
+            "**Departure Date:** [Date]\n"
+            "**Departure Time:** [Typical time]\n"
+            "**Arrival Time:** [Typical time]\n"
+            "**Estimated Price:** [Realistic amount per person - DO NOT match unrealistic budgets]\n"
+            "**Booking Website:** [Airline website or booking platform]\n"
+            "**Why this flight:** [Brief explanation]\n\n"
+            "**Next Step:** Review the details above. If everything looks good, click 'Proceed to Book' to confirm your reservation.\n"
+            "</Plan>\n\n"
+        )
+    else:
+        overhead_prompt = (
+            "You are an intelligent hotel booking agent. Your job is to:\n"
+            "1. Research REAL hotels based on the user's requirements\n"
+            "2. Analyze which options best match their budget, dates, and preferences\n"
+            "3. Recommend ONE specific hotel you've researched\n"
+            "4. Provide complete booking details so they can proceed\n\n"
+            
+            "CRITICAL: Use your knowledge of real hotels and booking platforms. "
+            "Recommend actual properties that exist, not hypothetical examples.\n\n"
+        )
+        format_prompt = (
+            "Structure your response as:\n"
+            "<Reasoning>\n"
+            "Explain what you researched, what options you considered, and why you're recommending this specific choice.\n"
+            "</Reasoning>\n\n"
+            
+            "<Plan>\n"
+            "**Recommended Hotel:**\n\n"
+            "**Hotel Name:** [Actual hotel name]\n"
+            "**Address:** [Complete address]\n"
+            "**Check-in:** [Date and time]\n"
+            "**Check-out:** [Date and time]\n"
+            "**Price:** [Amount per night in user's currency]\n"
+            "**Booking Website:** [Booking.com or other platform]\n"
+        "**Why this hotel:** [Brief explanation of why it meets safety, budget, and location requirements]\n\n"
+        "**Next Step:** Review the details above. If everything looks good, click 'Proceed to Book' to confirm your reservation.\n"
+        "</Plan>\n\n"
+    )
+    
+    overhead_prompt += STRUCTURED_PLAN_FORMAT if structured else format_prompt
+    
+    if user_responses:
+        overhead_prompt += "\n📋 User answers:\n"
+        for response_data in user_responses:
+            answer = response_data.get('answer', '')
+            if answer not in ['yes', 'no']:
+                overhead_prompt += f"For {response_data.get('field')}: {answer}\n"
+        overhead_prompt += "\n"
+    
+    overhead_prompt += "User Request: "
+    
+    return overhead_prompt + user_input
+
+def plan_messages(full_prompt):
+    return [
+        {"role": "system", "content": "You are a professional travel research assistant. Research real options and provide specific recommendations."},
+        {"role": "user", "content": full_prompt}
+    ]
+
+# Bump whenever build_plan_prompt, plan_messages or the plan model change,
+# so cached completions from the old prompt are no longer served
+PLAN_PROMPT_VERSION = 'plan-v1'
+PLAN_JSON_PROMPT_VERSION = 'plan-json-v1'
+
+# 'json' requests the (non-streamed) plan as schema-constrained JSON built from
+# IntentEngine.ACTION_SCHEMAS; 'markdown' keeps the <Reasoning>/<Plan> layout
+PLAN_OUTPUT = os.getenv('PLAN_OUTPUT', 'markdown')
+
+def plan_request(user_input, user_responses, is_flight):
+    """
+    Messages and completion options for the plan call in the configured output mode
+    """
+    structured = PLAN_OUTPUT == 'json'
+    options = {'temperature': 0.3}
+    if structured:
+        options['response_schema'] = IntentEngine.plan_response_schema('BOOK_FLIGHT' if is_flight else 'BOOK_HOTEL')
+    return plan_messages(build_plan_prompt(user_input, user_responses, is_flight, structured)), options
+
+def plan_cache_key(user_input, user_responses, is_flight, structured=False):
+    """
+    Canonical hash of everything that shapes the plan prompt. Answers are sorted
+    so the order they were submitted in doesn't matter; yes/no answers never
+    reach the prompt and are left out.
+    """
+    answers = sorted(
+        (str(r.get('field', '')), str(r.get('answer', '')))
+        for r in user_responses or []
+        if r.get('answer', '') not in ['yes', 'no']
+    )
+    return canonical_key({
+        'request_type': 'BOOK_FLIGHT' if is_flight else 'BOOK_HOTEL',
+        'template': PLAN_JSON_PROMPT_VERSION if structured else PLAN_PROMPT_VERSION,
+        'user_input': user_input,
+        'answers': answers
+    })
+
+def extract_reasoning_and_plan(raw_text):
+    """
+    Split the plan completion into (reasoning, plan) and trim the plan to the recommendation
+    """
+    reasoning_match = re.search(r'<Reasoning>(.*?)</Reasoning>', raw_text, re.DOTALL)
+    plan_match = re.search(r'<Plan>(.*?)</Plan>', raw_text, re.DOTALL)
+    
+    reasoning_content = reasoning_match.group(1).strip() if reasoning_match else "Analyzing your request..."
+    
+    if plan_match:
+        plan_content = plan_match.group(1).strip()
+    else:
+        # If no plan tags found, try to extract content after reasoning
+        if reasoning_match:
+            # Get everything after the </Reasoning> tag
+            after_reasoning = raw_text.split('</Reasoning>', 1)
+            plan_content = after_reasoning[1].strip() if len(after_reasoning) > 1 else raw_text
+        else:
+            plan_content = raw_text
+    
+    # Remove any remaining XML-style tags from plan content  
+    plan_content = re.sub(r'</?(?:Reasoning|Plan)>', '', plan_content).strip()
+    
+    # Remove duplicate reasoning text from plan if present
+    # Split by common delimiters and only keep content starting from "**Recommended"
+    if '**Recommended' in plan_content:
+        plan_content = plan_content[plan_content.index('**Recommended'):]
+    elif '**Hotel Name:**' in plan_content:
+        plan_content = plan_content[plan_content.index('**Hotel Name:**'):]
+    elif '**Airline:**' in plan_content:
+        plan_content = plan_content[plan_content.index('**Airline:**'):]
+    return reasoning_content, plan_content
+
+def collect_user_data(user_responses):
+    """
+    Questionnaire answers as {field: answer}
+    """
+    user_data = {}
+    if user_responses:
+        for response_data in user_responses:
+            field = response_data.get('field', '')
+            answer = response_data.get('answer', '')
+            if field and answer:
+                user_data[field] = answer
+    return user_data
+
+def extract_booking_info(plan_content):
+    """
+    Extract hotel/flight details that the AI recommended in its plan
+    """
+    booking_info = {}
+    if plan_content:
+        hotel_match = re.search(r'\*\*(?:Hotel Name|Airline):\*\*\s*(.+)', plan_content)
+        website_match = re.search(r'\*\*Booking (?:Website|Platform):\*\*\s*(.+)', plan_content)
+        price_match = re.search(r'\*\*(?:Estimated )?Price:\*\*\s*(.+)', plan_content)
+        address_match = re.search(r'\*\*Address:\*\*\s*(.+)', plan_content)
+        route_match = re.search(r'\*\*Route:\*\*\s*(.+)', plan_content)
+        
+        if hotel_match:
+            booking_info['hotel_name'] = hotel_match.group(1).strip()
+        if website_match:
+            booking_info['website'] = website_match.group(1).strip()
+        if price_match:
+            booking_info['price'] = price_match.group(1).strip()
+        if address_match:
+            booking_info['location'] = address_match.group(1).strip()
+        if route_match:
+            # For flights: "BOM to LON" -> extract origin and destination
+            route = route_match.group(1).strip()
+            if ' to ' in route.lower():
+                parts = route.split(' to ')
+                if len(parts) == 2:
+                    booking_info['origin'] = parts[0].strip()
+                    booking_info['destination'] = parts[1].strip()
+    return booking_info
+
+def build_step_intent_token(step, user_data, booking_info, primary_action):
+    """
+    Generate the intent token for one plan step, merged with questionnaire answers and booking details
+    """
+    # Merge user-provided data with extracted structured data
+    structured_data = step['structured_data'].copy() if step['structured_data'] else {}
+    
+    # Intelligently map questionnaire fields to structured data
+    for field, value in user_data.items():
+        if not value:
+            continue
+            
+        # Direct field matches
+        if field in structured_data:
+            continue  # Don't override existing parsed data
+        
+        # Smart field mapping based on field name patterns
+        field_lower = field.lower()
+        
+        # Origin/departure mappings
+        if any(x in field_lower for x in ['origin', 'departure', 'departing', 'from']):
+            if 'origin' not in structured_data:
+                structured_data['origin'] = value
+        
+        # Destination/location mappings
+        if any(x in field_lower for x in ['destination', 'location', 'where', 'city']):
+            if 'destination' not in structured_data:
+                structured_data['destination'] = value
+        
+        # Date mappings (all date-related fields)
+        if any(x in field_lower for x in ['date', 'when', 'check_in', 'check_out', 'checkin', 'checkout']):
+            if 'date' not in structured_data:
+                structured_data['date'] = value
+        
+        # Budget/price mappings
+        if any(x in field_lower for x in ['budget', 'cost']):
+            if 'budget' not in structured_data:
+                structured_data['budget'] = value
+        
+        # Travelers/guests mappings
+        if any(x in field_lower for x in ['traveler', 'people', 'guest', 'person', 'pax']):
+            if 'travelers' not in structured_data:
+                structured_data['travelers'] = value
+        
+        # Preferences mappings
+        if any(x in field_lower for x in ['preference', 'requirement', 'special', 'note']):
+            if 'preferences' not in structured_data:
+                structured_data['preferences'] = value
+        
+        # Also add the raw field for reference
+        structured_data[field] = value
+    
+    # Merge booking info extracted from AI's plan (hotel_name, website, price, etc.)
+    # Price from AI should always override/supplement user budget
+    for key, value in booking_info.items():
+        if key == 'price':  # Always add AI's recommended price
+            structured_data['price'] = value
+        elif key not in structured_data and value:
+            structured_data[key] = value
+    
+    # Generate token with primary action override from user request
+    token = IntentEngine.generate_intent_token(
+        step['step_number'],
+        step['description'],
+        structured_data
+    )
+    
+    # Override action type with primary action detected from user request
+    if primary_action and token.get('payload'):
+        token['payload']['action'] = primary_action
+
+    
+    return token
+
+def intent_tokens_from_plan(plan_content, user_responses, primary_action):
+    """
+    Parse plan steps and generate their intent tokens with user responses
+    """
+    user_data = collect_user_data(user_responses)
+    booking_info = extract_booking_info(plan_content)
+    steps = parse_step_wise_plan(plan_content)
+    return [build_step_intent_token(step, user_data, booking_info, primary_action) for step in steps]
+
+def stream_intent_execution(user_input, user_responses):
+    """
+    Generate the plan from a streamed completion. Yields reasoning deltas, each
+    completed step with a provisional intent token as soon as the next step
+    marker arrives, and finally the authoritative trace built from the full text.
+    """
+    request_matches = REQUEST_CLASSIFIER.scan(user_input)
+    is_flight = 'BOOK_FLIGHT' in request_matches
+    primary_action = next(iter(request_matches), None)
+    user_data = collect_user_data(user_responses)
+    
+    parser = StreamingPlanParser(split_response=extract_reasoning_and_plan)
+    
+    def token_for_step(step):
+        # Booking details from the complete plan lines received so far
+        plan_so_far = parser.plan_text
+        plan_so_far = plan_so_far[:plan_so_far.rfind('\n') + 1]
+        return build_step_intent_token(step, user_data, extract_booking_info(plan_so_far), primary_action)
+    
+    parser.token_factory = token_for_step
+    
+    # Answers that already violate policy end the stream before the LLM is called
+    blocked = preflight_policy_check(user_input, user_responses, primary_action)
+    if blocked is not None:
+        yield {'type': 'trace', 'trace': blocked}
+        return
+    
+    # A cached completion is replayed through the parser as a single chunk
+    cache_key = plan_cache_key(user_input, user_responses, is_flight)
+    cached_text = PLAN_CACHE.get(cache_key)
+    if cached_text is not None:
+        yield from parser.feed(cached_text)
+    else:
+        full_prompt = build_plan_prompt(user_input, user_responses, is_flight)
+        received = []
+        # Time the whole stream so streamed plans train the adaptive timeout too
+        # (an abandoned stream exits with GeneratorExit and is not recorded)
+        with PLAN_TIMEOUT.measure() as timeout:
+            for delta in LLM.stream(plan_messages(full_prompt), temperature=0.3, timeout=timeout):
+                received.append(delta)
+                yield from parser.feed(delta)
+        PLAN_CACHE.put(cache_key, ''.join(received))
+    
+    done = None
+    for event in parser.close():
+        if event['type'] == 'done':
+            done = event
+        else:
+            yield event
+    
+    intent_tokens = intent_tokens_from_plan(done['plan'], user_responses, primary_action)
+    trace = build_trace_from_intents(user_input, intent_tokens, done['reasoning'], done['plan'])
+    yield {'type': 'trace', 'trace': trace}
+
+def plan_inputs(user_input, user_responses):
+    """
+    Request type, primary action and plan-cache key for a plan request
+    """
+    # Detect request type (one scan; reused for the primary action below)
+    request_matches = REQUEST_CLASSIFIER.scan(user_input)
+    is_flight = 'BOOK_FLIGHT' in request_matches
+    primary_action = next(iter(request_matches), None)
+    return is_flight, primary_action, plan_cache_key(user_input, user_responses, is_flight, PLAN_OUTPUT == 'json')
+
+def is_json_plan(plan):
+    """
+    Whether a decoded structured plan has the shape IntentEngine.plan_response_schema asks for
+    """
+    if not isinstance(plan, dict) or not isinstance(plan.get('reasoning'), str):
+        return False
+    steps = plan.get('steps')
+    if not isinstance(steps, list):
+        return False
+    return all(
+        isinstance(step, dict) and isinstance(step.get('description'), str) and isinstance(step.get('fields'), dict)
+        for step in steps
+    )
+
+def json_plan_text(plan):
+    """
+    Plan stage lines for a structured plan: each step followed by its fields
+    """
+    lines = []
+    for number, step in enumerate(plan['steps'], 1):
+        lines.append(f"Step {number}: {step['description']}")
+        for field, value in step['fields'].items():
+            if value:
+                lines.append(f"**{field.replace('_', ' ').title()}:** {value}")
+    return '\n'.join(lines)
+
+def intent_tokens_from_json_plan(plan, user_responses, primary_action):
+    """
+    Intent tokens straight from a structured plan's step fields, merged with the answers
+    """
+    user_data = collect_user_data(user_responses)
+    tokens = []
+    for number, step in enumerate(plan['steps'], 1):
+        structured_data = {field: str(value) for field, value in step['fields'].items() if value not in (None, '')}
+        step = {'step_number': number, 'description': step['description'], 'structured_data': structured_data}
+        tokens.append(build_step_intent_token(step, user_data, {}, primary_action))
+    return tokens
+
+def trace_from_plan_text(user_input, user_responses, primary_action, raw_text):
+    """
+    Parse a plan completion, generate intent tokens and build the validated trace
+    """
+    if PLAN_OUTPUT == 'json':
+        try:
+            plan = json.loads(raw_text)
+        except ValueError:
+            plan = None
+        if is_json_plan(plan):
+            intent_tokens = intent_tokens_from_json_plan(plan, user_responses, primary_action)
+            return build_trace_from_intents(user_input, intent_tokens, plan['reasoning'], json_plan_text(plan))
+        # A provider that ignored the schema; fall back to the markdown parser
+        logger.warning("Structured plan did not match the plan schema, parsing as markdown")
+    
+    # Extract reasoning and plan
+    reasoning_content, plan_content = extract_reasoning_and_plan(raw_text)
+    
+    # Parse steps and generate intent tokens with user responses
+    # (primary action detected from original user request, not from plan steps)
+    intent_tokens = intent_tokens_from_plan(plan_content, user_responses, primary_action)
+    
+    # Build execution trace with intent tokens
+    return build_trace_from_intents(user_input, intent_tokens, reasoning_content, plan_content)
+
+def ndjson_stream(events):
+    """
+    Serialize events as newline-delimited JSON, reporting failures in-band
+    """
+    try:
+        for event in events:
+            yield json.dumps(event) + '\n'
+    except Exception as e:
+        logger.error(f"Streaming execution failed: {str(e)}")
+        yield json.dumps({'type': 'error', 'error': str(e)}) + '\n'
+
+def fallback_questions(request_matches):
+    """
+    Context-aware fallback questions for the detected request type
+    """
+    is_flight = 'BOOK_FLIGHT' in request_matches
+    is_hotel = 'BOOK_HOTEL' in request_matches
+    
+    # Context-aware fallback questions
+    if is_flight:
+        questions = [
+            {'id': 'q1', 'question': 'Where are you departing from (origin city)?', 'field': 'origin', 'step': 1},
+            {'id': 'q2', 'question': 'Where are you flying to (destination city)?', 'field': 'destination', 'step': 2},
+            {'id': 'q3', 'question': 'What is your departure date?', 'field': 'departure_date', 'step': 3},
+            {'id': 'q4', 'question': 'How many passengers?', 'field': 'travelers', 'step': 4},
+            {'id': 'q5', 'question': 'What is your budget per person?', 'field': 'budget', 'step': 5}
+        ]
+    elif is_hotel:
+        questions = [
+            {'id': 'q1', 'question': 'Which city or area do you want to stay in?', 'field': 'location', 'step': 1},
+            {'id': 'q2', 'question': 'What is your check-in date?', 'field': 'check_in', 'step': 2},
+            {'id': 'q3', 'question': 'What is your check-out date?', 'field': 'check_out', 'step': 3},
+            {'id': 'q4', 'question': 'How many guests?', 'field': 'travelers', 'step': 4},
+            {'id': 'q5', 'question': 'What is your budget per night?', 'field': 'budget', 'step': 5}
+        ]
+    else:
+        # Generic travel planning
+        questions = [
+            {'id': 'q1', 'question': 'Where do you want to travel?', 'field': 'destination', 'step': 1},
+            {'id': 'q2', 'question': 'What are your travel dates?', 'field': 'dates', 'step': 2},
+            {'id': 'q3', 'question': 'What is your total budget?', 'field': 'budget', 'step': 3},
+            {'id': 'q4', 'question': 'How many people are traveling?', 'field': 'travelers', 'step': 4},
+            {'id': 'q5', 'question': 'Any specific preferences?', 'field': 'preferences', 'step': 5}
+        ]
+    
+    return questions
+
+def prepare_questions(user_input):
+    """
+    First-round questions before asking the LLM: cached AI questions for an
+    equivalent earlier request, else the fallback set. Returns
+    (questions, cache_key, generate) where generate says whether to ask the LLM.
+    """
+    # Detect request type for context-aware fallback questions
+    request_matches = REQUEST_CLASSIFIER.scan(user_input)
+    questions = fallback_questions(request_matches)
+    
+    # Reuse questions generated for an equivalent earlier request
+    cache_key = normalize_request(next(iter(request_matches), 'GENERAL'), user_input)
+    cached_questions = QUESTION_CACHE.get(cache_key)
+    if cached_questions is not None:
+        logger.info("✓ Using cached AI-generated questions")
+        return cached_questions, cache_key, False
+    
+    api_key = os.getenv('GOOGLE_API_KEY')
+    logger.info(f"Attempting AI question generation (API key present: {bool(api_key)})")
+    if api_key:
+        logger.info(f"Requesting AI-generated questions for: {user_input}")
+    return questions, cache_key, bool(api_key)
+
+def question_messages(user_input):
+    """
+    Chat messages asking the LLM for five clarifying questions
+    """
+    # Create context-aware prompt based on user request
+    question_prompt = f"""You are a friendly travel assistant. The user asked: "{user_input}"
 
 Analyze what they're asking for and generate EXACTLY 5 essential questions to help complete their request.
 
@@ -313,317 +906,152 @@ IMPORTANT:
 - For flights, ALWAYS ask origin and destination as SEPARATE questions
 - Use simple field names: origin, destination, departure_date, check_in, check_out, location, budget, travelers
 - Output ONLY the JSON array, no other text"""
+    
+    return [
+        {"role": "system", "content": "You are a helpful travel planning assistant. Always respond with valid JSON."},
+        {"role": "user", "content": question_prompt}
+    ]
 
-                    # Use OpenAI API instead of Gemini
-                    openai_key = os.getenv('OPENAI_API_KEY')
-                    if not openai_key:
-                        raise ValueError('OPENAI_API_KEY not found in environment')
-                    
-                    q_url = "https://api.openai.com/v1/chat/completions"
-                    q_payload = {
-                        "model": "gpt-4o-mini",
-                        "messages": [
-                            {"role": "system", "content": "You are a helpful travel planning assistant. Always respond with valid JSON."},
-                            {"role": "user", "content": question_prompt}
-                        ],
-                        "temperature": 0.7
-                    }
-                    
-                    logger.info(f"Requesting AI-generated questions for: {user_input}")
-                    q_response = requests.post(
-                        q_url, 
-                        json=q_payload, 
-                        headers={"Authorization": f"Bearer {openai_key}"},
-                        timeout=10
-                    )
-                    q_response.raise_for_status()
-                    q_data = q_response.json()
-                    q_text = q_data['choices'][0]['message']['content'].strip()
-                    # Remove markdown code blocks if present
-                    q_text = re.sub(r'^```json\s*', '', q_text)
-                    q_text = re.sub(r'```\s*$', '', q_text)
-                    
-                    questions = json.loads(q_text)
-                    logger.info("✓ Using AI-generated questions")
-            except Exception as e:
-                logger.warning(f"Question generation failed ({type(e).__name__}), using fallback")
-            
-            # Add metadata for frontend
-            for i, q in enumerate(questions):
-                if 'step' not in q:
-                    q['step'] = i + 1
-                q['why_asking'] = 'This helps us find the best options for your trip.'
-                q['budget_info'] = '💰 Typical range: $100 - $800 per person'
-                
-            return jsonify({
-                'needs_questions': True,
-                'questions': questions,
-                'reasoning': 'Let me gather some details to plan your perfect trip...'
-            })
-        
-        # User has answered questions, now generate the travel plan
-        logger.info("User responses received, generating travel plan...")
-        
-        # Detect request type
-        user_input_lower = user_input.lower()
-        is_flight = any(word in user_input_lower for word in ['flight', 'fly', 'plane', 'airline'])
-        
-        # Generate plan with intent engine
-        if is_flight:
-            overhead_prompt = (
-                "You are an intelligent flight booking agent researching real-world options.\n"
-                "IMPORTANT: You are providing ESTIMATES based on typical market prices. You do not have real-time pricing data.\n\n"
-                
-                "Your job is to:\n"
-                "1. Use your knowledge of airlines that operate on the requested route\n"
-                "2. Provide a REALISTIC price estimate for the route\n"
-                "3. Recommend a specific flight option with typical departure times\n"
-                "4. Be honest about the estimate nature\n\n"
-                
-                "CRITICAL PRICING GUIDELINES:\n"
-                "- Domestic Indian flights (< 2 hours): ₹3,000 - ₹8,000\n"
-                "- Domestic Indian flights (2-4 hours): ₹4,000 - ₹12,000\n"
-                "- Short international flights (India to nearby): $80 - $300\n"
-                "- International long-haul: $400+\n"
-                "- If user's budget is unrealistic, RECOMMEND a realistic price and explain why\n\n"
-                
-                "Structure your response as:\n"
-                "<Reasoning>\n"
-                "Explain what airlines operate this route and provide a realistic price estimate based on typical market rates.\n"
-                "</Reasoning>\n\n"
-                
-                "<Plan>\n"
-                "**Recommended Flight:**\n\n"
-                "**Airline:** [Actual airline name]\n"
-                "**Route:** [Origin to Destination]\n"
-                "**Departure Date:** [Date]\n"
-                "**Departure Time:** [Typical time]\n"
-                "**Arrival Time:** [Typical time]\n"
-                "**Estimated Price:** [Realistic amount per person - DO NOT match unrealistic budgets]\n"
-                "**Booking Website:** [Airline website or booking platform]\n"
-                "**Why this flight:** [Brief explanation]\n\n"
-                "**Next Step:** Review the details above. If everything looks good, click 'Proceed to Book' to confirm your reservation.\n"
-                "</Plan>\n\n"
-            )
-        else:
-            overhead_prompt = (
-                "You are an intelligent hotel booking agent. Your job is to:\n"
-                "1. Research REAL hotels based on the user's requirements\n"
-                "2. Analyze which options best match their budget, dates, and preferences\n"
-                "3. Recommend ONE specific hotel you've researched\n"
-                "4. Provide complete booking details so they can proceed\n\n"
-                
-                "CRITICAL: Use your knowledge of real hotels and booking platforms. "
-                "Recommend actual properties that exist, not hypothetical examples.\n\n"
-                
-                "Structure your response as:\n"
-                "<Reasoning>\n"
-                "Explain what you researched, what options you considered, and why you're recommending this specific choice.\n"
-                "</Reasoning>\n\n"
-                
-                "<Plan>\n"
-                "**Recommended Hotel:**\n\n"
-                "**Hotel Name:** [Actual hotel name]\n"
-                "**Address:** [Complete address]\n"
-                "**Check-in:** [Date and time]\n"
-                "**Check-out:** [Date and time]\n"
-                "**Price:** [Amount per night in user's currency]\n"
-                "**Booking Website:** [Booking.com or other platform]\n"
-            "**Why this hotel:** [Brief explanation of why it meets safety, budget, and location requirements]\n\n"
-            "**Next Step:** Review the details above. If everything looks good, click 'Proceed to Book' to confirm your reservation.\n"
-            "</Plan>\n\n"
-        )
-        
-        if user_responses:
-            overhead_prompt += "\n📋 User answers:\n"
-            for response_data in user_responses:
-                answer = response_data.get('answer', '')
-                if answer not in ['yes', 'no']:
-                    overhead_prompt += f"For {response_data.get('field')}: {answer}\n"
-            overhead_prompt += "\n"
-        
-        overhead_prompt += "User Request: "
-        full_prompt = overhead_prompt + user_input
-        
-        # Use OpenAI API instead of Gemini
-        import requests
-        openai_key = os.getenv('OPENAI_API_KEY')
-        if not openai_key:
-            raise ValueError('OPENAI_API_KEY not found in environment')
-        
-        url = "https://api.openai.com/v1/chat/completions"
-        payload = {
-            "model": "gpt-4o-mini",
-            "messages": [
-                {"role": "system", "content": "You are a professional travel research assistant. Research real options and provide specific recommendations."},
-                {"role": "user", "content": full_prompt}
-            ],
-            "temperature": 0.3
-        }
-        
-        response = requests.post(
-            url, 
-            json=payload,
-            headers={"Authorization": f"Bearer {openai_key}"},
-            timeout=30
-        )
-        response.raise_for_status()
-        response_data = response.json()
-        raw_text = response_data['choices'][0]['message']['content']
-        
-        # Extract reasoning and plan
-        reasoning_match = re.search(r'<Reasoning>(.*?)</Reasoning>', raw_text, re.DOTALL)
-        plan_match = re.search(r'<Plan>(.*?)</Plan>', raw_text, re.DOTALL)
-        
-        reasoning_content = reasoning_match.group(1).strip() if reasoning_match else "Analyzing your request..."
-        
-        if plan_match:
-            plan_content = plan_match.group(1).strip()
+def accept_ai_questions(cache_key, q_text):
+    """
+    Parse the LLM's question list and cache it
+    """
+    q_text = q_text.strip()
+    # Remove markdown code blocks if present
+    q_text = re.sub(r'^```json\s*', '', q_text)
+    q_text = re.sub(r'```\s*$', '', q_text)
+    
+    questions = json.loads(q_text)
+    logger.info("✓ Using AI-generated questions")
+    if isinstance(questions, list) and questions:
+        QUESTION_CACHE.put(cache_key, questions)
+    return questions
+
+def questions_response(questions):
+    """
+    First-round response body: questions with metadata for the frontend
+    """
+    # Add metadata for frontend
+    for i, q in enumerate(questions):
+        if 'step' not in q:
+            q['step'] = i + 1
+        q['why_asking'] = 'This helps us find the best options for your trip.'
+        q['budget_info'] = '💰 Typical range: $100 - $800 per person'
+    
+    return {
+        'needs_questions': True,
+        'questions': questions,
+        'reasoning': 'Let me gather some details to plan your perfect trip...'
+    }
+
+# The question and plan flows are generators shared by the sync (Flask) and
+# async (asgi.py) servers: each LLM call is yielded as (timeout policy,
+# messages, options) and the completion text (or the call's exception) is
+# sent back in. Drivers perform the calls; the async one also runs every
+# step between calls in a worker thread, since steps touch SQLite and disk.
+
+def advance(flow, value=None, error=None):
+    """
+    Resume a flow with an LLM result or error.
+    Returns (False, next LLM call) or (True, the flow's result).
+    """
+    try:
+        if error is not None:
+            return False, flow.throw(error)
+        return False, flow.send(value)
+    except StopIteration as stop:
+        return True, stop.value
+
+def run_flow(flow):
+    """
+    Drive a flow to completion with blocking LLM calls
+    """
+    done, step = advance(flow)
+    while not done:
+        timeout_policy, messages, options = step
+        try:
+            with timeout_policy.measure() as timeout:
+                text = LLM.complete(messages, timeout=timeout, **options)
+        except Exception as e:
+            done, step = advance(flow, error=e)
         else:
-            # If no plan tags found, try to extract content after reasoning
-            if reasoning_match:
-                # Get everything after the </Reasoning> tag
-                after_reasoning = raw_text.split('</Reasoning>', 1)
-                plan_content = after_reasoning[1].strip() if len(after_reasoning) > 1 else raw_text
-            else:
-                plan_content = raw_text
-        
-        # Remove any remaining XML-style tags from plan content  
-        plan_content = re.sub(r'</?(?:Reasoning|Plan)>', '', plan_content).strip()
-        
-        # Remove duplicate reasoning text from plan if present
-        # Split by common delimiters and only keep content starting from "**Recommended"
-        if '**Recommended' in plan_content:
-            plan_content = plan_content[plan_content.index('**Recommended'):]
-        elif '**Hotel Name:**' in plan_content:
-            plan_content = plan_content[plan_content.index('**Hotel Name:**'):]
-        elif '**Airline:**' in plan_content:
-            plan_content = plan_content[plan_content.index('**Airline:**'):]
-        
-        # Extract user-provided data from responses
-        user_data = {}
-        if user_responses:
-            for response_data in user_responses:
-                field = response_data.get('field', '')
-                answer = response_data.get('answer', '')
-                if field and answer:
-                    user_data[field] = answer
+            done, step = advance(flow, text)
+    return step
+
+def question_flow(user_input):
+    """
+    First-round questions: cached, AI-generated, or the fallback set
+    """
+    questions, cache_key, generate = prepare_questions(user_input)
+    
+    # Try to generate AI questions (with short timeout and fallback)
+    if generate:
+        try:
+            # No retries: the fallback questions are ready, so don't keep the user
+            # waiting. While the provider's circuit is open this fails immediately.
+            q_text = yield QUESTION_TIMEOUT, question_messages(user_input), {'temperature': 0.7, 'max_retries': 0}
+            questions = accept_ai_questions(cache_key, q_text)
+        except Exception as e:
+            logger.warning(f"Question generation failed ({type(e).__name__}), using fallback")
+    
+    return questions
+
+def plan_flow(user_input, user_responses):
+    """
+    Plan for answered questions: pre-flight policy check, cached or generated
+    plan, intent tokens and the validated trace
+    """
+    is_flight, primary_action, cache_key = plan_inputs(user_input, user_responses)
+    
+    # Answers that already violate policy are blocked without calling the LLM
+    blocked = preflight_policy_check(user_input, user_responses, primary_action)
+    if blocked is not None:
+        return blocked
+    
+    # Identical prompt inputs replay the cached completion
+    raw_text = PLAN_CACHE.get(cache_key)
+    
+    if raw_text is None:
+        # Generate plan with intent engine
+        messages, options = plan_request(user_input, user_responses, is_flight)
+        raw_text = yield PLAN_TIMEOUT, messages, options
+        PLAN_CACHE.put(cache_key, raw_text)
+    else:
+        logger.info("✓ Replaying cached plan completion")
+    
+    return trace_from_plan_text(user_input, user_responses, primary_action, raw_text)
+
+def generate_questions(user_input):
+    return run_flow(question_flow(user_input))
+
+def generate_trace(user_input, user_responses):
+    return run_flow(plan_flow(user_input, user_responses))
+
+@app.route('/api/execute-with-intent', methods=['POST'])
+def execute_with_intent():
+    """
+    Execute request using intent engine - generates questions first
+    """
+    try:
+        data = request.json
+        user_input = data.get('text', '')
+        user_responses = data.get('responses', None)
         
-        # Extract booking details from AI's plan to satisfy intent validation
-        booking_info = {}
-        if plan_content:
-            # Extract hotel/flight details that AI recommended
-            hotel_match = re.search(r'\*\*(?:Hotel Name|Airline):\*\*\s*(.+)', plan_content)
-            website_match = re.search(r'\*\*Booking (?:Website|Platform):\*\*\s*(.+)', plan_content)
-            price_match = re.search(r'\*\*(?:Estimated )?Price:\*\*\s*(.+)', plan_content)
-            address_match = re.search(r'\*\*Address:\*\*\s*(.+)', plan_content)
-            route_match = re.search(r'\*\*Route:\*\*\s*(.+)', plan_content)
-            
-            if hotel_match:
-                booking_info['hotel_name'] = hotel_match.group(1).strip()
-            if website_match:
-                booking_info['website'] = website_match.group(1).strip()
-            if price_match:
-                booking_info['price'] = price_match.group(1).strip()
-            if address_match:
-                booking_info['location'] = address_match.group(1).strip()
-            if route_match:
-                # For flights: "BOM to LON" -> extract origin and destination
-                route = route_match.group(1).strip()
-                if ' to ' in route.lower():
-                    parts = route.split(' to ')
-                    if len(parts) == 2:
-                        booking_info['origin'] = parts[0].strip()
-                        booking_info['destination'] = parts[1].strip()
+        logger.info(f"Intent-based execution request: {user_input}")
         
-        # Parse steps and generate intent tokens with user responses
-        steps = parse_step_wise_plan(plan_content)
+        # Check if we need to ask questions first
+        if not user_responses:
+            return jsonify(questions_response(generate_questions(user_input)))
         
-        # Detect primary action type from original user request (not from plan steps)
-        user_input_lower = user_input.lower()
-        primary_action = None
-        if any(word in user_input_lower for word in ['flight', 'fly', 'airplane', 'plane']):
-            primary_action = 'BOOK_FLIGHT'
-        elif any(word in user_input_lower for word in ['hotel', 'accommodation', 'stay', 'room']):
-            primary_action = 'BOOK_HOTEL'
-        elif any(word in user_input_lower for word in ['train', 'rail']):
-            primary_action = 'BOOK_TRAIN'
-        elif any(word in user_input_lower for word in ['restaurant', 'dinner', 'lunch']):
-            primary_action = 'BOOK_RESTAURANT'
-        intent_tokens = []
+        # User has answered questions, now generate the travel plan
+        logger.info("User responses received, generating travel plan...")
         
-        for step in steps:
-            # Merge user-provided data with extracted structured data
-            structured_data = step['structured_data'].copy() if step['structured_data'] else {}
-            
-            # Intelligently map questionnaire fields to structured data
-            for field, value in user_data.items():
-                if not value:
-                    continue
-                    
-                # Direct field matches
-                if field in structured_data:
-                    continue  # Don't override existing parsed data
-                
-                # Smart field mapping based on field name patterns
-                field_lower = field.lower()
-                
-                # Origin/departure mappings
-                if any(x in field_lower for x in ['origin', 'departure', 'departing', 'from']):
-                    if 'origin' not in structured_data:
-                        structured_data['origin'] = value
-                
-                # Destination/location mappings
-                if any(x in field_lower for x in ['destination', 'location', 'where', 'city']):
-                    if 'destination' not in structured_data:
-                        structured_data['destination'] = value
-                
-                # Date mappings (all date-related fields)
-                if any(x in field_lower for x in ['date', 'when', 'check_in', 'check_out', 'checkin', 'checkout']):
-                    if 'date' not in structured_data:
-                        structured_data['date'] = value
-                
-                # Budget/price mappings
-                if any(x in field_lower for x in ['budget', 'cost']):
-                    if 'budget' not in structured_data:
-                        structured_data['budget'] = value
-                
-                # Travelers/guests mappings
-                if any(x in field_lower for x in ['traveler', 'people', 'guest', 'person', 'pax']):
-                    if 'travelers' not in structured_data:
-                        structured_data['travelers'] = value
-                
-                # Preferences mappings
-                if any(x in field_lower for x in ['preference', 'requirement', 'special', 'note']):
-                    if 'preferences' not in structured_data:
-                        structured_data['preferences'] = value
-                
-                # Also add the raw field for reference
-                structured_data[field] = value
-            
-            # Merge booking info extracted from AI's plan (hotel_name, website, price, etc.)
-            # Price from AI should always override/supplement user budget
-            for key, value in booking_info.items():
-                if key == 'price':  # Always add AI's recommended price
-                    structured_data['price'] = value
-                elif key not in structured_data and value:
-                    structured_data[key] = value
-            
-            # Generate token with primary action override from user request
-            token = IntentEngine.generate_intent_token(
-                step['step_number'],
-                step['description'],
-                structured_data
-            )
-            
-            # Override action type with primary action detected from user request
-            if primary_action and token.get('payload'):
-                token['payload']['action'] = primary_action
-            
-            intent_tokens.append(token)
+        # Streaming mode: emit reasoning and each completed step as the LLM produces them
+        if data.get('stream'):
+            events = stream_intent_execution(user_input, user_responses)
+            return Response(stream_with_context(ndjson_stream(events)), mimetype='application/x-ndjson')
         
-        # Build execution trace with intent tokens
-        trace = build_trace_from_intents(user_input, intent_tokens, reasoning_content, plan_content)
+        trace = generate_trace(user_input, user_responses)
         
         logger.info(f"Intent-based execution completed")
         return jsonify(trace)
@@ -632,84 +1060,305 @@ IMPORTANT:
         logger.error(f"Error in intent execution: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
-def validate_policy_rules(intent_tokens):
+SSE_RETRY_MS = 10000
+
+def sse_event(event, data):
+    """
+    Format one Server-Sent Event
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_trace_stages(user_input, user_responses):
+    """
+    Yield trace stages as Server-Sent Events the moment each is available:
+    USER_INPUT immediately, REASONING as the LLM streams it, then PLAN,
+    INTENT_TOKEN and MCP_OUTCOME once the plan is complete and validated.
+    """
+    # Tell EventSource-style clients to back off instead of reconnecting immediately
+    yield f"retry: {SSE_RETRY_MS}\n\n"
+
+    sent = {'USER_INPUT'}
+    yield sse_event('stage', {'type': 'USER_INPUT', 'payload': {'text': user_input}})
+
+    try:
+        for event in stream_intent_execution(user_input, user_responses):
+            if event['type'] == 'reasoning_delta':
+                yield sse_event('reasoning_delta', {'text': event['text']})
+            elif event['type'] == 'reasoning':
+                sent.add('REASONING')
+                yield sse_event('stage', {'type': 'REASONING', 'payload': {'text': event['text']}})
+            elif event['type'] == 'step':
+                yield sse_event('step', {'step': event['step'], 'intent_token': event['intent_token']})
+            elif event['type'] == 'trace':
+                trace = event['trace']
+                for stage in trace['stages']:
+                    if stage['type'] not in sent:
+                        yield sse_event('stage', stage)
+                yield sse_event('done', {
+                    'execution_id': trace['execution_id'],
+                    'timestamp': trace['timestamp'],
+                    'policy_version': trace['policy_version'],
+                    'intent_tokens': trace['intent_tokens']
+                })
+    except Exception as e:
+        logger.error(f"Streaming trace failed: {str(e)}")
+        yield sse_event('error', {'error': str(e)})
+
+@app.route('/api/execute-with-intent/events', methods=['POST'])
+def execute_with_intent_events():
+    """
+    Server-Sent Events variant of execute-with-intent for answered questionnaires
+    """
+    try:
+        data = request.json
+        user_input = data.get('text', '')
+        user_responses = data.get('responses', None)
+
+        if not user_responses:
+            return jsonify({'error': 'responses are required; call /api/execute-with-intent for questions first'}), 400
+
+        logger.info(f"Streaming intent execution request: {user_input}")
+
+        return Response(
+            stream_with_context(stream_trace_stages(user_input, user_responses)),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    except Exception as e:
+        logger.error(f"Error in streaming intent execution: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/sessions', methods=['POST'])
+def create_session():
+    """
+    Start a questionnaire session for a request; returns its first question
+    """
+    try:
+        user_input = (request.json or {}).get('text', '')
+        if not user_input:
+            return jsonify({'error': 'text is required'}), 400
+        
+        questions = questions_response(generate_questions(user_input))['questions']
+        session = SESSION_STORE.create(user_input, questions)
+        logger.info(f"Questionnaire session {session.session_id} started ({len(questions)} questions)")
+        return jsonify(session.view()), 201
+    
+    except Exception as e:
+        logger.error(f"Error creating session: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/sessions/<session_id>', methods=['GET'])
+def get_session(session_id):
+    """
+    Session state with its answers so far and, once planned, the trace
+    """
+    session = SESSION_STORE.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Session not found or expired'}), 404
+    return jsonify({**session.view(), 'answers': session.answers, 'trace': session.trace})
+
+@app.route('/api/sessions/<session_id>/next-question', methods=['GET'])
+def next_question(session_id):
+    """
+    The question to answer next (null once every question is answered)
+    """
+    session = SESSION_STORE.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Session not found or expired'}), 404
+    return jsonify(session.view())
+
+@app.route('/api/sessions/<session_id>/answers', methods=['POST'])
+def submit_answer(session_id):
+    """
+    Answer the current question; returns the next one
+    """
+    data = request.json or {}
+    answer = str(data.get('answer', '')).strip()
+    if not answer:
+        return jsonify({'error': 'answer is required'}), 400
+    
+    try:
+        session, _ = SESSION_STORE.update(session_id, lambda s: s.answer(answer, data.get('question_id')))
+    except SessionStateError as e:
+        return jsonify({'error': str(e)}), 409
+    
+    if session is None:
+        return jsonify({'error': 'Session not found or expired'}), 404
+    return jsonify(session.view())
+
+@app.route('/api/sessions/<session_id>/plan', methods=['POST'])
+def plan_session(session_id):
+    """
+    Generate (once) and return the trace for a fully answered session
+    """
+    # Claim the session first so that concurrent requests generate one plan
+    try:
+        session, answers = SESSION_STORE.update(session_id, lambda s: s.start_planning())
+    except SessionStateError as e:
+        return jsonify({'error': str(e)}), 409
+    
+    if session is None:
+        return jsonify({'error': 'Session not found or expired'}), 404
+    if answers is None:
+        return jsonify(session.trace)
+    
+    try:
+        trace = generate_trace(session.user_input, answers)
+        SESSION_STORE.update(session_id, lambda s: s.complete(trace))
+        logger.info(f"Questionnaire session {session_id} planned")
+        return jsonify(trace)
+    
+    except Exception as e:
+        SESSION_STORE.update(session_id, lambda s: s.abandon_planning())
+        logger.error(f"Error planning session: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# Rules decidable from the questionnaire answers alone. validate_policy_rules runs
+# them on every plan step; preflight_policy_check runs them before the LLM is called.
+
+# City minimum hotel thresholds (per night)
+CITY_MIN_BUDGET = {
+    'paris': 3000,      # ~₹3,000/night minimum
+    'london': 3500,
+    'new york': 4000,
+    'tokyo': 2500,
+    'dubai': 2000,
+    'singapore': 2500,
+    'mumbai': 1500,
+    'delhi': 1500,
+    'bangalore': 1200,
+    'default': 1000     # Generic minimum
+}
+
+def input_failures(intent, days_until):
+    """
+    Input-level failures: same origin and destination, past date, no travelers
+    """
+    failures = []
+    
+    # Check origin == destination
+    if intent.origin and intent.destination and intent.origin == intent.destination:
+        failures.append({
+            'action': intent.action,
+            'category': 'INPUT_VALIDATION',
+            'reason': 'Origin and destination cannot be the same location',
+            'severity': 'BLOCK'
+        })
+    
+    # Check date in past
+    if days_until is not None and days_until < 0:
+        failures.append({
+            'action': intent.action,
+            'category': 'INPUT_VALIDATION',
+            'reason': 'Booking date is in the past',
+            'severity': 'BLOCK'
+        })
+    
+    # Check negative/zero values
+    if intent.travelers <= 0:
+        failures.append({
+            'action': intent.action,
+            'category': 'INPUT_VALIDATION',
+            'reason': 'Number of travelers must be at least 1',
+            'severity': 'BLOCK'
+        })
+    
+    return failures
+
+def restricted_destination_failures(intent, compiled_policy):
+    """
+    Policy-scope failures: travel to a blacklisted destination
+    """
+    destination, location = intent.destination, intent.location
+    
+    # Blacklisted destinations (restricted regions)
+    blacklist = ['syria', 'north korea', 'afghanistan', 'crimea']
+    if destination in blacklist or location in blacklist or compiled_policy.is_blacklisted('destinations', destination, location):
+        return [{
+            'action': intent.action,
+            'category': 'POLICY_RESTRICTED',
+            'reason': f'Travel to {destination or location} is restricted by corporate policy',
+            'severity': 'BLOCK_AND_LOG'
+        }]
+    return []
+
+def hotel_budget_failures(intent):
+    """
+    Hotel budget realism: budget per night below the city minimum (soft fail).
+    The minimums are in rupees, so budgets in another currency are not judged.
+    """
+    budget_per_night, location = intent.budget_per_night, intent.location
+    if intent.budget_currency not in (None, 'inr') or not budget_per_night or budget_per_night <= 0:
+        return []
+    
+    # Determine city minimum
+    city_key = location or 'default'
+    city_min = CITY_MIN_BUDGET.get(city_key, CITY_MIN_BUDGET['default'])
+    
+    if budget_per_night < city_min:
+        return [{
+            'action': intent.action,
+            'category': 'BUDGET_NOT_FEASIBLE_FOR_LOCATION',
+            'reason': f'Budget per night (₹{int(budget_per_night)}) is below minimum for {location or "this location"} (₹{city_min}) - may not find suitable accommodation',
+            'severity': 'REQUIRE_HUMAN_APPROVAL'
+        }]
+    return []
+
+def preflight_policy_check(user_input, user_responses, primary_action, policy=None):
+    """
+    Run the answer-level rules before any plan is generated. Returns a BLOCKED
+    trace if one of them blocks (the LLM call is skipped), else None.
+    """
+    policy = policy or POLICY_MANAGER.current()
+    
+    # One token built from the answers only, the way plan steps merge them
+    step = {'step_number': 1, 'description': user_input, 'structured_data': {}}
+    token = build_step_intent_token(step, collect_user_data(user_responses), {}, primary_action)
+    intent = NormalizedIntent.from_token(token)
+    
+    # Only rules that block whatever the plan says; soft rules (e.g. the hotel
+    # budget minimum) wait for the plan and keep the policy's severity
+    failures = input_failures(intent, intent.days_until(datetime.now().date()))
+    failures.extend(restricted_destination_failures(intent, policy.compiled))
+    
+    if not any(f['severity'] in ['BLOCK', 'BLOCK_AND_LOG'] for f in failures):
+        return None
+    
+    logger.info(f"Pre-flight policy check blocked request: {'; '.join(f['reason'] for f in failures)}")
+    reasoning = 'Your answers already violate travel policy, so no plan was generated.'
+    return build_trace_from_intents(user_input, [token], reasoning, '', policy, failures=failures)
+
+def validate_policy_rules(intent_tokens, policy=None):
     """
     Sophisticated policy validation - checks feasibility, governance, and constraints
     Returns: (is_valid, failures_list)
     """
+    policy = policy or POLICY_MANAGER.current()
+    compiled_policy = policy.compiled
     failures = []
     
+    today = datetime.now().date()
+    
     for token in intent_tokens:
-        payload = token['payload']
-        action = payload.get('action', 'UNKNOWN')
-        
-        # Extract common fields
-        origin = payload.get('origin', '').lower()
-        destination = payload.get('destination', '').lower()
-        location = payload.get('location', '').lower()
-        budget_str = str(payload.get('budget', '0'))
-        price_str = str(payload.get('price', '0'))
-        travelers_str = str(payload.get('travelers', '1'))
-        date_str = payload.get('date', '') or payload.get('departure_date', '') or payload.get('check_in', '')
-        confidence = payload.get('confidence', 0.0)
-        
-        # Parse budget and price (extract numeric value)
-        budget = 0
-        price = 0
-        try:
-            import re
-            budget_match = re.search(r'[\d,]+', budget_str.replace(',', ''))
-            if budget_match:
-                budget = float(budget_match.group())
-            
-            price_match = re.search(r'[\d,]+', price_str.replace(',', ''))
-            if price_match:
-                price = float(price_match.group())
-        except:
-            pass
-        
-        # Parse travelers
-        travelers = 1
-        try:
-            travelers_match = re.search(r'\d+', travelers_str)
-            if travelers_match:
-                travelers = int(travelers_match.group())
-        except:
-            travelers = 1
+        # Parse dates, amounts and counts once; every rule below reads from this record
+        intent = NormalizedIntent.from_token(token)
+        action = intent.action
+        
+        # Common fields
+        origin = intent.origin
+        destination = intent.destination
+        location = intent.location
+        budget_str = intent.budget_str
+        price_str = intent.price_str
+        budget = intent.budget
+        price = intent.price
+        travelers = intent.travelers
+        days_until = intent.days_until(today)
+        confidence = intent.confidence
         
         # ===== 1️⃣ INPUT-LEVEL FAILURES =====
         
-        # Check origin == destination
-        if origin and destination and origin == destination:
-            failures.append({
-                'action': action,
-                'category': 'INPUT_VALIDATION',
-                'reason': 'Origin and destination cannot be the same location',
-                'severity': 'BLOCK'
-            })
-        
-        # Check date in past
-        if date_str:
-            try:
-                booking_date = date_parser.parse(date_str, fuzzy=True)
-                if booking_date.date() < datetime.now().date():
-                    failures.append({
-                        'action': action,
-                        'category': 'INPUT_VALIDATION',
-                        'reason': 'Booking date is in the past',
-                        'severity': 'BLOCK'
-                    })
-            except:
-                pass
-        
-        # Check negative/zero values
-        if travelers <= 0:
-            failures.append({
-                'action': action,
-                'category': 'INPUT_VALIDATION',
-                'reason': 'Number of travelers must be at least 1',
-                'severity': 'BLOCK'
-            })
+        failures.extend(input_failures(intent, days_until))
         
         if budget <= 0:
             failures.append({
@@ -721,32 +1370,18 @@ def validate_policy_rules(intent_tokens):
         
         # ===== 2️⃣ POLICY-SCOPE FAILURES =====
         
-        # Blacklisted destinations (restricted regions)
-        blacklist = ['syria', 'north korea', 'afghanistan', 'crimea']
-        if destination in blacklist or location in blacklist:
-            failures.append({
-                'action': action,
-                'category': 'POLICY_RESTRICTED',
-                'reason': f'Travel to {destination or location} is restricted by corporate policy',
-                'severity': 'BLOCK_AND_LOG'
-            })
+        failures.extend(restricted_destination_failures(intent, compiled_policy))
         
         # Time-based governance (booking too soon)
-        if date_str and action == 'BOOK_FLIGHT':
-            try:
-                booking_date = date_parser.parse(date_str, fuzzy=True)
-                days_until = (booking_date.date() - datetime.now().date()).days
-                
-                # International flights require 72+ hours notice
-                if days_until < 3 and destination not in ['domestic', 'india']:
-                    failures.append({
-                        'action': action,
-                        'category': 'POLICY_TIME',
-                        'reason': f'International flight booking requires 72 hours advance notice (currently {days_until} days)',
-                        'severity': 'REQUIRE_HUMAN_APPROVAL'
-                    })
-            except:
-                pass
+        if days_until is not None and action == 'BOOK_FLIGHT':
+            # International flights require 72+ hours notice
+            if days_until < 3 and destination not in ['domestic', 'india']:
+                failures.append({
+                    'action': action,
+                    'category': 'POLICY_TIME',
+                    'reason': f'International flight booking requires 72 hours advance notice (currently {days_until} days)',
+                    'severity': 'REQUIRE_HUMAN_APPROVAL'
+                })
         
         # ===== 3️⃣ BUDGET REASONING FAILURES =====
         
@@ -787,7 +1422,7 @@ def validate_policy_rules(intent_tokens):
         # ===== 4️⃣ CLASS & JUSTIFICATION FAILURES =====
         
         # Check if description mentions business/first class
-        description = payload.get('description', '').lower()
+        description = intent.description
         if 'business class' in description or 'first class' in description:
             # Business class on short domestic flights
             if origin and destination:
@@ -802,6 +1437,18 @@ def validate_policy_rules(intent_tokens):
                         'severity': 'REQUIRE_HUMAN_APPROVAL'
                     })
         
+        # ===== 📜 YAML POLICY SCENARIOS (manager/policy_travel.yaml) =====
+        
+        tool = tool_for_action(action)
+        decision, fired_rule = compiled_policy.evaluate(tool, intent.policy_facts(today))
+        if decision is not None and decision != 'ALLOW':
+            failures.append({
+                'action': action,
+                'category': 'POLICY_RULES',
+                'reason': f'Request does not match any approved {tool} scenario in policy {policy.version}',
+                'severity': decision
+            })
+        
         # ===== 5️⃣ CONFIDENCE & UNCERTAINTY FAILURES =====
         
         # NOTE: Confidence checks are disabled - we rely on data_complete validation instead
@@ -828,20 +1475,9 @@ def validate_policy_rules(intent_tokens):
         # ===== 6️⃣ HOTEL-SPECIFIC VALIDATIONS =====
         
         if action == 'BOOK_HOTEL':
-            # Extract hotel-specific fields
-            # Check 'guests' first, then fall back to 'travelers' field
-            guests_str = str(payload.get('guests', payload.get('travelers', '0')))
-            check_in_str = payload.get('check_in', '')
-            check_out_str = payload.get('check_out', '')
-            
-            # Parse number of guests
-            guests = 0
-            try:
-                guests_match = re.search(r'\d+', guests_str)
-                if guests_match:
-                    guests = int(guests_match.group())
-            except:
-                guests = 0
+            # Hotel-specific fields ('guests' falls back to 'travelers')
+            guests = intent.guests
+            stay_duration = intent.stay_nights
             
             # 2️⃣ Occupancy violation (HARD BLOCK)
             MAX_GUESTS_PER_ROOM = 4
@@ -861,60 +1497,17 @@ def validate_policy_rules(intent_tokens):
                 })
             
             # 3️⃣ Excessive stay duration (SOFT FAIL)
-            if check_in_str and check_out_str:
-                try:
-                    check_in = date_parser.parse(check_in_str, fuzzy=True)
-                    check_out = date_parser.parse(check_out_str, fuzzy=True)
-                    stay_duration = (check_out - check_in).days
-                    
-                    MAX_STAY_NIGHTS = 14
-                    if stay_duration > MAX_STAY_NIGHTS:
-                        failures.append({
-                            'action': action,
-                            'category': 'EXCESSIVE_STAY_LENGTH',
-                            'reason': f'Stay duration ({stay_duration} nights) exceeds maximum ({MAX_STAY_NIGHTS} nights) - requires approval',
-                            'severity': 'REQUIRE_HUMAN_APPROVAL'
-                        })
-                except:
-                    pass
+            MAX_STAY_NIGHTS = 14
+            if stay_duration is not None and stay_duration > MAX_STAY_NIGHTS:
+                failures.append({
+                    'action': action,
+                    'category': 'EXCESSIVE_STAY_LENGTH',
+                    'reason': f'Stay duration ({stay_duration} nights) exceeds maximum ({MAX_STAY_NIGHTS} nights) - requires approval',
+                    'severity': 'REQUIRE_HUMAN_APPROVAL'
+                })
             
             # 5️⃣ Budget realism check (SOFT FAIL)
-            # Define city minimum thresholds (per night)
-            CITY_MIN_BUDGET = {
-                'paris': 3000,      # ~₹3,000/night minimum
-                'london': 3500,
-                'new york': 4000,
-                'tokyo': 2500,
-                'dubai': 2000,
-                'singapore': 2500,
-                'mumbai': 1500,
-                'delhi': 1500,
-                'bangalore': 1200,
-                'default': 1000     # Generic minimum
-            }
-            
-            if check_in_str and check_out_str and budget > 0:
-                try:
-                    check_in = date_parser.parse(check_in_str, fuzzy=True)
-                    check_out = date_parser.parse(check_out_str, fuzzy=True)
-                    stay_duration = (check_out - check_in).days
-                    
-                    if stay_duration > 0:
-                        budget_per_night = budget / stay_duration
-                        
-                        # Determine city minimum
-                        city_key = location.lower() if location else 'default'
-                        city_min = CITY_MIN_BUDGET.get(city_key, CITY_MIN_BUDGET['default'])
-                        
-                        if budget_per_night < city_min:
-                            failures.append({
-                                'action': action,
-                                'category': 'BUDGET_NOT_FEASIBLE_FOR_LOCATION',
-                                'reason': f'Budget per night (₹{int(budget_per_night)}) is below minimum for {location or "this location"} (₹{city_min}) - may not find suitable accommodation',
-                                'severity': 'REQUIRE_HUMAN_APPROVAL'
-                            })
-                except:
-                    pass
+            failures.extend(hotel_budget_failures(intent))
     
     # Determine if any BLOCK-level failure exists
     has_block = any(f['severity'] in ['BLOCK', 'BLOCK_AND_LOG'] for f in failures)
@@ -922,12 +1515,16 @@ def validate_policy_rules(intent_tokens):
     return (not has_block and len(failures) == 0), failures
 
 
-def build_trace_from_intents(user_input, intent_tokens, reasoning, plan):
+def build_trace_from_intents(user_input, intent_tokens, reasoning, plan, policy=None, failures=None):
     """
-    Build execution trace from intent tokens
+    Build execution trace from intent tokens. `failures` is an outcome already
+    decided by the pre-flight check; token validation is then skipped.
     """
+    # Pin one policy snapshot for the whole evaluation, even if the file is reloaded meanwhile
+    policy = policy or POLICY_MANAGER.current()
+    
     # Generate execution ID for this request
-    execution_id = f'intent_{datetime.utcnow().timestamp()}'
+    execution_id = f'intent_{uuid.uuid4().hex}'
     
     stages = []
     
@@ -958,8 +1555,9 @@ def build_trace_from_intents(user_input, intent_tokens, reasoning, plan):
     })
     
     # Stage 4: INTENT_TOKEN - Validate completeness AND policy rules
-    all_tokens_valid = True
-    failed_reasons = []
+    preflight = failures is not None
+    failed_reasons = list(failures or [])
+    all_tokens_valid = not failed_reasons
     total_confidence = 0
     
     # First pass: Check data completeness
@@ -967,7 +1565,9 @@ def build_trace_from_intents(user_input, intent_tokens, reasoning, plan):
         payload = token['payload']
         is_complete = payload.get('data_complete', False)
         
-        if not is_complete:
+        if preflight:
+            total_confidence += 0.95 if is_complete else 0.3
+        elif not is_complete:
             all_tokens_valid = False
             missing = payload.get('missing_fields', [])
             action = payload.get('action', 'ACTION')
@@ -982,8 +1582,8 @@ def build_trace_from_intents(user_input, intent_tokens, reasoning, plan):
             total_confidence += 0.95  # High confidence for complete
     
     # Second pass: Advanced policy validation (only if data is complete)
-    if all_tokens_valid:
-        policy_valid, policy_failures = validate_policy_rules(intent_tokens)
+    if all_tokens_valid and not preflight:
+        policy_valid, policy_failures = validate_policy_rules(intent_tokens, policy)
         if not policy_valid or policy_failures:
             all_tokens_valid = False
             failed_reasons.extend(policy_failures)
@@ -1081,12 +1681,100 @@ def build_trace_from_intents(user_input, intent_tokens, reasoning, plan):
         'payload': outcome_payload
     })
     
-    return {
+    trace = {
         'stages': stages,
         'timestamp': datetime.utcnow().isoformat() + 'Z',
         'execution_id': execution_id,
-        'intent_tokens': intent_tokens
+        'intent_tokens': intent_tokens,
+        'policy_version': policy.version
     }
+    if preflight:
+        trace['preflight'] = True
+    
+    return record_trace(trace)
+
+# Outcomes that come with a payment link
+PAYABLE_STATUSES = ('APPROVED', 'REQUIRES_APPROVAL')
+
+# Charged when a payable trace carries no price
+DEFAULT_CHECKOUT_AMOUNT = ('inr', 100000)  # ₹1,000 (amount in paise)
+
+# Currencies a trace price may be charged in (see intent_record.parse_currency),
+# with the factor to Stripe's smallest unit; yen has no minor unit
+CHECKOUT_CURRENCIES = {
+    'inr': 100, 'usd': 100, 'eur': 100, 'gbp': 100, 'aud': 100, 'cad': 100,
+    'sgd': 100, 'aed': 100, 'chf': 100, 'thb': 100, 'jpy': 1,
+}
+
+def payable_trace(execution_id):
+    """
+    The stored trace for an execution if it may be paid for.
+    Returns (trace, None, None) or (None, error message, HTTP status).
+    """
+    trace = TRACE_STORE.get(execution_id)
+    if trace is None:
+        return None, f'Unknown execution {execution_id}', 404
+    status = trace['stages'][-1]['payload'].get('status')
+    if status not in PAYABLE_STATUSES:
+        return None, f'Execution {execution_id} is {status}; nothing to pay for', 409
+    return trace, None, None
+
+def checkout_amount(trace):
+    """
+    (currency, amount in the smallest unit) for the price recommended in a trace
+    """
+    tokens = trace.get('intent_tokens') or []
+    price_str = str((tokens[0]['payload'].get('price') if tokens else None) or trace['stages'][-1]['payload'].get('price') or '')
+    price = NormalizedIntent({'price': price_str}).price
+    if not price:
+        logger.warning(f"No price in trace {trace['execution_id']}, charging the default amount")
+        return DEFAULT_CHECKOUT_AMOUNT
+    
+    currency = parse_currency(price_str)
+    if currency not in CHECKOUT_CURRENCIES:
+        logger.warning(f"Unrecognised currency in price {price_str!r} of trace {trace['execution_id']}, charging the default amount")
+        return DEFAULT_CHECKOUT_AMOUNT
+    return currency, int(round(price * CHECKOUT_CURRENCIES[currency]))
+
+def create_checkout_session(execution_id, trace, idempotency_key, expires_at):
+    """
+    Create the Stripe Checkout Session for an execution's stored trace (blocking network call)
+    """
+    currency, unit_amount = checkout_amount(trace)
+    
+    return STRIPE.checkout.Session.create(
+        idempotency_key=idempotency_key,
+        expires_at=expires_at,
+        payment_method_types=['card'],
+        line_items=[{
+            'price_data': {
+                'currency': currency,
+                'unit_amount': unit_amount,
+                'product_data': {
+                    'name': 'Travel Booking',
+                    'description': f'Booking confirmation for {execution_id[:16]}',
+                    'images': ['https://i.imgur.com/EHyR2nP.png'],
+                },
+            },
+            'quantity': 1,
+        }],
+        mode='payment',
+        success_url=f'http://localhost:5001/payment/success?session_id={{CHECKOUT_SESSION_ID}}&execution_id={execution_id}',
+        cancel_url=f'http://localhost:5001/payment/cancel?execution_id={execution_id}',
+        metadata={
+            'execution_id': execution_id
+        }
+    )
+
+def checkout_url(execution_id, trace):
+    """
+    URL of the execution's Checkout Session, created on first use (blocking on a cache miss)
+    """
+    _, url = CHECKOUT_CACHE.get_or_create(
+        execution_id,
+        lambda idempotency_key, expires_at: create_checkout_session(execution_id, trace, idempotency_key, expires_at)
+    )
+    return url
 
 @app.route('/payment/<execution_id>', methods=['GET'])
 def payment_gateway(execution_id):
@@ -1094,465 +1782,52 @@ def payment_gateway(execution_id):
     Create Stripe Checkout Session and redirect to Stripe
     """
     try:
-        # Extract price from execution_id or use a default
-        # In production, you'd fetch this from a database
-        # For demo purposes, using a fixed amount
+        trace, error, status = payable_trace(execution_id)
+        if trace is None:
+            return jsonify({'error': 'Payment gateway error', 'details': error}), status
         
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=[{
-                'price_data': {
-                    'currency': 'inr',
-                    'unit_amount': 100000,  # ₹1,000 (amount in paise)
-                    'product_data': {
-                        'name': 'Travel Booking',
-                        'description': f'Booking confirmation for {execution_id[:16]}',
-                        'images': ['https://i.imgur.com/EHyR2nP.png'],
-                    },
-                },
-                'quantity': 1,
-            }],
-            mode='payment',
-            success_url=f'http://localhost:5001/payment/success?session_id={{CHECKOUT_SESSION_ID}}&execution_id={execution_id}',
-            cancel_url=f'http://localhost:5001/payment/cancel?execution_id={execution_id}',
-            metadata={
-                'execution_id': execution_id
-            }
-        )
-        
-        return redirect(checkout_session.url, code=303)
+        return redirect(checkout_url(execution_id, trace), code=303)
     
     except Exception as e:
         logger.error(f"Stripe checkout error: {str(e)}")
         return jsonify({'error': 'Payment gateway error', 'details': str(e)}), 500
 
-@app.route('/payment/success', methods=['GET'])
-def payment_success():
+def known_execution(execution_id):
     """
-    Payment success page - shown after successful Stripe payment
+    Whether execution_id names a stored trace (an in-memory index lookup)
     """
-    session_id = request.args.get('session_id')
-    execution_id = request.args.get('execution_id')
-    
-    html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Payment Successful - ARMOURIQ</title>
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap" rel="stylesheet">
-        <style>
-            * {{
-                margin: 0;
-                padding: 0;
-                box-sizing: border-box;
-            }}
-            body {{
-                font-family: 'Inter', -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-                background: linear-gradient(135deg, #0f766e 0%, #06b6d4 100%);
-                display: flex;
-                justify-content: center;
-                align-items: center;
-                min-height: 100vh;
-                padding: 20px;
-            }}
-            .container {{
-                background: white;
-                border-radius: 20px;
-                padding: 56px 48px;
-                max-width: 520px;
-                width: 100%;
-                box-shadow: 0 25px 50px -12px rgba(0, 0, 0, 0.25);
-                text-align: center;
-            }}
-            .success-icon {{
-                width: 88px;
-                height: 88px;
-                margin: 0 auto 28px;
-                background: linear-gradient(135deg, #10b981 0%, #059669 100%);
-                border-radius: 50%;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                animation: scaleIn 0.6s cubic-bezier(0.175, 0.885, 0.32, 1.275);
-                box-shadow: 0 10px 25px -5px rgba(16, 185, 129, 0.4);
-            }}
-            .success-icon svg {{
-                width: 48px;
-                height: 48px;
-                stroke: white;
-                stroke-width: 3;
-                fill: none;
-                stroke-linecap: round;
-                stroke-linejoin: round;
-            }}
-            @keyframes scaleIn {{
-                from {{
-                    transform: scale(0) rotate(-45deg);
-                    opacity: 0;
-                }}
-                to {{
-                    transform: scale(1) rotate(0deg);
-                    opacity: 1;
-                }}
-            }}
-            .title {{
-                font-size: 32px;
-                font-weight: 700;
-                color: #0f172a;
-                margin-bottom: 14px;
-                letter-spacing: -0.02em;
-            }}
-            .subtitle {{
-                font-size: 16px;
-                color: #64748b;
-                margin-bottom: 40px;
-                line-height: 1.6;
-                font-weight: 400;
-            }}
-            .details {{
-                background: #f8fafc;
-                border: 1px solid #e2e8f0;
-                border-radius: 16px;
-                padding: 28px;
-                margin-bottom: 32px;
-                text-align: left;
-            }}
-            .detail-row {{
-                display: flex;
-                justify-content: space-between;
-                align-items: center;
-                margin-bottom: 18px;
-                font-size: 14px;
-            }}
-            .detail-row:last-child {{
-                margin-bottom: 0;
-                padding-top: 18px;
-                border-top: 1px solid #e2e8f0;
-            }}
-            .label {{
-                color: #64748b;
-                font-weight: 500;
-            }}
-            .value {{
-                color: #0f172a;
-                font-weight: 600;
-                font-family: 'SF Mono', Monaco, 'Cascadia Code', monospace;
-                font-size: 13px;
-                background: white;
-                padding: 4px 10px;
-                border-radius: 6px;
-                border: 1px solid #e2e8f0;
-            }}
-            .status-badge {{
-                background: #d1fae5;
-                color: #065f46;
-                padding: 6px 14px;
-                border-radius: 20px;
-                font-size: 12px;
-                font-weight: 600;
-                letter-spacing: 0.02em;
-                border: none;
-            }}
-            .btn {{
-                width: 100%;
-                padding: 18px;
-                border: none;
-                border-radius: 12px;
-                font-size: 16px;
-                font-weight: 600;
-                cursor: pointer;
-                transition: all 0.3s cubic-bezier(0.4, 0, 0.2, 1);
-                text-decoration: none;
-                display: inline-block;
-                font-family: 'Inter', sans-serif;
-            }}
-            .btn-primary {{
-                background: linear-gradient(135deg, #0f766e 0%, #06b6d4 100%);
-                color: white;
-                box-shadow: 0 4px 12px rgba(15, 118, 110, 0.3);
-            }}
-            .btn-primary:hover {{
-                transform: translateY(-2px);
-                box-shadow: 0 8px 20px rgba(15, 118, 110, 0.4);
-            }}
-            .btn-primary:active {{
-                transform: translateY(0);
-            }}
-            .footer {{
-                margin-top: 32px;
-                font-size: 13px;
-                color: #94a3b8;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                gap: 8px;
-            }}
-            .footer-divider {{
-                width: 4px;
-                height: 4px;
-                background: #cbd5e1;
-                border-radius: 50%;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="success-icon">
-                <svg viewBox="0 0 24 24">
-                    <polyline points="20 6 9 17 4 12"></polyline>
-                </svg>
-            </div>
-            <h1 class="title">Payment Successful!</h1>
-            <p class="subtitle">Your booking has been confirmed. You'll receive a confirmation email shortly.</p>
-            
-            <div class="details">
-                <div class="detail-row">
-                    <span class="label">Transaction ID</span>
-                    <span class="value">{session_id[:20] if session_id else 'DEMO'}...</span>
-                </div>
-                <div class="detail-row">
-                    <span class="label">Booking Reference</span>
-                    <span class="value">{execution_id[:18] if execution_id else 'N/A'}...</span>
-                </div>
-                <div class="detail-row">
-                    <span class="label">Payment Status</span>
-                    <span class="status-badge">CONFIRMED</span>
-                </div>
-            </div>
-            
-            <button class="btn btn-primary" onclick="window.close()">
-                Close Window
-            </button>
-            
-            <div class="footer">
-                <span>Powered by ARMOURIQ</span>
-                <div class="footer-divider"></div>
-                <span>Secured by Stripe</span>
-            </div>
-        </div>
-    </body>
-    </html>
+    return bool(execution_id) and execution_id in TRACE_STORE
+
+def payload_response(payload):
+    """
+    Flask response for a precompressed Payload, honouring Accept-Encoding and If-None-Match
     """
-    return html
+    status, headers, body = payload.response(request.headers.get('Accept-Encoding'), request.headers.get('If-None-Match'))
+    return Response(body, status=status, headers=headers)
+
+@app.route('/payment/success', methods=['GET'])
+def payment_success():
+    execution_id = request.args.get('execution_id')
+    return payload_response(payment_success_page(request.args.get('session_id'), execution_id, known_execution(execution_id)))
 
 @app.route('/payment/cancel', methods=['GET'])
 def payment_cancel():
-    """
-    Payment cancelled page
-    """
     execution_id = request.args.get('execution_id')
-    
-    html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Payment Cancelled - ARMOURIQ</title>
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap" rel="stylesheet">
-        <style>
-            * {{
-                margin: 0;
-                padding: 0;
-                box-sizing: border-box;
-            }}
-            body {{
-                font-family: 'Inter', -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-                background: linear-gradient(135deg, #475569 0%, #64748b 100%);
-                display: flex;
-                justify-content: center;
-                align-items: center;
-                min-height: 100vh;
-                padding: 20px;
-            }}
-            .container {{
-                background: white;
-                border-radius: 20px;
-                padding: 56px 48px;
-                max-width: 520px;
-                width: 100%;
-                box-shadow: 0 25px 50px -12px rgba(0, 0, 0, 0.25);
-                text-align: center;
-            }}
-            .cancel-icon {{
-                width: 88px;
-                height: 88px;
-                margin: 0 auto 28px;
-                background: linear-gradient(135deg, #f1f5f9 0%, #e2e8f0 100%);
-                border-radius: 50%;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                box-shadow: 0 10px 25px -5px rgba(0, 0, 0, 0.1);
-            }}
-            .cancel-icon svg {{
-                width: 40px;
-                height: 40px;
-                stroke: #64748b;
-                stroke-width: 3;
-                fill: none;
-                stroke-linecap: round;
-                stroke-linejoin: round;
-            }}
-            .title {{
-                font-size: 32px;
-                font-weight: 700;
-                color: #0f172a;
-                margin-bottom: 14px;
-                letter-spacing: -0.02em;
-            }}
-            .subtitle {{
-                font-size: 16px;
-                color: #64748b;
-                margin-bottom: 36px;
-                line-height: 1.6;
-                font-weight: 400;
-            }}
-            .info-box {{
-                background: linear-gradient(135deg, #fef3c7 0%, #fde68a 100%);
-                border: 1px solid #fbbf24;
-                border-radius: 16px;
-                padding: 20px 24px;
-                margin-bottom: 32px;
-                display: flex;
-                align-items: center;
-                gap: 14px;
-                text-align: left;
-            }}
-            .info-icon {{
-                width: 24px;
-                height: 24px;
-                background: white;
-                border-radius: 50%;
-                display: flex;
-                align-items: center;
-                justify-content: center;
-                flex-shrink: 0;
-                box-shadow: 0 2px 8px rgba(251, 191, 36, 0.3);
-            }}
-            .info-icon svg {{
-                width: 16px;
-                height: 16px;
-                stroke: #d97706;
-                stroke-width: 2.5;
-                fill: none;
-                stroke-linecap: round;
-                stroke-linejoin: round;
-            }}
-            .info-text {{
-                color: #92400e;
-                font-size: 14px;
-                line-height: 1.6;
-                font-weight: 500;
-            }}
-            .btn {{
-                width: 100%;
-                padding: 18px;
-                border: none;
-                border-radius: 12px;
-                font-size: 16px;
-                font-weight: 600;
-                cursor: pointer;
-                transition: all 0.3s cubic-bezier(0.4, 0, 0.2, 1);
-                text-decoration: none;
-                display: inline-block;
-                margin-bottom: 12px;
-                font-family: 'Inter', sans-serif;
-            }}
-            .btn-primary {{
-                background: linear-gradient(135deg, #3b82f6 0%, #2563eb 100%);
-                color: white;
-                box-shadow: 0 4px 12px rgba(59, 130, 246, 0.3);
-            }}
-            .btn-primary:hover {{
-                transform: translateY(-2px);
-                box-shadow: 0 8px 20px rgba(59, 130, 246, 0.4);
-            }}
-            .btn-primary:active {{
-                transform: translateY(0);
-            }}
-            .btn-secondary {{
-                background: #f1f5f9;
-                color: #475569;
-                box-shadow: 0 1px 3px rgba(0, 0, 0, 0.1);
-            }}
-            .btn-secondary:hover {{
-                background: #e2e8f0;
-                transform: translateY(-1px);
-            }}
-            .booking-info {{
-                margin-top: 24px;
-                padding-top: 24px;
-                border-top: 1px solid #e2e8f0;
-            }}
-            .booking-label {{
-                font-size: 11px;
-                font-weight: 600;
-                color: #94a3b8;
-                text-transform: uppercase;
-                letter-spacing: 0.05em;
-                margin-bottom: 6px;
-            }}
-            .booking-id {{
-                font-family: 'SF Mono', Monaco, 'Cascadia Code', monospace;
-                font-size: 13px;
-                color: #64748b;
-                background: #f8fafc;
-                padding: 8px 14px;
-                border-radius: 8px;
-                display: inline-block;
-            }}
-            .footer {{
-                margin-top: 28px;
-                font-size: 13px;
-                color: #94a3b8;
-            }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="cancel-icon">
-                <svg viewBox="0 0 24 24">
-                    <line x1="18" y1="6" x2="6" y2="18"></line>
-                    <line x1="6" y1="6" x2="18" y2="18"></line>
-                </svg>
-            </div>
-            <h1 class="title">Payment Cancelled</h1>
-            <p class="subtitle">Your payment was cancelled. No charges were made to your account.</p>
-            
-            <div class="info-box">
-                <div class="info-icon">
-                    <svg viewBox="0 0 24 24">
-                        <circle cx="12" cy="12" r="10"></circle>
-                        <line x1="12" y1="16" x2="12" y2="12"></line>
-                        <line x1="12" y1="8" x2="12.01" y2="8"></line>
-                    </svg>
-                </div>
-                <div class="info-text">
-                    Your booking is on hold. Complete the payment to confirm your reservation.
-                </div>
-            </div>
-            
-            <button class="btn btn-primary" onclick="window.location.href='/payment/{execution_id}'">
-                Retry Payment
-            </button>
-            <button class="btn btn-secondary" onclick="window.location.href='http://localhost:5176'">
-                Go Back to Home
-            </button>
-            
-            <div class="booking-info">
-                <div class="booking-label">Booking Reference</div>
-                <div class="booking-id">{execution_id[:18] if execution_id else 'N/A'}...</div>
-            </div>
-            
-            <div class="footer">
-                Powered by ARMOURIQ
-            </div>
-        </div>
-    </body>
-    </html>
+    return payload_response(payment_cancel_page(execution_id, known_execution(execution_id)))
+
+@app.route('/payment/static/payment.css', methods=['GET'])
+def payment_stylesheet():
+    return payload_response(STYLESHEET)
+
+@app.route('/api/traces/<execution_id>', methods=['GET'])
+def get_trace(execution_id):
+    """
+    A stored execution trace (audit)
     """
-    return html
+    trace = TRACE_STORE.get(execution_id)
+    if trace is None:
+        return jsonify({'error': f'Unknown execution {execution_id}'}), 404
+    return jsonify(trace)
 
 @app.route('/api/confirm-booking', methods=['POST'])
 def confirm_booking():
@@ -1571,6 +1846,13 @@ def confirm_booking():
         execution_id = data.get('execution_id')
         details = data.get('details', {})
         
+        # The stored trace is authoritative for what was recommended and approved
+        trace, error, status = payable_trace(execution_id)
+        if trace is None:
+            return jsonify({'success': False, 'error': error}), status
+        recommended = trace['intent_tokens'][0]['payload'] if trace.get('intent_tokens') else {}
+        details = {**details, **{key: recommended[key] for key in ('hotel_name', 'price', 'website', 'location') if recommended.get(key)}}
+        
         logger.info(f"Booking confirmation requested for execution {execution_id}")
         logger.info(f"Hotel: {details.get('hotel_name')}, Price: {details.get('price')}")
         
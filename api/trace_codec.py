@@ -0,0 +1,241 @@
+"""
+Compact binary trace encoding
+
+Traces repeat the same keys, stage types, budget dicts and boilerplate
+reasoning over and over, so they are stored as msgpack compressed with zstd
+against a dictionary trained on our own traces. Short records then compress
+almost as well as a whole archive would.
+
+A zstd frame names the dictionary it was written with, so every dictionary
+ever trained is kept (dict-<id>.zdict next to the segments) and any record
+can be read back after the dictionary for new records has moved on. Plain
+JSON records from before the switch still decode.
+
+CLI:
+    python trace_codec.py train api/traces            # train a dictionary from a store's traces
+    python trace_codec.py convert SRC DST [--codec json|msgpack-zstd]
+    python trace_codec.py stats api/traces
+
+SRC/DST are trace store directories or .jsonl files (one trace per line).
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+
+try:
+    import msgpack
+    import zstandard
+except ImportError:  # the JSON codec still works without them
+    msgpack = zstandard = None
+
+from trace_store import JSONCodec, TraceStore, read_segments
+
+logger = logging.getLogger(__name__)
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+DICTIONARY_BYTES = 64 * 1024
+DICTIONARY_SAMPLES = 5000
+
+
+def available():
+    """Whether the msgpack + zstd codec can be used here"""
+    return msgpack is not None and zstandard is not None
+
+
+class MsgpackZstdCodec:
+    """
+    Trace <-> zstd(msgpack) bytes. Encodes with the newest dictionary in
+    `dictionary_dir` (if any); decodes with whichever one a frame names.
+    zstd (de)compressors aren't thread-safe, so each thread gets its own.
+    """
+
+    name = 'msgpack-zstd'
+
+    def __init__(self, dictionary_dir=None, level=9):
+        if not available():
+            raise ImportError('msgpack and zstandard are required for the msgpack-zstd trace codec')
+        self.dictionary_dir = dictionary_dir
+        self.level = level
+        self._dictionaries = {}  # dict_id -> ZstdCompressionDict
+        self.dictionary_id = 0   # 0: no dictionary
+        self._local = threading.local()
+        if dictionary_dir:
+            self.load_dictionaries()
+
+    def load_dictionaries(self):
+        """(Re)load dict-*.zdict from dictionary_dir; the newest one encodes"""
+        paths = sorted(glob.glob(os.path.join(self.dictionary_dir, 'dict-*.zdict')), key=os.path.getmtime)
+        dictionary = None
+        for path in paths:
+            with open(path, 'rb') as dictionary_file:
+                dictionary = zstandard.ZstdCompressionDict(dictionary_file.read())
+            self._dictionaries[dictionary.dict_id()] = dictionary
+        if dictionary is not None:
+            self.dictionary_id = dictionary.dict_id()
+
+    def encode(self, trace):
+        local = self._local
+        if getattr(local, 'dictionary_id', None) != self.dictionary_id:
+            local.compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self._dictionaries.get(self.dictionary_id))
+            local.dictionary_id = self.dictionary_id
+        return local.compressor.compress(msgpack.packb(trace, use_bin_type=True))
+
+    def decode(self, data):
+        data = bytes(data)
+        if data[:1] == b'{':
+            return json.loads(data)
+        if data[:4] != ZSTD_MAGIC:
+            return msgpack.unpackb(data, raw=False)
+        return msgpack.unpackb(self._decompressor_for(data).decompress(data), raw=False)
+
+    def _decompressor_for(self, frame):
+        decompressors = getattr(self._local, 'decompressors', None)
+        if decompressors is None:
+            decompressors = self._local.decompressors = {}
+        dict_id = zstandard.get_frame_parameters(frame).dict_id
+        decompressor = decompressors.get(dict_id)
+        if decompressor is None:
+            if dict_id and dict_id not in self._dictionaries and self.dictionary_dir:
+                self.load_dictionaries()
+            if dict_id and dict_id not in self._dictionaries:
+                raise ValueError(f'Trace was compressed with unknown dictionary {dict_id}')
+            decompressor = decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=self._dictionaries.get(dict_id))
+        return decompressor
+
+
+def train_dictionary(traces, dictionary_dir, size=DICTIONARY_BYTES):
+    """
+    Train a zstd dictionary on msgpack-encoded traces and save it as
+    dictionary_dir/dict-<id>.zdict. Returns the dictionary id.
+    """
+    if not available():
+        raise ImportError('msgpack and zstandard are required to train a trace dictionary')
+    samples = [msgpack.packb(trace, use_bin_type=True) for trace in traces]
+    if len(samples) < 10:
+        raise ValueError(f'Need at least 10 traces to train a dictionary, got {len(samples)}')
+    dictionary = zstandard.train_dictionary(size, samples)
+    path = os.path.join(dictionary_dir, f'dict-{dictionary.dict_id()}.zdict')
+    with open(path + '.tmp', 'wb') as dictionary_file:
+        dictionary_file.write(dictionary.as_bytes())
+    os.replace(path + '.tmp', path)
+    logger.info(f"Trained trace dictionary {dictionary.dict_id()} on {len(samples)} traces ({len(dictionary.as_bytes())} bytes)")
+    return dictionary.dict_id()
+
+
+def make_codec(name, dictionary_dir=None):
+    """The codec called `name`: 'json' or 'msgpack-zstd'"""
+    if name == JSONCodec.name:
+        return JSONCodec()
+    if name == MsgpackZstdCodec.name:
+        return MsgpackZstdCodec(dictionary_dir)
+    raise ValueError(f'Unknown trace codec {name}')
+
+
+def default_codec(dictionary_dir=None):
+    """
+    The msgpack-zstd codec. Raises ImportError without msgpack/zstandard
+    rather than quietly writing JSON: set TRACE_CODEC=json to choose that.
+    """
+    if not available():
+        raise ImportError('msgpack and zstandard are required for the default trace codec; '
+                          'install them or set TRACE_CODEC=json')
+    return MsgpackZstdCodec(dictionary_dir)
+
+
+# ----- archives -----
+
+def read_archive(path, codec=None):
+    """
+    Yield (execution_id, trace) from a trace store directory or a .jsonl file.
+    Store directories are only read (see trace_store.read_segments), never
+    opened for writing, so a live server's store can be read in place.
+    """
+    if os.path.isdir(path):
+        yield from read_segments(path, codec or default_codec(path))
+        return
+    with open(path, encoding='utf-8') as lines:
+        for line in lines:
+            if line.strip():
+                trace = json.loads(line)
+                yield trace['execution_id'], trace
+
+
+def convert(src, dst, codec_name=MsgpackZstdCodec.name):
+    """Copy every trace from one archive to another; returns the count"""
+    count = 0
+    if dst.endswith('.jsonl'):
+        with open(dst, 'w', encoding='utf-8') as out:
+            for execution_id, trace in read_archive(src):
+                out.write(json.dumps(trace, ensure_ascii=False) + '\n')
+                count += 1
+        return count
+
+    # Bring the source's dictionaries along so the copy compresses just as well
+    os.makedirs(dst, exist_ok=True)
+    if os.path.isdir(src):
+        for path in sorted(glob.glob(os.path.join(src, 'dict-*.zdict')), key=os.path.getmtime):
+            shutil.copy2(path, dst)
+
+    store = TraceStore(dst, codec=make_codec(codec_name, dst))
+    try:
+        for execution_id, trace in read_archive(src):
+            store.append(execution_id, trace)
+            count += 1
+    finally:
+        store.close()
+    return count
+
+
+def archive_bytes(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(p) for p in glob.glob(os.path.join(path, 'traces-*.log')))
+    return os.path.getsize(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Trace archive tools')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    train = commands.add_parser('train', help="train a zstd dictionary on an archive's traces")
+    train.add_argument('archive')
+    train.add_argument('--out', help='directory for the dictionary (default: the archive, if a store)')
+    train.add_argument('--size', type=int, default=DICTIONARY_BYTES)
+    train.add_argument('--samples', type=int, default=DICTIONARY_SAMPLES)
+
+    convert_cmd = commands.add_parser('convert', help='copy traces into another archive')
+    convert_cmd.add_argument('src')
+    convert_cmd.add_argument('dst')
+    convert_cmd.add_argument('--codec', default=MsgpackZstdCodec.name, choices=[JSONCodec.name, MsgpackZstdCodec.name])
+
+    stats = commands.add_parser('stats', help='trace count and size of an archive')
+    stats.add_argument('archive')
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == 'train':
+        traces = []
+        for _, trace in read_archive(args.archive):
+            traces.append(trace)
+            if len(traces) >= args.samples:
+                break
+        out = args.out or args.archive
+        dict_id = train_dictionary(traces, out, args.size)
+        print(f'dictionary {dict_id} written to {out}; new records use it once the store is reopened')
+    elif args.command == 'convert':
+        count = convert(args.src, args.dst, args.codec)
+        print(f'{count} traces: {archive_bytes(args.src)} -> {archive_bytes(args.dst)} bytes')
+    elif args.command == 'stats':
+        count = sum(1 for _ in read_archive(args.archive))
+        size = archive_bytes(args.archive)
+        print(f'{count} traces, {size} bytes ({size // max(count, 1)} bytes/trace)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,238 @@
+"""
+Columnar trace export for analytics
+
+Flattens stored traces into two tables, partitioned by day, as Parquet (or
+Arrow IPC) datasets that any columnar engine can query directly:
+
+    tokens/day=YYYY-MM-DD/    one row per intent token
+    failures/day=YYYY-MM-DD/  one row per policy/validation failure
+
+Failure rows carry the price, budget and destination of the first intent
+token with the failing action, so "BUDGET_EXCEEDED per destination" is a
+single group-by. Exporting rewrites the days it touches (both tables, so a
+day that no longer has failures loses its stale failure partition), so
+re-running it over the whole store is idempotent. Rows are written in
+batches of BATCH_ROWS per day as the traces stream past, so memory stays
+bounded however large the archive is.
+
+CLI:
+    python trace_export.py traces analytics                # every day in the store
+    python trace_export.py traces analytics --since 2026-09-01 --format arrow
+"""
+import argparse
+import logging
+import os
+import shutil
+import sys
+from datetime import datetime, timezone
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Add parent directory to path (intent_record needs date_resolver) when run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from intent_record import NormalizedIntent
+from trace_codec import read_archive
+
+logger = logging.getLogger(__name__)
+
+BATCH_ROWS = 10000
+
+TRACE_COLUMNS = [
+    ('execution_id', pa.string()),
+    ('timestamp', pa.timestamp('us', tz='UTC')),
+    ('day', pa.string()),
+    ('policy_version', pa.string()),
+    ('status', pa.string()),
+]
+
+TOKEN_SCHEMA = pa.schema(TRACE_COLUMNS + [
+    ('step_number', pa.int32()),
+    ('action', pa.string()),
+    ('origin', pa.string()),
+    ('destination', pa.string()),
+    ('price', pa.float64()),
+    ('price_text', pa.string()),
+    ('budget', pa.float64()),
+    ('budget_currency', pa.string()),
+    ('confidence', pa.float64()),
+    ('data_complete', pa.bool_()),
+])
+
+FAILURE_SCHEMA = pa.schema(TRACE_COLUMNS + [
+    ('action', pa.string()),
+    ('category', pa.string()),
+    ('severity', pa.string()),
+    ('reason', pa.string()),
+    ('destination', pa.string()),
+    ('price', pa.float64()),
+    ('budget', pa.float64()),
+    ('preflight', pa.bool_()),
+])
+
+
+def _budget(payload):
+    """(amount, currency): a stated budget, or the cap of an estimated budget range"""
+    budget = payload.get('budget')
+    if isinstance(budget, dict):
+        return budget.get('high'), budget.get('currency')
+    if not budget:
+        return None, None
+    return NormalizedIntent({'budget': budget}).budget, None
+
+
+def _token_facts(payload):
+    intent = NormalizedIntent(payload)
+    budget, currency = _budget(payload)
+    return {
+        'action': intent.action,
+        'origin': payload.get('origin'),
+        'destination': payload.get('destination') or payload.get('location'),
+        'price': intent.price if payload.get('price') else None,
+        'price_text': payload.get('price'),
+        'budget': budget,
+        'budget_currency': currency,
+    }
+
+
+def flatten(trace):
+    """(token rows, failure rows) for one trace"""
+    outcome = trace['stages'][-1]['payload'] if trace.get('stages') else {}
+    timestamp = datetime.fromisoformat(trace['timestamp'].rstrip('Z')).replace(tzinfo=timezone.utc)
+    base = {
+        'execution_id': trace.get('execution_id'),
+        'timestamp': timestamp,
+        'day': timestamp.date().isoformat(),
+        'policy_version': trace.get('policy_version'),
+        'status': outcome.get('status'),
+    }
+
+    token_rows = []
+    facts_by_action = {}
+    for token in trace.get('intent_tokens') or []:
+        payload = token.get('payload', {})
+        facts = _token_facts(payload)
+        facts_by_action.setdefault(facts['action'], facts)
+        token_rows.append({
+            **base,
+            **facts,
+            'step_number': payload.get('step_number'),
+            'confidence': payload.get('confidence'),
+            'data_complete': payload.get('data_complete'),
+        })
+
+    fallback = next(iter(facts_by_action.values()), {})
+    failure_rows = []
+    for failure in outcome.get('failures') or []:
+        facts = facts_by_action.get(failure.get('action'), fallback)
+        failure_rows.append({
+            **base,
+            'action': failure.get('action'),
+            'category': failure.get('category'),
+            'severity': failure.get('severity'),
+            'reason': failure.get('reason'),
+            'destination': facts.get('destination'),
+            'price': facts.get('price'),
+            'budget': facts.get('budget'),
+            'preflight': bool(trace.get('preflight')),
+        })
+    return token_rows, failure_rows
+
+
+class DayPartitions:
+    """
+    Buffered writers for one table's day=YYYY-MM-DD partitions. The day
+    lives in the directory name (hive layout), not in the files.
+    """
+
+    def __init__(self, root, schema, fmt='parquet'):
+        self.root = root
+        self.schema = schema.remove(schema.get_field_index('day'))
+        self.fmt = fmt
+        self.rows = 0
+        self._buffers = {}  # day -> rows not yet written
+        self._writers = {}  # day -> open file writer
+
+    def add(self, day, rows):
+        buffer = self._buffers.setdefault(day, [])
+        buffer.extend(rows)
+        self.rows += len(rows)
+        if len(buffer) >= BATCH_ROWS:
+            self._flush(day)
+
+    def _flush(self, day):
+        rows = self._buffers.pop(day, None)
+        if not rows:
+            return
+        writer = self._writers.get(day)
+        if writer is None:
+            directory = os.path.join(self.root, f'day={day}')
+            os.makedirs(directory, exist_ok=True)
+            if self.fmt == 'arrow':
+                writer = pa.ipc.new_file(os.path.join(directory, 'part-0.arrow'), self.schema)
+            else:
+                writer = pq.ParquetWriter(os.path.join(directory, 'part-0.parquet'), self.schema)
+            self._writers[day] = writer
+        writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        try:
+            for day in list(self._buffers):
+                self._flush(day)
+        finally:
+            for writer in self._writers.values():
+                writer.close()
+            self._writers.clear()
+
+
+def export(traces, out_dir, fmt='parquet', since=None, until=None):
+    """
+    Write the token and failure tables of `traces` under out_dir, one
+    partition per day (inclusive `since`/`until` bounds, 'YYYY-MM-DD').
+    Returns {'traces': n, 'tokens': n, 'failures': n, 'days': n}.
+    """
+    tables = {
+        'tokens': DayPartitions(os.path.join(out_dir, 'tokens'), TOKEN_SCHEMA, fmt),
+        'failures': DayPartitions(os.path.join(out_dir, 'failures'), FAILURE_SCHEMA, fmt),
+    }
+    days, count = set(), 0
+    try:
+        for trace in traces:
+            day = trace.get('timestamp', '')[:10]
+            if (since and day < since) or (until and day > until):
+                continue
+            if day not in days:
+                # First trace of the day: drop what an earlier export wrote for it
+                days.add(day)
+                for table in tables.values():
+                    shutil.rmtree(os.path.join(table.root, f'day={day}'), ignore_errors=True)
+            tokens, failures = flatten(trace)
+            tables['tokens'].add(day, tokens)
+            tables['failures'].add(day, failures)
+            count += 1
+    finally:
+        for table in tables.values():
+            table.close()
+
+    tokens, failures = tables['tokens'].rows, tables['failures'].rows
+    logger.info(f"Exported {count} traces ({tokens} tokens, {failures} failures) over {len(days)} day(s) to {out_dir}")
+    return {'traces': count, 'tokens': tokens, 'failures': failures, 'days': len(days)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export traces as day-partitioned columnar tables')
+    parser.add_argument('archive', help='trace store directory or .jsonl file')
+    parser.add_argument('out_dir')
+    parser.add_argument('--format', default='parquet', choices=['parquet', 'arrow'])
+    parser.add_argument('--since', help='first day to export (YYYY-MM-DD)')
+    parser.add_argument('--until', help='last day to export (YYYY-MM-DD)')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    counts = export((trace for _, trace in read_archive(args.archive)), args.out_dir, args.format, args.since, args.until)
+    print(f"{counts['traces']} traces -> {counts['tokens']} token rows, {counts['failures']} failure rows, {counts['days']} day(s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
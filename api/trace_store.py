@@ -0,0 +1,318 @@
+"""
+Append-only execution trace store
+
+Every trace the API returns is appended to a segment log on local disk, and
+an in-memory index maps its execution_id to (segment, offset, length), so the
+payment, confirmation and audit paths read a trace back with one pread.
+
+Appends are a single write() into the active segment (visible to readers
+at once through the page cache). A background thread fsyncs every
+`flush_interval` seconds, so concurrent appends share one fsync (group
+commit); append(durable=True) waits for the fsync that covers it. Segments
+rotate at `segment_bytes`. A sealed segment gets a sidecar index file so
+startup doesn't rescan it. The active segment is rescanned on open, and a
+torn record at its tail (crash mid-write) is truncated away.
+
+Offsets are tracked in the process, so one directory has one writer: the
+store holds an exclusive flock on <directory>/LOCK while open and a second
+process trying to open it fails. Read-only scans (read_segments) need no lock.
+
+Record layout: <payload length u32><crc32 u32><id length u16><execution_id><payload>
+"""
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process guard
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+HEADER = struct.Struct('<IIH')
+
+
+class JSONCodec:
+    """Trace <-> bytes as compact UTF-8 JSON"""
+
+    name = 'json'
+
+    def encode(self, trace):
+        return json.dumps(trace, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+    def decode(self, data):
+        return json.loads(data)
+
+
+def segment_path(directory, number, suffix='.log'):
+    return os.path.join(directory, f'traces-{number:06d}{suffix}')
+
+
+def segment_numbers(directory):
+    return sorted(
+        int(name[len('traces-'):-len('.log')])
+        for name in os.listdir(directory)
+        if name.startswith('traces-') and name.endswith('.log')
+    )
+
+
+def scan_records(data):
+    """Yield (execution_id, offset, length) for each intact record in a segment's bytes; stops at a torn tail"""
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        payload_len, crc, id_len = HEADER.unpack_from(data, offset)
+        end = offset + HEADER.size + id_len + payload_len
+        if end > len(data):
+            break
+        body = data[offset + HEADER.size:end]
+        if zlib.crc32(body) != crc:
+            break
+        yield body[:id_len].decode('utf-8'), offset, end - offset
+        offset = end
+
+
+def read_segments(directory, codec=None):
+    """
+    Yield (execution_id, trace) from a store directory without opening it as
+    a TraceStore: no writer fd, no fsync thread, and a torn tail is skipped
+    rather than truncated, so it is safe on a store the server has open.
+    Like TraceStore.items(), the last append for an execution_id wins and
+    traces come in append order. One segment is in memory at a time.
+    """
+    codec = codec or JSONCodec()
+    numbers = segment_numbers(directory)
+    latest = {}
+    for number in numbers:
+        with open(segment_path(directory, number), 'rb') as segment:
+            for execution_id, offset, _ in scan_records(segment.read()):
+                latest[execution_id] = (number, offset)
+    for number in numbers:
+        with open(segment_path(directory, number), 'rb') as segment:
+            data = segment.read()
+        for execution_id, offset, length in scan_records(data):
+            if latest.get(execution_id) == (number, offset):
+                id_len = HEADER.unpack_from(data, offset)[2]
+                yield execution_id, codec.decode(data[offset + HEADER.size + id_len:offset + length])
+
+
+class TraceStore:
+    """
+    Segment log of traces keyed by execution_id. Thread-safe; the last
+    append for an execution_id wins.
+    """
+
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, flush_interval=0.05, codec=None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.codec = codec or JSONCodec()
+        os.makedirs(directory, exist_ok=True)
+        self._lock_fd = self._acquire_directory_lock()
+
+        self._lock = threading.Lock()
+        self._synced = threading.Condition(self._lock)
+        self._index = {}      # execution_id -> (segment number, offset, record length)
+        self._readers = {}    # segment number -> read-only fd
+        self._written_seq = 0
+        self._synced_seq = 0
+        self._appends = 0
+        self._fsyncs = 0
+        self._closed = False
+
+        segments = self._segment_numbers()
+        for number in segments[:-1]:
+            self._load_sealed(number)
+        self._segment = segments[-1] if segments else 1
+        self._size = self._recover(self._segment)
+        self._fd = os.open(self._path(self._segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        logger.info(f"Trace store opened {len(self._index)} traces in {len(segments) or 1} segment(s) at {directory}")
+
+        self._flusher = threading.Thread(target=self._flush_loop, name='trace-store-fsync', daemon=True)
+        self._flusher.start()
+
+    # ----- paths and startup -----
+
+    def _acquire_directory_lock(self):
+        fd = os.open(os.path.join(self.directory, 'LOCK'), os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                raise RuntimeError(f'Trace store {self.directory} is already open by another TraceStore or process')
+        return fd
+
+    def _path(self, number, suffix='.log'):
+        return segment_path(self.directory, number, suffix)
+
+    def _segment_numbers(self):
+        return segment_numbers(self.directory)
+
+    def _scan(self, number):
+        """Yield (execution_id, offset, length) for each intact record; stops at a torn tail"""
+        with open(self._path(number), 'rb') as segment:
+            data = segment.read()
+        yield from scan_records(data)
+
+    def _load_sealed(self, number):
+        index_path = self._path(number, '.idx')
+        if os.path.exists(index_path):
+            with open(index_path) as index_file:
+                entries = json.load(index_file)
+            for execution_id, (offset, length) in entries.items():
+                self._index[execution_id] = (number, offset, length)
+            return
+        for execution_id, offset, length in self._scan(number):
+            self._index[execution_id] = (number, offset, length)
+
+    def _recover(self, number):
+        """Index the active segment and cut off a torn tail; returns its size"""
+        if not os.path.exists(self._path(number)):
+            return 0
+        size = 0
+        for execution_id, offset, length in self._scan(number):
+            self._index[execution_id] = (number, offset, length)
+            size = offset + length
+        if size != os.path.getsize(self._path(number)):
+            logger.warning(f"Trace segment {number} had a torn tail; truncating to {size} bytes")
+            os.truncate(self._path(number), size)
+        return size
+
+    # ----- writes -----
+
+    def append(self, execution_id, trace, durable=False):
+        """Append a trace. With durable=True, return only once it has been fsynced."""
+        id_bytes = execution_id.encode('utf-8')
+        payload = self.codec.encode(trace)
+        body = id_bytes + payload
+        record = HEADER.pack(len(payload), zlib.crc32(body), len(id_bytes)) + body
+
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Trace store is closed')
+            if self._size and self._size + len(record) > self.segment_bytes:
+                self._rotate()
+            os.write(self._fd, record)
+            self._index[execution_id] = (self._segment, self._size, len(record))
+            self._size += len(record)
+            self._appends += 1
+            self._written_seq += 1
+            seq = self._written_seq
+            if durable:
+                self._synced.wait_for(lambda: self._synced_seq >= seq or self._closed)
+
+    def _rotate(self):
+        """Seal the active segment (fsync + sidecar index) and start the next one"""
+        os.fsync(self._fd)
+        os.close(self._fd)
+        self._fsyncs += 1
+        self._synced_seq = self._written_seq
+        self._synced.notify_all()
+
+        sealed = self._segment
+        entries = {eid: [offset, length] for eid, (number, offset, length) in self._index.items() if number == sealed}
+        tmp_path = self._path(sealed, '.idx.tmp')
+        with open(tmp_path, 'w') as index_file:
+            json.dump(entries, index_file, separators=(',', ':'))
+        os.replace(tmp_path, self._path(sealed, '.idx'))
+
+        self._segment += 1
+        self._size = 0
+        self._fd = os.open(self._path(self._segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                self._synced.wait(self.flush_interval)
+                if self._closed:
+                    return
+                if self._synced_seq == self._written_seq:
+                    continue
+                fd, seq = self._fd, self._written_seq
+            # fsync outside the lock so appends keep flowing meanwhile; rotation
+            # fsyncs before closing, so a closed fd here means it is already synced
+            try:
+                os.fsync(fd)
+            except OSError:
+                continue
+            with self._lock:
+                self._fsyncs += 1
+                self._synced_seq = max(self._synced_seq, seq)
+                self._synced.notify_all()
+
+    def flush(self):
+        """fsync everything appended so far"""
+        with self._lock:
+            os.fsync(self._fd)
+            self._fsyncs += 1
+            self._synced_seq = self._written_seq
+            self._synced.notify_all()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            os.fsync(self._fd)
+            os.close(self._fd)
+            self._synced_seq = self._written_seq
+            self._closed = True
+            self._synced.notify_all()
+            for fd in self._readers.values():
+                os.close(fd)
+            self._readers.clear()
+            os.close(self._lock_fd)  # releases the flock
+
+    # ----- reads -----
+
+    def get(self, execution_id):
+        """The stored trace for execution_id, or None"""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Trace store is closed')
+            location = self._index.get(execution_id)
+            if location is None:
+                return None
+            number, offset, length = location
+            fd = self._readers.get(number)
+            if fd is None:
+                fd = self._readers[number] = os.open(self._path(number), os.O_RDONLY)
+            # Read under the lock so close() cannot close (and the OS reuse) fd meanwhile
+            record = os.pread(fd, length, offset)
+        if len(record) >= HEADER.size:
+            payload_len, crc, id_len = HEADER.unpack_from(record)
+            body = record[HEADER.size:]
+            if len(record) == length == HEADER.size + id_len + payload_len and zlib.crc32(body) == crc:
+                return self.codec.decode(body[id_len:])
+        logger.error(f"Trace {execution_id} at segment {number} offset {offset} failed its length/CRC check")
+        return None
+
+    def items(self):
+        """Yield (execution_id, trace) for every stored trace, in append order"""
+        with self._lock:
+            entries = sorted(self._index.items(), key=lambda entry: entry[1][:2])
+        for execution_id, _ in entries:
+            trace = self.get(execution_id)
+            if trace is not None:
+                yield execution_id, trace
+
+    def __contains__(self, execution_id):
+        return execution_id in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'traces': len(self._index),
+                'segments': self._segment,
+                'active_segment_bytes': self._size,
+                'appends': self._appends,
+                'fsyncs': self._fsyncs,
+                'unsynced': self._written_seq - self._synced_seq,
+                'codec': self.codec.name,
+            }
@@ -0,0 +1,131 @@
+"""
+Fast-path date resolution with memoization
+
+Dates in intent tokens nearly always arrive in a few shapes ('2026-06-15',
+'june 15 2026', '15/06/2026', 'Day 3'). DateResolver tries precompiled
+patterns for those first and only falls back to dateutil's fuzzy parser on
+a miss. Results (including failures) go into a bounded LRU.
+"""
+import functools
+import re
+import threading
+from datetime import date, datetime, time
+
+from dateutil import parser as date_parser
+
+MONTHS = {
+    'jan': 1, 'january': 1, 'feb': 2, 'february': 2, 'mar': 3, 'march': 3,
+    'apr': 4, 'april': 4, 'may': 5, 'jun': 6, 'june': 6, 'jul': 7, 'july': 7,
+    'aug': 8, 'august': 8, 'sep': 9, 'sept': 9, 'september': 9,
+    'oct': 10, 'october': 10, 'nov': 11, 'november': 11, 'dec': 12, 'december': 12,
+}
+
+_MONTH_NAMES = '|'.join(sorted(MONTHS, key=len, reverse=True))
+
+ISO_RE = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})')
+MONTH_DAY_YEAR_RE = re.compile(rf'({_MONTH_NAMES})\.?\s+(\d{{1,2}})(?:st|nd|rd|th)?,?\s+(\d{{4}})')
+DAY_MONTH_YEAR_RE = re.compile(rf'(\d{{1,2}})(?:st|nd|rd|th)?\s+({_MONTH_NAMES})\.?,?\s+(\d{{4}})')
+NUMERIC_RE = re.compile(r'(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})')
+DAY_N_RE = re.compile(r'day\s+(\d{1,2})')
+
+
+def _fast_path(text, today):
+    """
+    Resolve the common shapes without dateutil. Returns a datetime, or None
+    when the text is not one of them. Mirrors dateutil's interpretation:
+    numeric dates are month-first unless the first number cannot be a month,
+    and 'Day N' is day N of the current month.
+    """
+    match = ISO_RE.fullmatch(text)
+    if match:
+        return datetime(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+
+    match = MONTH_DAY_YEAR_RE.fullmatch(text)
+    if match:
+        return datetime(int(match.group(3)), MONTHS[match.group(1)], int(match.group(2)))
+
+    match = DAY_MONTH_YEAR_RE.fullmatch(text)
+    if match:
+        return datetime(int(match.group(3)), MONTHS[match.group(2)], int(match.group(1)))
+
+    match = NUMERIC_RE.fullmatch(text)
+    if match:
+        first, second, year = int(match.group(1)), int(match.group(2)), int(match.group(3))
+        if first > 12:
+            return datetime(year, second, first)
+        return datetime(year, first, second)
+
+    match = DAY_N_RE.fullmatch(text)
+    if match:
+        return datetime(today.year, today.month, int(match.group(1)))
+
+    return None
+
+
+class DateResolver:
+    """
+    Memoized date parser. Cache keys include today's date because relative
+    inputs ('Day 3', 'june 15') resolve against the current day.
+    """
+
+    def __init__(self, maxsize=4096):
+        self._lock = threading.Lock()
+        self._fast = 0
+        self._fallback = 0
+        self._failed = 0
+        self._cached = functools.lru_cache(maxsize=maxsize)(self._resolve)
+
+    def parse(self, text, today=None):
+        """Parse a date string. Returns a naive datetime, or None if it holds no date."""
+        if not text:
+            return None
+        today = today or date.today()
+        return self._cached(str(text), today.toordinal())
+
+    def _resolve(self, text, today_ordinal):
+        today = date.fromordinal(today_ordinal)
+        normalized = ' '.join(text.strip().lower().split())
+
+        try:
+            result = _fast_path(normalized, today)
+        except ValueError:
+            # A known shape holding an impossible date (e.g. 'Day 31' in June)
+            result = None
+        if result is not None:
+            self._count('_fast')
+            return result
+
+        try:
+            result = date_parser.parse(text, fuzzy=True, default=datetime.combine(today, time()))
+        except (ValueError, OverflowError):
+            self._count('_failed')
+            return None
+        self._count('_fallback')
+        return result
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self):
+        info = self._cached.cache_info()
+        return {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'maxsize': info.maxsize,
+            'fast_path': self._fast,
+            'fallback': self._fallback,
+            'unparseable': self._failed,
+        }
+
+    def clear(self):
+        self._cached.cache_clear()
+
+
+DATE_RESOLVER = DateResolver()
+
+
+def parse_date(text, today=None):
+    """Parse a date string with the shared resolver (None if it holds no date)"""
+    return DATE_RESOLVER.parse(text, today)
@@ -58,6 +58,33 @@ const executionTrace = {
   ]
 };
 
+// Parse a text/event-stream response body, calling onEvent(event, data) per event
+async function readServerEvents(response, onEvent) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      
+      let event = 'message';
+      let data = '';
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event: ')) event = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      }
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
+}
+
 function App() {
   const [inputValue, setInputValue] = useState('Pay my electricity bill');
   const [showExecution, setShowExecution] = useState(false);
@@ -122,8 +149,8 @@ function App() {
       // Answers already formatted by QuestionnaireModal with id, answer, field, etc.
       // No need to reformat - just pass them through
       
-      // Call API with user responses
-      const response = await fetch('http://localhost:5001/api/execute-with-intent', {
+      // Call API with user responses; stages stream in as the server produces them
+      const response = await fetch('http://localhost:5001/api/execute-with-intent/events', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -134,14 +161,29 @@ function App() {
         })
       });
       
-      const data = await response.json();
-      
       if (!response.ok) {
+        const data = await response.json();
         throw new Error(data.error || 'Failed to execute request');
       }
       
-      setExecutionId(data.execution_id);
-      setVisibleStages(data.stages);
+      await readServerEvents(response, (event, data) => {
+        if (event === 'stage') {
+          // Replace the provisional reasoning card once the full reasoning arrives
+          setVisibleStages((stages) => [...stages.filter((s) => !s.streaming), data]);
+        } else if (event === 'reasoning_delta') {
+          setVisibleStages((stages) => {
+            const last = stages[stages.length - 1];
+            if (last && last.streaming) {
+              return [...stages.slice(0, -1), { ...last, payload: { text: last.payload.text + data.text } }];
+            }
+            return [...stages, { type: 'REASONING', payload: { text: data.text }, streaming: true }];
+          });
+        } else if (event === 'done') {
+          setExecutionId(data.execution_id);
+        } else if (event === 'error') {
+          throw new Error(data.error);
+        }
+      });
     } catch (err) {
       console.error('API Error:', err);
       setError(err.message || 'Failed to process answers');
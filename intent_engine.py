@@ -1,10 +1,10 @@
 import os
 import re
 import json
-from google import genai
-from google.genai import types
 from dotenv import load_dotenv
 
+from llm_provider import get_provider
+
 # Load environment variables from .env file in parent directory
 env_path = os.path.join(os.path.dirname(__file__), '.env')
 load_dotenv(env_path)
@@ -14,6 +14,53 @@ if os.getenv('GOOGLE_API_KEY'):
     os.environ['GEMINI_API_KEY'] = os.getenv('GOOGLE_API_KEY')
 
 
+class KeywordClassifier:
+    """
+    Single-pass keyword classifier compiled once from a {action: [keywords]} table.
+    Table order is priority order. Keywords match as substrings, like `in`.
+    """
+
+    def __init__(self, keyword_table):
+        self.actions = list(keyword_table)
+
+        keywords = {}
+        for action, words in keyword_table.items():
+            for word in words:
+                keywords.setdefault(word.lower(), []).append(action)
+
+        # Lookahead so every start position is tried; longest alternative first.
+        # Keywords that are prefixes of the matched one start at the same position,
+        # so each match expands to all of them (overlapping matches are never lost).
+        alternation = '|'.join(re.escape(k) for k in sorted(keywords, key=len, reverse=True))
+        self._pattern = re.compile(f'(?=({alternation}))')
+        self._expansions = {
+            word: [(action, prefix) for prefix in keywords if word.startswith(prefix) for action in keywords[prefix]]
+            for word in keywords
+        }
+
+    def scan(self, text):
+        """
+        Return {action: [(start, end, keyword), ...]} for every keyword occurrence,
+        with actions in priority order.
+        """
+        found = {}
+        for match in self._pattern.finditer(text.lower()):
+            start = match.start()
+            for action, keyword in self._expansions[match.group(1)]:
+                found.setdefault(action, []).append((start, start + len(keyword), keyword))
+        return {action: found[action] for action in self.actions if action in found}
+
+    def classify(self, text, default=None):
+        """Highest-priority action whose keywords occur in text"""
+        return next(iter(self.scan(text)), default)
+
+    def scan_many(self, texts):
+        return [self.scan(text) for text in texts]
+
+    def classify_many(self, texts, default=None):
+        return [self.classify(text, default) for text in texts]
+
+
 class IntentEngine:
     """
     Deterministic intent token generator with strict validation and budget tracking.
@@ -58,6 +105,19 @@ class IntentEngine:
         }
     }
 
+    # Keywords per action type, in priority order (first matching action wins)
+    ACTION_KEYWORDS = {
+        "BOOK_FLIGHT": ["flight", "fly", "airplane"],
+        "BOOK_TRAIN": ["train", "rail", "shinkansen"],
+        "BOOK_HOTEL": ["hotel", "accommodation", "check-in", "check in"],
+        "BOOK_RESTAURANT": ["restaurant", "dine", "dinner", "lunch", "breakfast", "cafe"],
+        "BOOK_ATTRACTION": ["ticket", "attraction", "museum", "tour", "temple", "shrine"],
+        "BOOK_TRANSPORT": ["taxi", "uber", "transport", "bus"],
+        "MAKE_PAYMENT": ["pay", "payment"],
+    }
+
+    ACTION_CLASSIFIER = KeywordClassifier(ACTION_KEYWORDS)
+
     @staticmethod
     def get_budget_display(action_type):
         """
@@ -116,24 +176,14 @@ class IntentEngine:
         """
         Deterministically extract action type from step description.
         """
-        step_lower = step_description.lower()
-
-        if "flight" in step_lower or "fly" in step_lower or "airplane" in step_lower:
-            return "BOOK_FLIGHT"
-        elif "train" in step_lower or "rail" in step_lower or "shinkansen" in step_lower:
-            return "BOOK_TRAIN"
-        elif "hotel" in step_lower or "accommodation" in step_lower or "check-in" in step_lower or "check in" in step_lower:
-            return "BOOK_HOTEL"
-        elif "restaurant" in step_lower or "dine" in step_lower or "dinner" in step_lower or "lunch" in step_lower or "breakfast" in step_lower or "cafe" in step_lower:
-            return "BOOK_RESTAURANT"
-        elif "ticket" in step_lower or "attraction" in step_lower or "museum" in step_lower or "tour" in step_lower or "temple" in step_lower or "shrine" in step_lower:
-            return "BOOK_ATTRACTION"
-        elif "taxi" in step_lower or "uber" in step_lower or "transport" in step_lower or "bus" in step_lower:
-            return "BOOK_TRANSPORT"
-        elif "pay" in step_lower or "payment" in step_lower:
-            return "MAKE_PAYMENT"
-        else:
-            return "GENERAL_ACTION"
+        return IntentEngine.ACTION_CLASSIFIER.classify(step_description, "GENERAL_ACTION")
+
+    @staticmethod
+    def extract_action_types(step_descriptions):
+        """
+        Classify many step descriptions at once.
+        """
+        return IntentEngine.ACTION_CLASSIFIER.classify_many(step_descriptions, "GENERAL_ACTION")
 
     @classmethod
     def generate_intent_token(cls, step_number, step_description, step_data):
@@ -165,6 +215,40 @@ class IntentEngine:
 
         return intent_token
 
+    @classmethod
+    def plan_response_schema(cls, action_type):
+        """
+        JSON schema for a structured plan: reasoning plus steps whose `fields`
+        are the action's required and optional parameters. Every field is
+        listed as required but nullable, as strict structured output expects.
+        """
+        schema = cls.ACTION_SCHEMAS.get(action_type, {"required": [], "optional": []})
+        field_names = schema['required'] + schema.get('optional', [])
+
+        step = {
+            "type": "object",
+            "properties": {
+                "description": {"type": "string"},
+                "fields": {
+                    "type": "object",
+                    "properties": {name: {"type": ["string", "null"]} for name in field_names},
+                    "required": field_names,
+                    "additionalProperties": False
+                }
+            },
+            "required": ["description", "fields"],
+            "additionalProperties": False
+        }
+        return {
+            "type": "object",
+            "properties": {
+                "reasoning": {"type": "string"},
+                "steps": {"type": "array", "items": step}
+            },
+            "required": ["reasoning", "steps"],
+            "additionalProperties": False
+        }
+
 
 def ask_yes_no_questions(questions):
     """
@@ -237,127 +321,179 @@ def ask_yes_no_questions(questions):
     return responses
 
 
-def extract_structured_data(step_text):
+class StructuredDataExtractor:
     """
-    Extract structured data from step text with enhanced patterns.
+    Structured-data extractor for plan steps. Every pattern is compiled once at
+    import and each text is lowercased once; pattern lists are tried in priority
+    order and stop at the first hit.
     """
-    data = {}
 
-    # Extract dates
-    date_pattern = r'(?:on\s+)?(\d{1,2}[-/]\d{1,2}[-/]\d{2,4}|\d{4}-\d{2}-\d{2}|(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},?\s+\d{4}|Day\s+\d+)'
-    dates = re.findall(date_pattern, step_text, re.IGNORECASE)
-    if dates:
-        data['date'] = dates[0]
+    DATE_PATTERN = re.compile(
+        r'(?:on\s+)?(\d{1,2}[-/]\d{1,2}[-/]\d{2,4}|\d{4}-\d{2}-\d{2}|(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},?\s+\d{4}|Day\s+\d+)',
+        re.IGNORECASE
+    )
 
-    # Extract times
-    time_patterns = [
+    TIME_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
         r'(\d{1,2}:\d{2}\s*(?:AM|PM|am|pm))',
         r'(\d{1,2}\s*(?:AM|PM|am|pm))',
         r'at\s+(\d{1,2}:\d{2})',
         r'(\d{1,2}h\d{2})',
-    ]
+    )]
+
+    # Keywords -> default time when no explicit time is given
+    TIME_DEFAULTS = (
+        (('morning', 'breakfast'), '9:00 AM'),
+        (('afternoon', 'lunch'), '1:00 PM'),
+        (('evening', 'dinner'), '7:00 PM'),
+    )
 
-    for pattern in time_patterns:
-        times = re.findall(pattern, step_text, re.IGNORECASE)
-        if times:
-            data['time'] = times[0]
-            break
-
-    if 'time' not in data:
-        if 'morning' in step_text.lower() or 'breakfast' in step_text.lower():
-            data['time'] = '9:00 AM'
-        elif 'afternoon' in step_text.lower() or 'lunch' in step_text.lower():
-            data['time'] = '1:00 PM'
-        elif 'evening' in step_text.lower() or 'dinner' in step_text.lower():
-            data['time'] = '7:00 PM'
-
-    # Extract prices
-    price_patterns = [
+    PRICE_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
         r'(?:¥|JPY)\s*(\d+(?:,\d{3})*)',
         r'(?:[$]|USD)\s*(\d+(?:,\d{3})*(?:\.\d{2})?)',
         r'(?:€|EUR)\s*(\d+(?:,\d{3})*(?:\.\d{2})?)',
         r'(\d+(?:,\d{3})*)\s*(?:JPY|USD|EUR|yen|dollars)',
-    ]
-
-    for pattern in price_patterns:
-        prices = re.findall(pattern, step_text, re.IGNORECASE)
-        if prices:
-            data['price'] = prices[0].replace(',', '')
-            break
+    )]
 
-    # Extract websites
-    website_patterns = [
+    WEBSITE_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
         r'(?:https?://)?(?:www\.)?([a-zA-Z0-9-]+\.(?:com|net|org|co\.uk|co\.jp|io))',
         r'on\s+([A-Z][a-zA-Z0-9]+(?:\.com|\.jp|\.net))',
         r'via\s+([A-Z][a-zA-Z0-9]+(?:\.com|\.jp|\.net))',
-    ]
+    )]
 
-    for pattern in website_patterns:
-        websites = re.findall(pattern, step_text, re.IGNORECASE)
-        if websites:
-            website = websites[0]
-            if '.' not in website:
-                website = website + '.com'
-            data['website'] = website.lower()
-            break
-
-    # Extract locations
-    location_patterns = [
+    LOCATION_PATTERNS = [re.compile(p) for p in (
         r'from\s+([A-Z][a-zA-Z\s]+?(?:Airport|Station|Terminal))',
         r'to\s+([A-Z][a-zA-Z\s]+?(?:Airport|Station|Terminal))',
         r'at\s+([A-Z][a-zA-Z\s&\'-]+?)(?:\s*\(|,|\.|$)',
         r'Location:\s*([A-Z][^(]+?)(?:\(|$)',
         r'in\s+([A-Z][a-zA-Z\s]+?)(?:\s+area|,|\.|$)',
-    ]
+    )]
+    FROM_PATTERN = re.compile(r'from\s+([A-Z][a-zA-Z\s]+?)(?:\s+to|\()')
+    TO_PATTERN = re.compile(r'to\s+([A-Z][a-zA-Z\s]+?)(?:\s*\(|,|\.)')
+
+    NAME_PATTERNS = [re.compile(p, re.IGNORECASE) for p in (
+        r'(?:hotel|stay at)\s+([A-Z][a-zA-Z\s&\'-]+?)(?:\s*\(|,|\.|\s+in)',
+        r'(?:restaurant|cafe|dine at)\s+([A-Z][a-zA-Z\s&\'-]+?)(?:\s*\(|,|\.)',
+        r'(?:visit|explore)\s+([A-Z][a-zA-Z\s&\'-]+?)(?:\s*\(|,|\.)',
+    )]
 
-    for pattern in location_patterns:
-        locations = re.findall(pattern, step_text)
-        if locations:
-            location = locations[0].strip()
+    CHECKIN_PATTERN = re.compile(r'(?:check-in|check in).*?(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})', re.IGNORECASE)
+    CHECKOUT_PATTERN = re.compile(r'(?:check-out|check out).*?(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})', re.IGNORECASE)
 
-            if 'from' in step_text.lower() and 'to' in step_text.lower():
-                from_match = re.search(r'from\s+([A-Z][a-zA-Z\s]+?)(?:\s+to|\()', step_text)
-                to_match = re.search(r'to\s+([A-Z][a-zA-Z\s]+?)(?:\s*\(|,|\.)', step_text)
+    @staticmethod
+    def _first(patterns, text):
+        for pattern in patterns:
+            match = pattern.search(text)
+            if match:
+                return match
+        return None
+
+    def extract(self, step_text):
+        """
+        Extract structured data from step text with enhanced patterns.
+        """
+        data = {}
+        text_lower = step_text.lower()
+
+        # Extract dates
+        match = self.DATE_PATTERN.search(step_text)
+        if match:
+            data['date'] = match.group(1)
+
+        # Extract times
+        match = self._first(self.TIME_PATTERNS, step_text)
+        if match:
+            data['time'] = match.group(1)
+        else:
+            for keywords, default_time in self.TIME_DEFAULTS:
+                if any(keyword in text_lower for keyword in keywords):
+                    data['time'] = default_time
+                    break
+
+        # Extract prices
+        match = self._first(self.PRICE_PATTERNS, step_text)
+        if match:
+            data['price'] = match.group(1).replace(',', '')
+
+        # Extract websites
+        match = self._first(self.WEBSITE_PATTERNS, step_text)
+        if match:
+            website = match.group(1)
+            if '.' not in website:
+                website = website + '.com'
+            data['website'] = website.lower()
+
+        # Extract locations
+        match = self._first(self.LOCATION_PATTERNS, step_text)
+        if match:
+            if 'from' in text_lower and 'to' in text_lower:
+                from_match = self.FROM_PATTERN.search(step_text)
+                to_match = self.TO_PATTERN.search(step_text)
                 if from_match:
                     data['origin'] = from_match.group(1).strip()
                 if to_match:
                     data['destination'] = to_match.group(1).strip()
             else:
-                data['location'] = location
-            break
-
-    # Extract specific names
-    name_patterns = [
-        r'(?:hotel|stay at)\s+([A-Z][a-zA-Z\s&\'-]+?)(?:\s*\(|,|\.|\s+in)',
-        r'(?:restaurant|cafe|dine at)\s+([A-Z][a-zA-Z\s&\'-]+?)(?:\s*\(|,|\.)',
-        r'(?:visit|explore)\s+([A-Z][a-zA-Z\s&\'-]+?)(?:\s*\(|,|\.)',
-    ]
+                data['location'] = match.group(1).strip()
 
-    for pattern in name_patterns:
-        names = re.findall(pattern, step_text, re.IGNORECASE)
-        if names:
-            name = names[0].strip()
-            if 'hotel' in step_text.lower() or 'stay' in step_text.lower():
+        # Extract specific names
+        match = self._first(self.NAME_PATTERNS, step_text)
+        if match:
+            name = match.group(1).strip()
+            if 'hotel' in text_lower or 'stay' in text_lower:
                 data['hotel_name'] = name
-            elif 'restaurant' in step_text.lower() or 'cafe' in step_text.lower() or 'dine' in step_text.lower():
+            elif 'restaurant' in text_lower or 'cafe' in text_lower or 'dine' in text_lower:
                 data['restaurant_name'] = name
             else:
                 data['attraction_name'] = name
-            break
 
-    # Check-in/Check-out for hotels
-    checkin_pattern = r'(?:check-in|check in).*?(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})'
-    checkout_pattern = r'(?:check-out|check out).*?(\d{1,2}[-/]\d{1,2}[-/]\d{2,4})'
+        # Check-in/Check-out for hotels
+        checkin = self.CHECKIN_PATTERN.search(step_text)
+        checkout = self.CHECKOUT_PATTERN.search(step_text)
 
-    checkin = re.search(checkin_pattern, step_text, re.IGNORECASE)
-    checkout = re.search(checkout_pattern, step_text, re.IGNORECASE)
+        if checkin:
+            data['check_in'] = checkin.group(1)
+        if checkout:
+            data['check_out'] = checkout.group(1)
 
-    if checkin:
-        data['check_in'] = checkin.group(1)
-    if checkout:
-        data['check_out'] = checkout.group(1)
+        return data
 
-    return data
+    def extract_many(self, texts):
+        """
+        Extract structured data for many step texts at once.
+        """
+        return [self.extract(text) for text in texts]
+
+
+STRUCTURED_DATA_EXTRACTOR = StructuredDataExtractor()
+
+
+def extract_structured_data(step_text):
+    """
+    Extract structured data from step text with enhanced patterns.
+    """
+    return STRUCTURED_DATA_EXTRACTOR.extract(step_text)
+
+
+STEP_PATTERN = re.compile(r'(?:Step\s+)?(\d+)[.:]?\s+(.*?)(?=(?:Step\s+)?\d+[.:]|$)', re.DOTALL | re.IGNORECASE)
+REASONING_PATTERN = re.compile(r'<Reasoning>(.*?)</Reasoning>', re.DOTALL)
+PLAN_PATTERN = re.compile(r'<Plan>(.*?)</Plan>', re.DOTALL)
+
+
+def _step_from_match(match):
+    """
+    Build a step dict from a STEP_PATTERN match (None for fragments too short to be a step).
+    """
+    step_num = int(match.group(1))
+    step_content = match.group(2).strip()
+
+    if len(step_content) < 10:
+        return None
+
+    return {
+        "step_number": step_num,
+        "description": step_content,
+        "structured_data": extract_structured_data(step_content)
+    }
 
 
 def parse_step_wise_plan(plan_text):
@@ -366,25 +502,148 @@ def parse_step_wise_plan(plan_text):
     """
     steps = []
 
-    step_pattern = r'(?:Step\s+)?(\d+)[.:]?\s+(.*?)(?=(?:Step\s+)?\d+[.:]|$)'
-    matches = re.finditer(step_pattern, plan_text, re.DOTALL | re.IGNORECASE)
+    for match in STEP_PATTERN.finditer(plan_text):
+        step = _step_from_match(match)
+        if step:
+            steps.append(step)
 
-    for match in matches:
-        step_num = int(match.group(1))
-        step_content = match.group(2).strip()
+    return steps
 
-        if len(step_content) < 10:
-            continue
 
-        step_data = extract_structured_data(step_content)
+def split_plan_response(raw_text):
+    """
+    Split an LLM completion into (reasoning, plan) using its <Reasoning>/<Plan> tags.
+    """
+    reasoning_match = REASONING_PATTERN.search(raw_text)
+    plan_match = PLAN_PATTERN.search(raw_text)
 
-        steps.append({
-            "step_number": step_num,
-            "description": step_content,
-            "structured_data": step_data
-        })
+    reasoning_content = reasoning_match.group(1).strip() if reasoning_match else "Reasoning not found."
+    plan_content = plan_match.group(1).strip() if plan_match else raw_text
+    return reasoning_content, plan_content
 
-    return steps
+
+def _default_step_token(step):
+    return IntentEngine.generate_intent_token(
+        step['step_number'],
+        step['description'],
+        step['structured_data']
+    )
+
+
+class StreamingPlanParser:
+    """
+    Incremental parser for streamed <Reasoning>/<Plan> completions.
+
+    feed() takes each text chunk and returns the events it made decidable:
+      {'type': 'reasoning_delta', 'text'}  - new reasoning text
+      {'type': 'reasoning', 'text'}        - the complete reasoning
+      {'type': 'step', 'step', 'intent_token'} - a step, once the next step marker
+                                               (or </Plan>) shows it is complete
+    close() flushes the rest and ends with
+      {'type': 'done', 'reasoning', 'plan', 'steps', 'intent_tokens'}
+    computed from the full text with `split_response`, so it always matches
+    the non-streaming result.
+    """
+
+    REASONING_OPEN, REASONING_CLOSE = '<Reasoning>', '</Reasoning>'
+    PLAN_OPEN, PLAN_CLOSE = '<Plan>', '</Plan>'
+
+    def __init__(self, token_factory=None, split_response=split_plan_response):
+        self.token_factory = token_factory or _default_step_token
+        self.split_response = split_response
+        self.raw = ''
+        self.reasoning = None
+        self.steps = []
+        self.intent_tokens = []
+        self._reasoning_sent = 0
+        self._scan_pos = 0
+        self._plan_closed = False
+
+    def feed(self, chunk):
+        self.raw += chunk
+        events = []
+        self._feed_reasoning(events)
+        self._feed_plan(events)
+        return events
+
+    def _tagged_text(self, open_tag, close_tag):
+        """
+        Text after open_tag so far, and whether close_tag has arrived. While the
+        tag is open, a tail that could be a partial close_tag is held back.
+        """
+        start = self.raw.find(open_tag)
+        if start < 0:
+            return None, False
+        start += len(open_tag)
+        end = self.raw.find(close_tag, start)
+        if end >= 0:
+            return self.raw[start:end], True
+        return self.raw[start:max(start, len(self.raw) - len(close_tag) + 1)], False
+
+    def _feed_reasoning(self, events):
+        if self.reasoning is not None:
+            return
+        text, closed = self._tagged_text(self.REASONING_OPEN, self.REASONING_CLOSE)
+        if text is None:
+            return
+        if len(text) > self._reasoning_sent:
+            events.append({'type': 'reasoning_delta', 'text': text[self._reasoning_sent:]})
+            self._reasoning_sent = len(text)
+        if closed:
+            self.reasoning = text.strip()
+            events.append({'type': 'reasoning', 'text': self.reasoning})
+
+    def _feed_plan(self, events):
+        if self._plan_closed:
+            return
+        plan, closed = self._tagged_text(self.PLAN_OPEN, self.PLAN_CLOSE)
+        if plan is None:
+            return
+
+        matches = list(STEP_PATTERN.finditer(plan, self._scan_pos))
+        if not closed:
+            # The last step runs to the end of the buffer and may still be growing
+            matches = matches[:-1]
+        for match in matches:
+            self._scan_pos = match.end()
+            self._emit_step(_step_from_match(match), events)
+        self._plan_closed = closed
+
+    def _emit_step(self, step, events):
+        if not step:
+            return
+        token = self.token_factory(step)
+        self.steps.append(step)
+        self.intent_tokens.append(token)
+        events.append({'type': 'step', 'step': step, 'intent_token': token})
+
+    @property
+    def plan_text(self):
+        """Plan text received so far"""
+        plan, _ = self._tagged_text(self.PLAN_OPEN, self.PLAN_CLOSE)
+        return plan or ''
+
+    def close(self):
+        events = []
+        reasoning, plan = self.split_response(self.raw)
+
+        if self.reasoning is None:
+            self.reasoning = reasoning
+            events.append({'type': 'reasoning', 'text': reasoning})
+
+        # Steps the stream could not settle (untagged plans, the final step)
+        final_steps = parse_step_wise_plan(plan)
+        for step in final_steps[len(self.steps):]:
+            self._emit_step(step, events)
+
+        events.append({
+            'type': 'done',
+            'reasoning': reasoning,
+            'plan': plan,
+            'steps': final_steps,
+            'intent_tokens': self.intent_tokens
+        })
+        return events
 
 
 def create_yes_no_question(field, step_num, action, step_description, suggested_value=None):
@@ -592,9 +851,9 @@ def display_budget_summary(intent_tokens):
     print("\n" + "="*80)
 
 
-def get_travel_plan_with_intents(user_prompt, user_responses=None, iteration=0):
+def build_travel_prompt(user_prompt, user_responses=None):
     """
-    Travel planner with yes/no questions and budget display.
+    Build the full planning prompt, including any non-yes/no questionnaire answers.
     """
     overhead_prompt = (
         "You are a travel planning AI. Provide step-by-step plans with complete details.\n\n"
@@ -624,41 +883,180 @@ def get_travel_plan_with_intents(user_prompt, user_responses=None, iteration=0):
         overhead_prompt += "\n"
 
     overhead_prompt += "User Request: "
-    full_prompt = overhead_prompt + user_prompt
+    return overhead_prompt + user_prompt
 
-    client = genai.Client()
 
-    print(f"\n{'='*80}")
-    print(f"🤖 GEMINI PROCESSING... (Iteration {iteration + 1})")
-    print(f"{'='*80}")
+# Seconds to wait for Gemini (the pro model thinks before it answers)
+GEMINI_TIMEOUT = 120
+
+
+def stream_travel_plan(user_prompt, user_responses=None):
+    """
+    Stream the plan from Gemini, yielding StreamingPlanParser events as
+    reasoning and completed steps (with their intent tokens) arrive.
+    """
+    parser = StreamingPlanParser()
 
-    response = client.models.generate_content(
+    for delta in get_provider('gemini').stream(
+        [{'role': 'user', 'content': build_travel_prompt(user_prompt, user_responses)}],
         model="gemini-2.5-pro",
-        contents=full_prompt,
-        config=types.GenerateContentConfig(
-            temperature=0.3,
-        ),
+        temperature=0.3,
+        timeout=GEMINI_TIMEOUT,
+    ):
+        yield from parser.feed(delta)
+
+    yield from parser.close()
+
+
+# Model for filling in individual fields during refinement (small, latency-bound task)
+REFINE_MODEL = "gemini-2.5-flash"
+
+# Values implied by answering 'yes' to a prioritize_missing_fields question
+# (the defaults its question text proposes). Other yes/no answers leave the
+# field for the LLM to fill in.
+YES_ANSWER_VALUES = {
+    'time': '9:00 AM',
+    'price': '$100',
+    'website': 'Booking.com',
+}
+
+
+def apply_answers(steps, responses):
+    """
+    Patch answered fields into their steps' structured_data. Returns
+    ({step_number: {field: value}} patched, {step_number: [fields still needing generation]}).
+    """
+    by_number = {step['step_number']: step for step in steps}
+    patched = {}
+    needs_generation = {}
+
+    for response_data in responses.values():
+        step = by_number.get(response_data.get('step'))
+        field = response_data.get('field')
+        if step is None or not field:
+            continue
+
+        answer = response_data['answer']
+        if answer == 'yes':
+            value = YES_ANSWER_VALUES.get(field)
+        elif answer == 'no':
+            value = None
+        else:
+            value = answer
+
+        if value:
+            step['structured_data'][field] = value
+            patched.setdefault(step['step_number'], {})[field] = value
+        else:
+            needs_generation.setdefault(step['step_number'], []).append(field)
+
+    return patched, needs_generation
+
+
+def generate_missing_fields(user_prompt, steps, needs_generation):
+    """
+    Ask the LLM for only the listed fields of the listed steps, as schema-constrained
+    JSON. Returns {step_number: {field: value}} for the values it could supply.
+    """
+    by_number = {step['step_number']: step for step in steps}
+    properties = {
+        f"step_{number}": {
+            "type": "object",
+            "properties": {field: {"type": ["string", "null"]} for field in fields},
+            "required": fields,
+            "additionalProperties": False
+        }
+        for number, fields in needs_generation.items()
+    }
+    schema = {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+    prompt = (
+        "You are completing an existing travel plan. Fill in ONLY the listed fields of each step "
+        "with exact, specific values (e.g. '10:30 AM', 'December 15, 2024', a full address, "
+        "'Booking.com', '$120'). Use null only if a value cannot be determined.\n\n"
+        f"User Request: {user_prompt}\n\n"
+    )
+    for number, fields in needs_generation.items():
+        prompt += f"Step {number}: {by_number[number]['description']}\n  Fields: {', '.join(fields)}\n"
+
+    raw_text = get_provider('gemini').complete(
+        [{'role': 'user', 'content': prompt}],
+        model=REFINE_MODEL,
+        temperature=0.3,
+        timeout=GEMINI_TIMEOUT,
+        response_schema=schema,
     )
-    raw_text = response.text
 
-    reasoning_match = re.search(r'<Reasoning>(.*?)</Reasoning>', raw_text, re.DOTALL)
-    plan_match = re.search(r'<Plan>(.*?)</Plan>', raw_text, re.DOTALL)
+    try:
+        reply = json.loads(raw_text)
+    except ValueError as e:
+        print(f"   ⚠️  Field generation returned invalid JSON, skipping: {e}")
+        return {}
+    if not isinstance(reply, dict):
+        print("   ⚠️  Field generation did not return an object, skipping")
+        return {}
+
+    generated = {}
+    for key, fields in reply.items():
+        try:
+            number = int(key.split('_', 1)[1])
+        except (IndexError, ValueError):
+            print(f"   ⚠️  Ignoring unexpected key in generated fields: {key!r}")
+            continue
+        if not isinstance(fields, dict):
+            continue
+        values = {field: value for field, value in fields.items() if value}
+        if values:
+            generated[number] = values
+    return generated
 
-    reasoning_content = reasoning_match.group(1).strip() if reasoning_match else "Reasoning not found."
-    plan_content = plan_match.group(1).strip() if plan_match else raw_text
 
-    print(f"\n⚙️  Generating intent tokens...")
-    steps = parse_step_wise_plan(plan_content)
-    intent_tokens = []
+def refine_travel_plan(user_prompt, reasoning_content, plan_content, steps, intent_tokens,
+                       user_responses, new_responses, iteration):
+    """
+    Delta refinement: patch the answers into the existing steps, have the LLM
+    generate only the fields the answers could not supply, and regenerate
+    intent tokens for the affected steps instead of re-planning from scratch.
+    """
+    print(f"\n{'='*80}")
+    print(f"🔧 REFINING PLAN... (Iteration {iteration + 1})")
+    print(f"{'='*80}")
+
+    patched, needs_generation = apply_answers(steps, new_responses)
+
+    if needs_generation:
+        print(f"\n🤖 Generating {sum(len(f) for f in needs_generation.values())} field(s) with Gemini...")
+        by_number = {step['step_number']: step for step in steps}
+        for number, values in generate_missing_fields(user_prompt, steps, needs_generation).items():
+            if number in by_number:
+                by_number[number]['structured_data'].update(values)
+                patched.setdefault(number, {}).update(values)
+
+    print(f"\n⚙️  Regenerating intent tokens for {len(patched)} step(s)...")
+    tokens_by_step = {token['payload']['step_number']: token for token in intent_tokens}
+    intent_tokens = [
+        tokens_by_step[step['step_number']]
+        if step['step_number'] not in patched and step['step_number'] in tokens_by_step
+        else _default_step_token(step)
+        for step in steps
+    ]
 
-    for step in steps:
-        token = IntentEngine.generate_intent_token(
-            step['step_number'],
-            step['description'],
-            step['structured_data']
+    if patched:
+        plan_content += "\n\nRefined details:\n" + "\n".join(
+            f"Step {number} {field}: {value}"
+            for number, values in sorted(patched.items()) for field, value in values.items()
         )
-        intent_tokens.append(token)
 
+    return _finish_or_ask(user_prompt, reasoning_content, plan_content, steps, intent_tokens,
+                          user_responses, iteration, stream=False, refine=True)
+
+
+def _finish_or_ask(user_prompt, reasoning_content, plan_content, steps, intent_tokens,
+                   user_responses, iteration, stream, refine):
+    """
+    Show the budget, then either return the plan or ask about missing fields
+    and go round again (refining the plan, or regenerating it).
+    """
     # Display budget summary
     display_budget_summary(intent_tokens)
 
@@ -674,11 +1072,56 @@ def get_travel_plan_with_intents(user_prompt, user_responses=None, iteration=0):
         else:
             user_responses = new_responses
 
-        return get_travel_plan_with_intents(user_prompt, user_responses, iteration + 1)
+        if refine:
+            return refine_travel_plan(user_prompt, reasoning_content, plan_content, steps, intent_tokens,
+                                      user_responses, new_responses, iteration + 1)
+        return get_travel_plan_with_intents(user_prompt, user_responses, iteration + 1, stream)
 
     return reasoning_content, plan_content, intent_tokens
 
 
+def get_travel_plan_with_intents(user_prompt, user_responses=None, iteration=0, stream=False, refine=False):
+    """
+    Travel planner with yes/no questions and budget display.
+    With stream=True, intent tokens are printed as each step completes.
+    With refine=True, answers are patched into the first plan instead of
+    regenerating it (see refine_travel_plan).
+    """
+    print(f"\n{'='*80}")
+    print(f"🤖 GEMINI PROCESSING... (Iteration {iteration + 1})")
+    print(f"{'='*80}")
+
+    if stream:
+        for event in stream_travel_plan(user_prompt, user_responses):
+            if event['type'] == 'step':
+                payload = event['intent_token']['payload']
+                print(f"   ⚡ Step {payload['step_number']} ready: {payload['action']} "
+                      f"({'complete' if payload['data_complete'] else 'missing ' + ', '.join(payload['missing_fields'])})")
+            elif event['type'] == 'done':
+                reasoning_content = event['reasoning']
+                plan_content = event['plan']
+                steps = event['steps']
+        # Tokens from the same final parse as the steps: the streamed steps can
+        # differ from it (untagged plans), and refinement pairs the two by step
+        intent_tokens = [_default_step_token(step) for step in steps]
+    else:
+        raw_text = get_provider('gemini').complete(
+            [{'role': 'user', 'content': build_travel_prompt(user_prompt, user_responses)}],
+            model="gemini-2.5-pro",
+            temperature=0.3,
+            timeout=GEMINI_TIMEOUT,
+        )
+
+        reasoning_content, plan_content = split_plan_response(raw_text)
+
+        print(f"\n⚙️  Generating intent tokens...")
+        steps = parse_step_wise_plan(plan_content)
+        intent_tokens = [_default_step_token(step) for step in steps]
+
+    return _finish_or_ask(user_prompt, reasoning_content, plan_content, steps, intent_tokens,
+                          user_responses, iteration, stream, refine)
+
+
 # --- Main Execution ---
 if __name__ == "__main__":
     print("="*80)
@@ -687,7 +1130,7 @@ if __name__ == "__main__":
 
     my_prompt = "I want a 3-day trip to Tokyo focused on anime and food."
 
-    reasoning, plan, intent_tokens = get_travel_plan_with_intents(my_prompt)
+    reasoning, plan, intent_tokens = get_travel_plan_with_intents(my_prompt, refine=True)
 
     print("\n" + "="*80)
     print("🧠 GEMINI INTERNAL REASONING")
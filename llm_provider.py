@@ -0,0 +1,460 @@
+"""
+Pooled LLM provider clients
+
+OpenAI and Gemini sit behind one interface (complete / stream) and are called
+over HTTPS through one process-wide requests.Session per provider, so
+connections and their TLS sessions are kept alive and reused across requests
+instead of paying a fresh handshake on every call. Transient failures
+(connection errors, timeouts, 429 and 5xx responses) are retried with
+full-jitter exponential backoff. Concurrent identical calls (same provider,
+model, temperature and messages) share one upstream request (single_flight.py).
+Each provider has a circuit breaker (resilience.py): after repeated upstream
+failures calls fail fast with CircuitOpenError until a cool-down probe succeeds.
+
+acomplete() is the awaitable form used by the ASGI server (api/asgi.py). It
+goes through a pooled httpx.AsyncClient (optional dependency) and shares the
+provider's retry settings, circuit breaker and statistics.
+
+complete() and acomplete() take an optional `response_schema` (JSON Schema):
+the provider is asked for JSON output conforming to it (OpenAI json_schema
+response format, Gemini responseSchema).
+
+Configuration (environment):
+  LLM_POOL_SIZE     keep-alive connections per provider (default 10)
+  LLM_MAX_RETRIES   retries after the first attempt (default 2)
+  LLM_BACKOFF_BASE  base backoff in seconds (default 0.5)
+  LLM_BACKOFF_MAX   backoff cap in seconds (default 8)
+  LLM_BREAKER_FAILURES  consecutive failures that open the circuit (default 5)
+  LLM_BREAKER_COOLDOWN  seconds before a half-open probe (default 30)
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from resilience import CircuitBreaker
+from single_flight import AsyncSingleFlight, SingleFlight
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+def is_upstream_failure(error):
+    """Whether an error says the upstream is unhealthy (rather than that our request was bad)"""
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                          requests.exceptions.ChunkedEncodingError)):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return error.response.status_code in RETRY_STATUSES
+    if httpx is not None:
+        if isinstance(error, httpx.TransportError):
+            return True
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in RETRY_STATUSES
+    return False
+
+
+def backoff_delay(attempt, base, cap):
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class LLMProvider:
+    """
+    Chat completion client with a pooled keep-alive session and retries.
+    Subclasses describe the wire format: how to build the request and where
+    the text lives in full and streamed responses.
+    """
+
+    name = None
+    default_model = None
+    key_env = ()
+
+    def __init__(self, api_key=None, pool_size=None, max_retries=None, backoff_base=None, backoff_max=None):
+        self.api_key = api_key
+        self.pool_size = int(pool_size or os.getenv('LLM_POOL_SIZE', 10))
+        self.max_retries = int(max_retries if max_retries is not None else os.getenv('LLM_MAX_RETRIES', 2))
+        self.backoff_base = float(backoff_base or os.getenv('LLM_BACKOFF_BASE', 0.5))
+        self.backoff_max = float(backoff_max or os.getenv('LLM_BACKOFF_MAX', 8))
+
+        self.session = requests.Session()
+        # Retries are handled here (with jitter), not by urllib3
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+
+        self.flights = SingleFlight()
+        self.async_flights = AsyncSingleFlight()
+        self._async_client = None
+        self.breaker = CircuitBreaker(
+            self.name,
+            failure_threshold=int(os.getenv('LLM_BREAKER_FAILURES', 5)),
+            cooldown=float(os.getenv('LLM_BREAKER_COOLDOWN', 30))
+        )
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._retries = 0
+        self._failures = 0
+
+    def get_api_key(self):
+        key = self.api_key or next((os.getenv(env) for env in self.key_env if os.getenv(env)), None)
+        if not key:
+            raise ValueError(f'{self.key_env[0]} not found in environment')
+        return key
+
+    def flight_key(self, messages, model, temperature, response_schema=None):
+        """Canonical hash identifying identical calls"""
+        encoded = json.dumps(
+            [self.name, model or self.default_model, temperature, messages, response_schema],
+            sort_keys=True, separators=(',', ':'), ensure_ascii=False
+        )
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def complete(self, messages, model=None, temperature=0.3, timeout=30, max_retries=None, response_schema=None):
+        """Run a chat completion and return the response text (JSON text if response_schema is given)"""
+        return self.flights.do(
+            self.flight_key(messages, model, temperature, response_schema),
+            lambda: self._guarded_complete(messages, model, temperature, timeout, max_retries, response_schema)
+        )
+
+    def stream(self, messages, model=None, temperature=0.3, timeout=30, max_retries=None):
+        """
+        Run a streamed chat completion, yielding text deltas as they arrive.
+        Only opening the stream is retried; a stream that breaks midway raises.
+        """
+        return self.flights.stream(
+            self.flight_key(messages, model, temperature),
+            lambda: self._guarded_stream(messages, model, temperature, timeout, max_retries)
+        )
+
+    async def acomplete(self, messages, model=None, temperature=0.3, timeout=30, max_retries=None, response_schema=None):
+        """Awaitable complete() for use on an event loop"""
+        return await self.async_flights.do(
+            self.flight_key(messages, model, temperature, response_schema),
+            lambda: self._aguarded_complete(messages, model, temperature, timeout, max_retries, response_schema)
+        )
+
+    def _guarded_complete(self, *args):
+        self.breaker.before_call()
+        try:
+            result = self._complete(*args)
+        except Exception as e:
+            self.breaker.record(ok=not is_upstream_failure(e))
+            raise
+        self.breaker.record(ok=True)
+        return result
+
+    async def _aguarded_complete(self, *args):
+        self.breaker.before_call()
+        try:
+            result = await self._acomplete(*args)
+        except asyncio.CancelledError:
+            self.breaker.record(ok=True)
+            raise
+        except Exception as e:
+            self.breaker.record(ok=not is_upstream_failure(e))
+            raise
+        self.breaker.record(ok=True)
+        return result
+
+    def _guarded_stream(self, *args):
+        self.breaker.before_call()
+        ok = True
+        try:
+            yield from self._stream(*args)
+        except Exception as e:
+            ok = not is_upstream_failure(e)
+            raise
+        finally:
+            self.breaker.record(ok=ok)
+
+    def _complete(self, messages, model, temperature, timeout, max_retries, response_schema=None):
+        response = self._send(messages, model, temperature, timeout, max_retries, stream=False, response_schema=response_schema)
+        return self._response_text(response.json())
+
+    def _stream(self, messages, model, temperature, timeout, max_retries):
+        response = self._send(messages, model, temperature, timeout, max_retries, stream=True)
+        with response:
+            response.encoding = 'utf-8'
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data: '):
+                    continue
+                data = line[len('data: '):]
+                if data == '[DONE]':
+                    break
+                delta = self._delta_text(json.loads(data))
+                if delta:
+                    yield delta
+
+    def _send(self, messages, model, temperature, timeout, max_retries, stream, response_schema=None):
+        url, payload, headers = self._build_request(messages, model or self.default_model, temperature, stream, response_schema)
+        max_retries = self.max_retries if max_retries is None else max_retries
+        self._count('_requests')
+
+        for attempt in range(max_retries + 1):
+            last_attempt = attempt == max_retries
+            try:
+                response = self.session.post(url, json=payload, headers=headers, timeout=timeout, stream=stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if last_attempt:
+                    self._count('_failures')
+                    raise
+                reason = type(e).__name__
+            else:
+                if response.status_code not in RETRY_STATUSES or last_attempt:
+                    if not response.ok:
+                        self._count('_failures')
+                        response.close()
+                    response.raise_for_status()
+                    return response
+                response.close()
+                reason = f'HTTP {response.status_code}'
+
+            delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+            self._count('_retries')
+            logger.warning(f"{self.name} request failed ({reason}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+    async def _acomplete(self, messages, model, temperature, timeout, max_retries, response_schema=None):
+        response = await self._asend(messages, model, temperature, timeout, max_retries, response_schema)
+        return self._response_text(response.json())
+
+    def async_client(self):
+        """The provider's pooled AsyncClient, created on first use (must be called on the event loop)"""
+        if httpx is None:
+            raise RuntimeError('httpx is required for async LLM calls (pip install httpx)')
+        if self._async_client is None:
+            limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            self._async_client = httpx.AsyncClient(limits=limits)
+        return self._async_client
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    async def _asend(self, messages, model, temperature, timeout, max_retries, response_schema=None):
+        """_send() over httpx, sleeping on the event loop between retries"""
+        url, payload, headers = self._build_request(messages, model or self.default_model, temperature, False, response_schema)
+        max_retries = self.max_retries if max_retries is None else max_retries
+        client = self.async_client()
+        self._count('_requests')
+
+        for attempt in range(max_retries + 1):
+            last_attempt = attempt == max_retries
+            try:
+                response = await client.post(url, json=payload, headers=headers, timeout=timeout)
+            except httpx.TransportError as e:
+                if last_attempt:
+                    self._count('_failures')
+                    raise
+                reason = type(e).__name__
+            else:
+                if response.status_code not in RETRY_STATUSES or last_attempt:
+                    if response.is_error:
+                        self._count('_failures')
+                    response.raise_for_status()
+                    return response
+                reason = f'HTTP {response.status_code}'
+
+            delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+            self._count('_retries')
+            logger.warning(f"{self.name} request failed ({reason}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    def _build_request(self, messages, model, temperature, stream, response_schema=None):
+        raise NotImplementedError
+
+    def _response_text(self, data):
+        raise NotImplementedError
+
+    def _delta_text(self, event):
+        raise NotImplementedError
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self):
+        return {
+            'requests': self._requests,
+            'retries': self._retries,
+            'failures': self._failures,
+            'pool_size': self.pool_size,
+            'single_flight': self.flights.stats(),
+            'async_single_flight': self.async_flights.stats(),
+            'circuit': self.breaker.stats(),
+        }
+
+
+class OpenAIProvider(LLMProvider):
+    name = 'openai'
+    default_model = 'gpt-4o-mini'
+    key_env = ('OPENAI_API_KEY',)
+    url = 'https://api.openai.com/v1/chat/completions'
+
+    def _build_request(self, messages, model, temperature, stream, response_schema=None):
+        payload = {'model': model, 'messages': messages, 'temperature': temperature}
+        if stream:
+            payload['stream'] = True
+        if response_schema is not None:
+            payload['response_format'] = {
+                'type': 'json_schema',
+                'json_schema': {'name': 'response', 'schema': response_schema, 'strict': True}
+            }
+        return self.url, payload, {'Authorization': f'Bearer {self.get_api_key()}'}
+
+    def _response_text(self, data):
+        return data['choices'][0]['message']['content']
+
+    def _delta_text(self, event):
+        choices = event.get('choices') or [{}]
+        return choices[0].get('delta', {}).get('content')
+
+
+class GeminiProvider(LLMProvider):
+    """
+    Gemini over its REST API. The google-genai SDK opens a new requests.Session
+    for every call, so it cannot keep connections alive.
+    """
+
+    name = 'gemini'
+    default_model = 'gemini-2.5-pro'
+    key_env = ('GEMINI_API_KEY', 'GOOGLE_API_KEY')
+    url = 'https://generativelanguage.googleapis.com/v1beta/models/{model}:{method}'
+
+    def _build_request(self, messages, model, temperature, stream, response_schema=None):
+        system = [m['content'] for m in messages if m['role'] == 'system']
+        contents = [
+            {'role': 'model' if m['role'] == 'assistant' else 'user', 'parts': [{'text': m['content']}]}
+            for m in messages if m['role'] != 'system'
+        ]
+        payload = {'contents': contents, 'generationConfig': {'temperature': temperature}}
+        if response_schema is not None:
+            payload['generationConfig']['responseMimeType'] = 'application/json'
+            payload['generationConfig']['responseSchema'] = self.openapi_schema(response_schema)
+        if system:
+            payload['systemInstruction'] = {'parts': [{'text': '\n\n'.join(system)}]}
+
+        if stream:
+            url = self.url.format(model=model, method='streamGenerateContent') + '?alt=sse'
+        else:
+            url = self.url.format(model=model, method='generateContent')
+        return url, payload, {'x-goog-api-key': self.get_api_key()}
+
+    def _response_text(self, data):
+        return self._delta_text(data) or ''
+
+    @classmethod
+    def openapi_schema(cls, schema):
+        """
+        Gemini's responseSchema is an OpenAPI subset: nullable instead of
+        ["type", "null"], and no additionalProperties
+        """
+        converted = {}
+        for key, value in schema.items():
+            if key == 'additionalProperties':
+                continue
+            if key == 'type' and isinstance(value, list):
+                types = [t for t in value if t != 'null']
+                converted['type'] = types[0]
+                if 'null' in value:
+                    converted['nullable'] = True
+            elif key == 'properties':
+                converted[key] = {name: cls.openapi_schema(sub) for name, sub in value.items()}
+            elif key == 'items':
+                converted[key] = cls.openapi_schema(value)
+            else:
+                converted[key] = value
+        return converted
+
+    def _delta_text(self, event):
+        candidates = event.get('candidates') or [{}]
+        parts = candidates[0].get('content', {}).get('parts', [])
+        return ''.join(part.get('text', '') for part in parts)
+
+
+class StubProvider(LLMProvider):
+    """
+    Local provider with no network I/O, for exercising routing offline.
+    `latency` is seconds (or a callable returning seconds), `error_rate` the
+    chance a call fails, and `reply(messages)` produces the response text.
+    """
+
+    name = 'stub'
+    default_model = 'stub'
+
+    def __init__(self, name='stub', latency=0.0, error_rate=0.0, reply=None, **kwargs):
+        super().__init__(api_key='stub', **kwargs)
+        self.name = name
+        self.latency = latency
+        self.error_rate = error_rate
+        self.reply = reply or (lambda messages: f"[{self.name}] {messages[-1]['content']}")
+
+    def _complete(self, messages, model, temperature, timeout, max_retries, response_schema=None):
+        self._count('_requests')
+        delay = self.latency() if callable(self.latency) else self.latency
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            self._count('_failures')
+            raise requests.exceptions.Timeout(f'{self.name} stub timed out')
+        time.sleep(delay)
+        if random.random() < self.error_rate:
+            self._count('_failures')
+            raise requests.exceptions.ConnectionError(f'{self.name} stub failure')
+        return self.reply(messages)
+
+    async def _acomplete(self, messages, model, temperature, timeout, max_retries, response_schema=None):
+        self._count('_requests')
+        delay = self.latency() if callable(self.latency) else self.latency
+        if timeout is not None and delay > timeout:
+            await asyncio.sleep(timeout)
+            self._count('_failures')
+            raise requests.exceptions.Timeout(f'{self.name} stub timed out')
+        await asyncio.sleep(delay)
+        if random.random() < self.error_rate:
+            self._count('_failures')
+            raise requests.exceptions.ConnectionError(f'{self.name} stub failure')
+        return self.reply(messages)
+
+    def _stream(self, messages, model, temperature, timeout, max_retries):
+        text = self._complete(messages, model, temperature, timeout, max_retries)
+        for start in range(0, len(text), 16):
+            yield text[start:start + 16]
+
+
+PROVIDERS = {
+    'openai': OpenAIProvider,
+    'gemini': GeminiProvider,
+    'stub': StubProvider,
+}
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_provider(name):
+    """The process-wide provider instance for `name` (created on first use)"""
+    provider = _instances.get(name)
+    if provider is None:
+        with _instances_lock:
+            provider = _instances.get(name)
+            if provider is None:
+                provider = _instances[name] = PROVIDERS[name]()
+    return provider
+
+
+def provider_stats():
+    return {name: provider.stats() for name, provider in _instances.items()}
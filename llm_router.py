@@ -0,0 +1,339 @@
+"""
+Latency-aware routing across LLM providers
+
+LLMRouter keeps an exponentially weighted moving average (EWMA) of latency and
+error rate per provider and sends each request to the fastest healthy one,
+failing over down the ranking when a call errors. Providers without samples
+rank first so every provider gets measured. The error rate decays towards zero
+with time since the provider's last call (half-life `error_half_life`), so a
+provider ranked last for its errors is tried again once they are old news
+instead of staying excluded until restart.
+
+With hedging on, if the chosen provider has not answered within its p95
+latency, the same request is also sent to the runner-up and whichever answers
+first wins. The slower call is left to finish in the background so its
+latency still feeds the statistics. acomplete() does the same on an asyncio
+event loop, for the ASGI server.
+
+Configuration (environment, see router_from_env):
+  LLM_PROVIDERS  comma-separated provider names, in preference order (default "openai")
+  LLM_MODELS     per-provider models, e.g. "gemini=gemini-2.5-flash,openai=gpt-4o-mini"
+  LLM_HEDGE      "1" to enable hedged requests (default off)
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from llm_provider import get_provider
+from resilience import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderHealth:
+    """EWMA latency/error rate plus a window of recent latencies for percentiles"""
+
+    __slots__ = ('ewma_latency', 'ewma_error', 'samples', 'latencies', 'last_sample')
+
+    def __init__(self, window):
+        self.ewma_latency = None
+        self.ewma_error = 0.0
+        self.samples = 0
+        self.latencies = deque(maxlen=window)
+        self.last_sample = None
+
+    def error_rate(self, now, half_life):
+        """ewma_error decayed by the time since the last sample"""
+        if self.last_sample is None or not half_life:
+            return self.ewma_error
+        return self.ewma_error * 0.5 ** ((now - self.last_sample) / half_life)
+
+    def percentile(self, q):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(q * (len(ordered) - 1))]
+
+
+class LLMRouter:
+    """
+    Routes complete()/stream() calls to the best provider. `models` maps a
+    provider name to the model to request from it (default: its default_model).
+    """
+
+    def __init__(self, providers, models=None, alpha=0.2, max_error_rate=0.5, hedge=False,
+                 hedge_quantile=0.95, hedge_min_delay=0.25, hedge_default_delay=2.0, window=100,
+                 error_half_life=60.0):
+        self.providers = list(providers)
+        self.models = models or {}
+        self.alpha = alpha
+        self.max_error_rate = max_error_rate
+        self.error_half_life = error_half_life
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_default_delay = hedge_default_delay
+
+        self._health = {provider.name: ProviderHealth(window) for provider in self.providers}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(4, 4 * len(self.providers)), thread_name_prefix='llm-hedge')
+        self._failovers = 0
+        self._hedged = 0
+        self._hedge_wins = 0
+        # Losing hedged calls left running on the event loop (keeps them referenced)
+        self._background = set()
+
+    def record(self, name, latency, ok):
+        """Fold one call outcome into the provider's EWMAs (latency only counts successes)"""
+        with self._lock:
+            health = self._health[name]
+            now = time.monotonic()
+            health.samples += 1
+            health.ewma_error = health.error_rate(now, self.error_half_life)
+            health.ewma_error += self.alpha * ((0.0 if ok else 1.0) - health.ewma_error)
+            health.last_sample = now
+            if ok:
+                health.latencies.append(latency)
+                if health.ewma_latency is None:
+                    health.ewma_latency = latency
+                else:
+                    health.ewma_latency += self.alpha * (latency - health.ewma_latency)
+
+    def error_rate(self, name):
+        return self._health[name].error_rate(time.monotonic(), self.error_half_life)
+
+    def is_healthy(self, provider):
+        return provider.breaker.available() and self.error_rate(provider.name) < self.max_error_rate
+
+    def ranked(self):
+        """
+        Healthy providers fastest first (unmeasured first of all), then the
+        unhealthy ones (open circuit or high error rate) by error rate
+        """
+        with self._lock:
+            health = dict(self._health)
+            healthy = [p for p in self.providers if self.is_healthy(p)]
+            unhealthy = [p for p in self.providers if not self.is_healthy(p)]
+            healthy.sort(key=lambda p: health[p.name].ewma_latency or 0.0)
+            unhealthy.sort(key=lambda p: self.error_rate(p.name))
+        return healthy + unhealthy
+
+    def hedge_delay(self, name):
+        """How long to wait on a provider before hedging: its p95 latency, within bounds"""
+        with self._lock:
+            health = self._health[name]
+            p95 = health.percentile(self.hedge_quantile) if len(health.latencies) >= 5 else None
+        if p95 is None:
+            return self.hedge_default_delay
+        return max(self.hedge_min_delay, p95)
+
+    def _call(self, provider, messages, temperature, timeout, max_retries, response_schema=None):
+        start = time.monotonic()
+        try:
+            result = provider.complete(
+                messages, model=self.models.get(provider.name), temperature=temperature,
+                timeout=timeout, max_retries=max_retries, response_schema=response_schema
+            )
+        except CircuitOpenError:
+            # Rejected locally; says nothing new about the provider
+            raise
+        except Exception:
+            self.record(provider.name, None, ok=False)
+            raise
+        self.record(provider.name, time.monotonic() - start, ok=True)
+        return result
+
+    def complete(self, messages, temperature=0.3, timeout=30, max_retries=None, response_schema=None):
+        """Chat completion text from the best provider (hedged if enabled)"""
+        remaining = self.ranked()
+        error = None
+
+        while remaining:
+            if self.hedge and len(remaining) > 1:
+                attempted, result, error = self._hedged_call(remaining[:2], messages, temperature, timeout, max_retries, response_schema)
+            else:
+                attempted = remaining[:1]
+                try:
+                    result, error = self._call(remaining[0], messages, temperature, timeout, max_retries, response_schema), None
+                except Exception as e:
+                    result, error = None, e
+            if error is None:
+                return result
+
+            remaining = remaining[len(attempted):]
+            if remaining:
+                with self._lock:
+                    self._failovers += 1
+                logger.warning(f"LLM call to {', '.join(p.name for p in attempted)} failed ({error}), "
+                               f"failing over to {remaining[0].name}")
+        raise error
+
+    def _hedged_call(self, pair, messages, temperature, timeout, max_retries, response_schema):
+        """
+        Call pair[0]; if it is still running after its hedge delay, also call
+        pair[1]. Returns (providers attempted, result, error).
+        """
+        primary, backup = pair
+        futures = {self._executor.submit(self._call, primary, messages, temperature, timeout, max_retries, response_schema): primary}
+        done, _ = wait(futures, timeout=self.hedge_delay(primary.name))
+
+        if not done:
+            with self._lock:
+                self._hedged += 1
+            logger.info(f"Hedging LLM call: {primary.name} slower than p95, also asking {backup.name}")
+            futures[self._executor.submit(self._call, backup, messages, temperature, timeout, max_retries, response_schema)] = backup
+
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if futures[future] is backup:
+                        with self._lock:
+                            self._hedge_wins += 1
+                    return list(futures.values()), future.result(), None
+                error = future.exception()
+        return list(futures.values()), None, error
+
+    async def _acall(self, provider, messages, temperature, timeout, max_retries, response_schema=None):
+        start = time.monotonic()
+        try:
+            result = await provider.acomplete(
+                messages, model=self.models.get(provider.name), temperature=temperature,
+                timeout=timeout, max_retries=max_retries, response_schema=response_schema
+            )
+        except CircuitOpenError:
+            raise
+        except Exception:
+            self.record(provider.name, None, ok=False)
+            raise
+        self.record(provider.name, time.monotonic() - start, ok=True)
+        return result
+
+    async def acomplete(self, messages, temperature=0.3, timeout=30, max_retries=None, response_schema=None):
+        """Awaitable complete(): same ranking, failover and hedging, without blocking a thread"""
+        remaining = self.ranked()
+        error = None
+
+        while remaining:
+            if self.hedge and len(remaining) > 1:
+                attempted, result, error = await self._ahedged_call(remaining[:2], messages, temperature, timeout, max_retries, response_schema)
+            else:
+                attempted = remaining[:1]
+                try:
+                    result, error = await self._acall(remaining[0], messages, temperature, timeout, max_retries, response_schema), None
+                except Exception as e:
+                    result, error = None, e
+            if error is None:
+                return result
+
+            remaining = remaining[len(attempted):]
+            if remaining:
+                with self._lock:
+                    self._failovers += 1
+                logger.warning(f"LLM call to {', '.join(p.name for p in attempted)} failed ({error}), "
+                               f"failing over to {remaining[0].name}")
+        raise error
+
+    async def _ahedged_call(self, pair, messages, temperature, timeout, max_retries, response_schema):
+        """_hedged_call() with tasks instead of threads"""
+        primary, backup = pair
+        tasks = {asyncio.ensure_future(self._acall(primary, messages, temperature, timeout, max_retries, response_schema)): primary}
+        done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(primary.name))
+
+        if not done:
+            with self._lock:
+                self._hedged += 1
+            logger.info(f"Hedging LLM call: {primary.name} slower than p95, also asking {backup.name}")
+            tasks[asyncio.ensure_future(self._acall(backup, messages, temperature, timeout, max_retries, response_schema))] = backup
+
+        error = None
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if tasks[task] is backup:
+                        with self._lock:
+                            self._hedge_wins += 1
+                    # Let the loser finish so its latency is still recorded
+                    for loser in pending:
+                        self._background.add(loser)
+                        loser.add_done_callback(self._discard_background)
+                    return list(tasks.values()), task.result(), None
+                error = task.exception()
+        return list(tasks.values()), None, error
+
+    def _discard_background(self, task):
+        self._background.discard(task)
+        if not task.cancelled():
+            task.exception()
+
+    def stream(self, messages, temperature=0.3, timeout=30, max_retries=None):
+        """
+        Stream from the best provider. Not hedged; fails over only if a
+        provider errors before sending its first chunk.
+        """
+        ranked = self.ranked()
+        for index, provider in enumerate(ranked):
+            start = time.monotonic()
+            started = False
+            try:
+                for delta in provider.stream(
+                    messages, model=self.models.get(provider.name), temperature=temperature,
+                    timeout=timeout, max_retries=max_retries
+                ):
+                    started = True
+                    yield delta
+            except Exception as e:
+                if not isinstance(e, CircuitOpenError):
+                    self.record(provider.name, None, ok=False)
+                if started or index == len(ranked) - 1:
+                    raise
+                with self._lock:
+                    self._failovers += 1
+                logger.warning(f"LLM stream from {provider.name} failed ({e}), failing over to {ranked[index + 1].name}")
+                continue
+            self.record(provider.name, time.monotonic() - start, ok=True)
+            return
+
+    def stats(self):
+        with self._lock:
+            providers = {
+                provider.name: {
+                    'ewma_latency_ms': round(health.ewma_latency * 1000, 1) if health.ewma_latency is not None else None,
+                    'p95_ms': round(health.percentile(0.95) * 1000, 1) if health.latencies else None,
+                    'error_rate': round(self.error_rate(provider.name), 4),
+                    'samples': health.samples,
+                    'healthy': self.is_healthy(provider),
+                }
+                for provider in self.providers
+                for health in [self._health[provider.name]]
+            }
+            counters = {'failovers': self._failovers, 'hedged': self._hedged, 'hedge_wins': self._hedge_wins}
+        return {
+            'order': [provider.name for provider in self.ranked()],
+            'hedge': self.hedge,
+            'providers': providers,
+            **counters,
+        }
+
+
+def router_from_env():
+    """Build the router from LLM_PROVIDERS / LLM_MODELS / LLM_HEDGE using the shared provider clients"""
+    names = [name.strip() for name in os.getenv('LLM_PROVIDERS', 'openai').split(',') if name.strip()]
+    models = {}
+    for item in os.getenv('LLM_MODELS', '').split(','):
+        if '=' in item:
+            name, model = item.split('=', 1)
+            models[name.strip()] = model.strip()
+    return LLMRouter(
+        [get_provider(name) for name in names],
+        models=models,
+        hedge=os.getenv('LLM_HEDGE', '0') == '1'
+    )
@@ -0,0 +1,147 @@
+"""
+Circuit breakers and adaptive timeouts for upstream calls
+
+CircuitBreaker stops calling an upstream after `failure_threshold` consecutive
+failures: for `cooldown` seconds calls are rejected immediately with
+CircuitOpenError (so callers go straight to their fallback), then one probe
+call is let through (half-open). A successful probe closes the circuit; a
+failed one re-opens it for another cooldown.
+
+AdaptiveTimeout replaces fixed timeouts with one derived from observed
+latencies: a multiple of a high percentile, never above the old constant.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name, failure_threshold=5, cooldown=30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._trips = 0
+        self._rejected = 0
+
+    def before_call(self):
+        """Admit a call or raise CircuitOpenError. In half-open state only one probe is admitted."""
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.cooldown - (self._clock() - self._opened_at)
+                if remaining > 0:
+                    self._rejected += 1
+                    raise CircuitOpenError(f'{self.name} circuit open; next probe in {remaining:.1f}s')
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+                logger.info(f"{self.name} circuit half-open, probing")
+
+            if self.state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self._rejected += 1
+                    raise CircuitOpenError(f'{self.name} circuit half-open; probe in flight')
+                self._probe_in_flight = True
+
+    def record(self, ok):
+        """Report the outcome of an admitted call"""
+        with self._lock:
+            if ok:
+                if self.state != self.CLOSED:
+                    logger.info(f"{self.name} circuit closed")
+                self.state = self.CLOSED
+                self._failures = 0
+                self._probe_in_flight = False
+                return
+
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self._trips += 1
+                    logger.warning(f"{self.name} circuit open for {self.cooldown:.0f}s after {self._failures} failure(s)")
+                self.state = self.OPEN
+                self._opened_at = self._clock()
+                self._probe_in_flight = False
+
+    def available(self):
+        """Whether a call now would be admitted (without admitting it)"""
+        with self._lock:
+            if self.state == self.OPEN:
+                return self._clock() - self._opened_at >= self.cooldown
+            if self.state == self.HALF_OPEN:
+                return not self._probe_in_flight
+            return True
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'consecutive_failures': self._failures,
+            'trips': self._trips,
+            'rejected': self._rejected,
+        }
+
+
+class AdaptiveTimeout:
+    """
+    Timeout of `multiplier` x the `quantile` latency of recent successful
+    calls, clamped to [floor, ceiling]. Until `min_samples` latencies are
+    known the ceiling (the old fixed timeout) is used.
+    """
+
+    def __init__(self, ceiling, floor=1.0, quantile=0.99, multiplier=1.5, min_samples=20, window=200):
+        self.ceiling = ceiling
+        self.floor = floor
+        self.quantile = quantile
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+
+    def observe(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def current(self):
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return self.ceiling
+            ordered = sorted(self._latencies)
+        percentile = ordered[int(self.quantile * (len(ordered) - 1))]
+        return min(self.ceiling, max(self.floor, percentile * self.multiplier))
+
+    @contextmanager
+    def measure(self):
+        """
+        Yield the timeout to use and record how long the call took. A call that
+        failed by running out of time is recorded at its elapsed time, so a
+        too-tight timeout loosens again instead of feeding on itself.
+        """
+        timeout = self.current()
+        start = time.monotonic()
+        try:
+            yield timeout
+        except Exception:
+            elapsed = time.monotonic() - start
+            if elapsed >= 0.9 * timeout:
+                self.observe(elapsed)
+            raise
+        self.observe(time.monotonic() - start)
+
+    def stats(self):
+        with self._lock:
+            samples = len(self._latencies)
+        return {'timeout': round(self.current(), 3), 'samples': samples, 'ceiling': self.ceiling}
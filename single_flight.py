@@ -0,0 +1,171 @@
+"""
+Single-flight coalescing of identical in-flight calls
+
+When a user double-clicks or several tabs submit the same trip, identical LLM
+calls run in parallel. SingleFlight lets the first caller for a key (the
+leader) make the upstream call while concurrent callers with the same key wait
+for it and share its result or exception. Streams are shared too: followers
+replay every chunk the leader has received so far, then follow it live.
+AsyncSingleFlight does the same for coroutines on one event loop.
+"""
+import asyncio
+import threading
+
+
+class _Call:
+    __slots__ = ('cond', 'items', 'result', 'error', 'done', 'waiters')
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.items = []
+        self.result = None
+        self.error = None
+        self.done = False
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls by key. Nothing is cached: once the leader
+    finishes, the next call for the key starts a new flight.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._leaders = 0
+        self._coalesced = 0
+        self._max_waiters = 0
+
+    def _join(self, key):
+        """The in-flight call for key and whether the caller leads it"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self._leaders += 1
+                return call, True
+            call.waiters += 1
+            self._coalesced += 1
+            self._max_waiters = max(self._max_waiters, call.waiters)
+            return call, False
+
+    def _finish(self, key, call):
+        with self._lock:
+            del self._calls[key]
+        with call.cond:
+            call.done = True
+            call.cond.notify_all()
+
+    def do(self, key, fn):
+        """Return fn(), running it at most once at a time per key"""
+        call, leader = self._join(key)
+        if not leader:
+            with call.cond:
+                call.cond.wait_for(lambda: call.done)
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+        return call.result
+
+    def stream(self, key, fn):
+        """Iterate fn() (an iterable factory), sharing one upstream iteration per key"""
+        call, leader = self._join(key)
+        if not leader:
+            yield from self._follow(call)
+            return
+
+        try:
+            for item in fn():
+                with call.cond:
+                    call.items.append(item)
+                    call.cond.notify_all()
+                yield item
+        except GeneratorExit:
+            # Our consumer went away mid-stream; followers must not mistake that for the end
+            call.error = RuntimeError('Shared stream was abandoned before it finished')
+            raise
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+
+    def _follow(self, call):
+        position = 0
+        while True:
+            with call.cond:
+                call.cond.wait_for(lambda: position < len(call.items) or call.done)
+                if position < len(call.items):
+                    item = call.items[position]
+                    position += 1
+                elif call.error is not None:
+                    raise call.error
+                else:
+                    return
+            yield item
+
+    def stats(self):
+        with self._lock:
+            in_flight = {key[:12]: call.waiters for key, call in self._calls.items()}
+        return {
+            'in_flight': in_flight,
+            'leaders': self._leaders,
+            'coalesced': self._coalesced,
+            'max_waiters': self._max_waiters,
+        }
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines: followers await the leader's future"""
+
+    def __init__(self):
+        self._calls = {}
+        self._leaders = 0
+        self._coalesced = 0
+        self._max_waiters = 0
+
+    async def do(self, key, fn):
+        """Return await fn(), running it at most once at a time per key"""
+        entry = self._calls.get(key)
+        if entry is not None:
+            future, waiters = entry
+            self._calls[key] = (future, waiters + 1)
+            self._coalesced += 1
+            self._max_waiters = max(self._max_waiters, waiters + 1)
+            # shield: a follower giving up must not cancel the leader's call
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = (future, 0)
+        self._leaders += 1
+        try:
+            result = await fn()
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                e = RuntimeError('Shared call was cancelled before it finished')
+            future.set_exception(e)
+            # Mark retrieved so an unawaited failure does not log a warning
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+    def stats(self):
+        return {
+            'in_flight': {key[:12]: waiters for key, (_, waiters) in self._calls.items()},
+            'leaders': self._leaders,
+            'coalesced': self._coalesced,
+            'max_waiters': self._max_waiters,
+        }
@@ -0,0 +1,127 @@
+"""
+Test idempotent Checkout Session creation against the offline Stripe stand-in
+Runs offline - no API server or Stripe account needed
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+
+from checkout_cache import CheckoutSessionCache
+from fake_stripe import FakeStripe, IdempotencyError
+
+results = []
+
+
+def check(name, passed, detail):
+    results.append(passed)
+    print(f"{'✅ PASS' if passed else '❌ FAIL'}  {name}")
+    print(f"         {detail}")
+
+
+def creator(stripe, execution_id):
+    def create(idempotency_key, expires_at):
+        return stripe.checkout.Session.create(
+            idempotency_key=idempotency_key,
+            expires_at=expires_at,
+            line_items=[{'price_data': {'currency': 'inr', 'unit_amount': 540000}, 'quantity': 1}],
+            mode='payment',
+            success_url=f'http://localhost:5001/payment/success?session_id={{CHECKOUT_SESSION_ID}}&execution_id={execution_id}',
+        )
+    return create
+
+
+print("\n" + "="*80)
+print("💳 TESTING CHECKOUT SESSION CACHE")
+print("="*80 + "\n")
+
+workdir = tempfile.mkdtemp()
+db_path = os.path.join(workdir, 'checkout_sessions.db')
+stripe = FakeStripe(latency=0.05)
+sessions = stripe.checkout.Session
+
+# 1. Repeat visits reuse the first session without calling Stripe again
+cache = CheckoutSessionCache(db_path)
+first = cache.get_or_create('intent_1', creator(stripe, 'intent_1'))
+start = time.monotonic()
+repeats = [cache.get_or_create('intent_1', creator(stripe, 'intent_1')) for _ in range(5)]
+elapsed = time.monotonic() - start
+check(
+    "Refreshes redirect to the cached session",
+    all(r == first for r in repeats) and sessions.calls == 1 and elapsed < 0.05,
+    f"{sessions.calls} Stripe call(s), 5 repeats in {elapsed * 1000:.1f}ms"
+)
+
+# 2. A double-click (concurrent first visits) creates one session
+got = []
+threads = [threading.Thread(target=lambda: got.append(cache.get_or_create('intent_2', creator(stripe, 'intent_2')))) for _ in range(8)]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+check(
+    "Concurrent first visits share one session",
+    len(set(got)) == 1 and sessions.calls == 2,
+    f"{len(set(got))} distinct session(s), {sessions.calls} Stripe calls in total"
+)
+
+# 3. A restart reloads sessions from SQLite
+reopened = CheckoutSessionCache(db_path)
+check(
+    "Sessions survive a restart",
+    reopened.get('intent_1') == first and sessions.calls == 2,
+    f"entries after reopen: {reopened.stats()['entries']}"
+)
+
+# 4. Losing the local record (crash before the write) replays the same session via the idempotency key
+lost = CheckoutSessionCache(os.path.join(workdir, 'lost.db'))
+replayed = lost.get_or_create('intent_1', creator(stripe, 'intent_1'))
+check(
+    "Idempotency key returns the same session after a lost write",
+    replayed == first,
+    f"key={lost.idempotency_key('intent_1')[:24]}..."
+)
+
+# 5. Key and expiry come from one window: a retry late in the window replays
+#    identical parameters and gets a session with at least a full window to live
+window_start = cache.window() * cache.ttl
+late = window_start + cache.ttl - 1
+check(
+    "Retries in a window send the same key and expiry",
+    cache.idempotency_key('intent_4', window_start) == cache.idempotency_key('intent_4', late)
+    and cache.expires_at(window_start) == cache.expires_at(late)
+    and cache.expires_at(late) - late > cache.ttl
+    and cache.idempotency_key('intent_4', late) != cache.idempotency_key('intent_4', late + 1),
+    f"expires_at={cache.expires_at(late)}, {cache.expires_at(late) - late:.0f}s left at the end of the window"
+)
+
+# 6. Stripe rejects a key reused with different parameters
+try:
+    sessions.create(idempotency_key=lost.idempotency_key('intent_1'), expires_at=lost.expires_at() + 1,
+                    mode='payment', success_url='http://localhost:5001/payment/success')
+    rejected = False
+except IdempotencyError:
+    rejected = True
+check(
+    "Reusing a key with different parameters is rejected",
+    rejected,
+    "IdempotencyError raised" if rejected else "no error raised"
+)
+
+# 7. An expired session is replaced by a new one
+short = CheckoutSessionCache(os.path.join(workdir, 'short.db'), ttl=1, margin=0)
+old = short.get_or_create('intent_3', creator(stripe, 'intent_3'))
+time.sleep(2.1)
+new = short.get_or_create('intent_3', creator(stripe, 'intent_3'))
+check(
+    "Expired sessions are recreated",
+    old != new,
+    f"{old[0][:20]}... -> {new[0][:20]}..."
+)
+
+print(f"\n{'='*80}")
+print(f"📊 {sum(results)}/{len(results)} checkout cache checks passed")
+print(f"{'='*80}\n")
@@ -0,0 +1,122 @@
+"""
+Test latency-aware LLM routing, failover and hedging with local stub providers
+Runs offline - no API server or API keys needed
+"""
+import asyncio
+import time
+
+from llm_provider import StubProvider
+from llm_router import LLMRouter
+
+MESSAGES = [{"role": "user", "content": "book flight from mumbai to delhi"}]
+
+results = []
+
+
+def check(name, passed, detail):
+    results.append(passed)
+    print(f"{'✅ PASS' if passed else '❌ FAIL'}  {name}")
+    print(f"         {detail}")
+
+
+print("\n" + "="*80)
+print("🔀 TESTING LLM ROUTER")
+print("="*80 + "\n")
+
+# 1. Routes to the fastest provider once both have been measured
+fast = StubProvider('fast', latency=0.02)
+slow = StubProvider('slow', latency=0.15)
+router = LLMRouter([slow, fast])
+for _ in range(6):
+    router.complete(MESSAGES)
+answers = [router.complete(MESSAGES) for _ in range(5)]
+check(
+    "Picks the fastest healthy provider",
+    all(a.startswith('[fast]') for a in answers),
+    f"order={router.stats()['order']}"
+)
+
+# 2. Fails over when the preferred provider errors, and demotes it
+flaky = StubProvider('flaky', latency=0.01, error_rate=1.0)
+steady = StubProvider('steady', latency=0.05)
+router = LLMRouter([flaky, steady])
+answers = [router.complete(MESSAGES) for _ in range(6)]
+stats = router.stats()
+check(
+    "Fails over from an erroring provider",
+    all(a.startswith('[steady]') for a in answers) and not stats['providers']['flaky']['healthy'],
+    f"failovers={stats['failovers']}, flaky error_rate={stats['providers']['flaky']['error_rate']}"
+)
+
+# 2b. A demoted provider is tried again once its errors have decayed
+recovered = StubProvider('recovered', latency=0.01)
+steady = StubProvider('steady', latency=0.05)
+router = LLMRouter([recovered, steady], error_half_life=0.1)
+for _ in range(6):
+    router.record('recovered', None, ok=False)
+demoted = router.ranked()[0].name
+time.sleep(0.4)
+answer = router.complete(MESSAGES)
+check(
+    "Error rate decays so a recovered provider gets traffic back",
+    demoted == 'steady' and answer.startswith('[recovered]'),
+    f"ranked first while erroring: {demoted}, error_rate after 0.4s={router.stats()['providers']['recovered']['error_rate']}"
+)
+
+# 3. Hedges a request when the primary is slower than its p95
+spike = {'on': False}
+spiky = StubProvider('spiky', latency=lambda: 1.0 if spike['on'] else 0.02)
+backup = StubProvider('backup', latency=0.05)
+router = LLMRouter([spiky, backup], hedge=True)
+for _ in range(10):
+    router.record('spiky', 0.02, ok=True)
+    router.record('backup', 0.08, ok=True)
+spike['on'] = True
+start = time.monotonic()
+answer = router.complete(MESSAGES)
+elapsed = time.monotonic() - start
+stats = router.stats()
+check(
+    "Hedged request beats a latency spike",
+    answer.startswith('[backup]') and elapsed < 0.6 and stats['hedge_wins'] == 1,
+    f"answered by {answer.split(']')[0][1:]} in {elapsed * 1000:.0f}ms, hedged={stats['hedged']}"
+)
+
+# 4. Streams fail over before the first chunk
+router = LLMRouter([StubProvider('down', error_rate=1.0), StubProvider('up')])
+text = ''.join(router.stream(MESSAGES))
+check(
+    "Stream fails over before first chunk",
+    text.startswith('[up]'),
+    f"received {len(text)} chars"
+)
+
+# 5. The async path (ASGI server) fails over and hedges the same way
+async def async_checks():
+    flaky = StubProvider('aflaky', error_rate=1.0)
+    steady = StubProvider('asteady', latency=0.01)
+    router = LLMRouter([flaky, steady])
+    failover = await router.acomplete(MESSAGES)
+
+    spike = {'on': False}
+    spiky = StubProvider('aspiky', latency=lambda: 1.0 if spike['on'] else 0.02)
+    backup = StubProvider('abackup', latency=0.05)
+    hedged = LLMRouter([spiky, backup], hedge=True)
+    for _ in range(10):
+        hedged.record('aspiky', 0.02, ok=True)
+        hedged.record('abackup', 0.08, ok=True)
+    spike['on'] = True
+    start = time.monotonic()
+    answer = await hedged.acomplete(MESSAGES)
+    return failover, answer, time.monotonic() - start
+
+failover, answer, elapsed = asyncio.run(async_checks())
+check(
+    "Async calls fail over and hedge",
+    failover.startswith('[asteady]') and answer.startswith('[abackup]') and elapsed < 0.6,
+    f"hedged answer from {answer.split(']')[0][1:]} in {elapsed * 1000:.0f}ms"
+)
+
+print(f"\n{'='*80}")
+print(f"📊 {sum(results)}/{len(results)} router checks passed")
+print(f"{'='*80}\n")
@@ -0,0 +1,72 @@
+"""
+Test batch policy evaluation against the compiled policy_travel.yaml rules
+Run this after starting the API server
+"""
+import requests
+from datetime import date, timedelta
+
+BASE_URL = "http://localhost:5001"
+
+in_30_days = (date.today() + timedelta(days=30)).isoformat()
+tomorrow = (date.today() + timedelta(days=1)).isoformat()
+
+test_cases = [
+    {
+        "name": "Domestic economy flight within limits",
+        "payload": {"action": "BOOK_FLIGHT", "destination": "Mumbai", "price": "4500", "date": in_30_days},
+        "expected": "ALLOW"
+    },
+    {
+        "name": "Last-minute domestic flight",
+        "payload": {"action": "BOOK_FLIGHT", "destination": "Goa", "price": "4500", "date": tomorrow},
+        "expected": "REQUIRE_HUMAN_APPROVAL"
+    },
+    {
+        "name": "International flight in business class",
+        "payload": {"action": "BOOK_FLIGHT", "destination": "London", "price": "60000", "class": "business", "date": in_30_days},
+        "expected": "REQUIRE_HUMAN_APPROVAL"
+    },
+    {
+        "name": "Verified merchant payment",
+        "payload": {"action": "MAKE_PAYMENT", "recipient_type": "VERIFIED_MERCHANT", "amount": 20000},
+        "expected": "ALLOW"
+    },
+    {
+        "name": "Unverified payment over limit",
+        "payload": {"action": "MAKE_PAYMENT", "recipient_type": "UNVERIFIED", "amount": 6200},
+        "expected": "BLOCK_AND_LOG"
+    },
+    {
+        "name": "Blacklisted destination",
+        "payload": {"action": "BOOK_FLIGHT", "destination": "Restricted-Zone-A", "price": "4500", "date": in_30_days},
+        "expected": "BLOCK_AND_LOG"
+    },
+]
+
+if __name__ == "__main__":
+    print("\n" + "="*80)
+    print("🔍 TESTING BATCH POLICY EVALUATION")
+    print("="*80)
+
+    try:
+        response = requests.post(
+            f"{BASE_URL}/api/policy/evaluate-batch",
+            json={"tokens": [{"payload": t["payload"]} for t in test_cases]},
+            timeout=10
+        )
+        data = response.json()
+        print(f"Response status: {response.status_code}")
+        print(f"Policy version: {data.get('policy_version')}")
+        print(f"Summary: {data.get('summary')}\n")
+
+        for test, decision in zip(test_cases, data['decisions']):
+            ok = decision['decision'] == test['expected']
+            print(f"{'✅' if ok else '❌'} {test['name']}: {decision['decision']} (rule: {decision['rule']})")
+            if not ok:
+                print(f"   Expected: {test['expected']}")
+
+    except requests.exceptions.ConnectionError:
+        print("ERROR: Cannot connect to API server")
+        print("Make sure the server is running: python api/server.py")
+    except Exception as e:
+        print(f"❌ ERROR: {str(e)}")
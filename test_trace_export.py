@@ -0,0 +1,134 @@
+"""
+Test the day-partitioned columnar export of stored traces
+Runs offline - no API server needed (requires pyarrow)
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+import trace_export
+from trace_codec import read_archive
+from trace_store import JSONCodec, TraceStore
+
+results = []
+
+
+def check(name, passed, detail):
+    results.append(passed)
+    print(f"{'✅ PASS' if passed else '❌ FAIL'}  {name}")
+    print(f"         {detail}")
+
+
+def make_trace(execution_id, timestamp, failures=()):
+    token = {
+        'type': 'INTENT_TOKEN',
+        'payload': {
+            'action': 'BOOK_FLIGHT', 'step_number': 1, 'description': 'Book flight',
+            'origin': 'Mumbai', 'destination': 'Delhi', 'price': '₹5,400',
+            'budget': {'low': 3000, 'high': 8000, 'currency': 'INR'},
+            'confidence': 0.9, 'data_complete': True,
+        }
+    }
+    outcome = {
+        'type': 'MCP_OUTCOME',
+        'payload': {
+            'status': 'BLOCKED' if failures else 'EXECUTED',
+            'failures': [{'action': 'BOOK_FLIGHT', 'category': category, 'reason': category, 'severity': 'BLOCK'}
+                         for category in failures]
+        }
+    }
+    return {
+        'execution_id': execution_id,
+        'timestamp': timestamp,
+        'policy_version': 'v1',
+        'intent_tokens': [token],
+        'stages': [token, outcome]
+    }
+
+
+def read_table(out_dir, name):
+    partitioning = ds.partitioning(pa.schema([('day', pa.string())]), flavor='hive')
+    return ds.dataset(os.path.join(out_dir, name), format='parquet', partitioning=partitioning).to_table()
+
+
+def partitions(out_dir, name):
+    path = os.path.join(out_dir, name)
+    return sorted(os.listdir(path)) if os.path.isdir(path) else []
+
+
+print("\n" + "="*80)
+print("📦 TESTING TRACE EXPORT")
+print("="*80 + "\n")
+
+workdir = tempfile.mkdtemp()
+store_dir = os.path.join(workdir, 'traces')
+out_dir = os.path.join(workdir, 'analytics')
+
+store = TraceStore(store_dir, codec=JSONCodec())
+store.append('exec_a', make_trace('exec_a', '2026-09-01T10:00:00Z'))
+store.append('exec_b', make_trace('exec_b', '2026-09-01T18:30:00Z', ['BUDGET_EXCEEDED']))
+store.append('exec_c', make_trace('exec_c', '2026-09-02T09:15:00Z', ['MISSING_DATA', 'BUDGET_EXCEEDED']))
+store.close()
+
+# 1. A small store round-trips into day partitions
+counts = trace_export.export((trace for _, trace in read_archive(store_dir, JSONCodec())), out_dir)
+tokens = read_table(out_dir, 'tokens')
+failures = read_table(out_dir, 'failures')
+check(
+    "Store exports into day partitions",
+    partitions(out_dir, 'tokens') == ['day=2026-09-01', 'day=2026-09-02']
+    and partitions(out_dir, 'failures') == ['day=2026-09-01', 'day=2026-09-02']
+    and counts == {'traces': 3, 'tokens': 3, 'failures': 3, 'days': 2},
+    f"counts={counts}"
+)
+
+# 2. Rows read back with their columns and day
+by_day = {day: failures.filter(pc.equal(failures['day'], day)).num_rows for day in ('2026-09-01', '2026-09-02')}
+check(
+    "Rows read back per day",
+    tokens.num_rows == 3 and by_day == {'2026-09-01': 1, '2026-09-02': 2}
+    and set(tokens['destination'].to_pylist()) == {'Delhi'} and set(failures['budget'].to_pylist()) == {8000.0},
+    f"tokens={tokens.num_rows}, failures per day={by_day}"
+)
+
+# 3. Re-exporting a day that no longer has failures drops its stale failure partition
+trace_export.export([make_trace('exec_c', '2026-09-02T09:15:00Z')], out_dir)
+check(
+    "Re-export removes stale failure partitions",
+    partitions(out_dir, 'failures') == ['day=2026-09-01']
+    and read_table(out_dir, 'tokens').num_rows == 3,
+    f"failures partitions={partitions(out_dir, 'failures')}"
+)
+
+# 4. Days outside --since/--until are left alone
+trace_export.export((trace for _, trace in read_archive(store_dir, JSONCodec())), out_dir, since='2026-09-02')
+check(
+    "Bounded export only rewrites its days",
+    partitions(out_dir, 'failures') == ['day=2026-09-01', 'day=2026-09-02']
+    and read_table(out_dir, 'failures').num_rows == 3,
+    f"failures partitions={partitions(out_dir, 'failures')}"
+)
+
+# 5. Days larger than one batch are written in several batches
+trace_export.BATCH_ROWS = 2
+big_dir = os.path.join(workdir, 'batched')
+many = [make_trace(f'exec_{i}', f'2026-09-03T{i:02d}:00:00Z', ['BUDGET_EXCEEDED']) for i in range(5)]
+counts = trace_export.export(many, big_dir)
+check(
+    "Batched writes keep every row",
+    read_table(big_dir, 'tokens').num_rows == 5 and read_table(big_dir, 'failures').num_rows == 5,
+    f"counts={counts}"
+)
+
+shutil.rmtree(workdir)
+
+print(f"\n{'='*80}")
+print(f"📊 {sum(results)}/{len(results)} trace export checks passed")
+print(f"{'='*80}\n")